@@ -38,6 +38,14 @@ swagger = Swagger(app, template=template)
 core = BioNames(ServiceContext.create_context ())
 cache = LRU (1000)
 
+def non_negative(args, name, default=None):
+   """ A non-negative integer query parameter, or default if it is absent. """
+   value = args.get(name)
+   if value is None:
+      return default
+   assert re.fullmatch('[0-9]+', value), f"{name} must be a non-negative integer. Value provided : `{value}`"
+   return int(value)
+
 @app.route('/lookup/<q>/<concept>/')
 def lookup (q, concept):
    """ Find ids by various methods.
@@ -75,6 +83,25 @@ def lookup (q, concept):
          - http://schema.org/boolean
        x-requestTemplate:
          - valueType: http://schema.org/boolean
+
+     - name: max_edits
+       in: query
+       type: integer
+       default: 0
+       description: "Also match names with up to this many typos (insertions, deletions or substitutions) per word (at most 2), ranked after closer matches. Needs a BioNames name index; without one, a positive max_edits is rejected."
+       x-valueType:
+         - http://schema.org/Integer
+       x-requestTemplate:
+         - valueType: http://schema.org/Integer
+
+     - name: limit
+       in: query
+       type: integer
+       description: "The most results to return. All are returned if it is not given."
+       x-valueType:
+         - http://schema.org/Integer
+       x-requestTemplate:
+         - valueType: http://schema.org/Integer
    responses:
      200:
        description: ...
@@ -82,16 +109,22 @@ def lookup (q, concept):
    assert q, "A string must be entered as a query."
    assert concept, "A string must be entered as a query."
    include_similar = request.args.get('include_similar')
+   try:
+      max_edits = min(non_negative(request.args, 'max_edits', 0), 2)
+      limit = non_negative(request.args, 'limit')
+   except AssertionError as error:
+      return jsonify({"validation error": str(error)}), 400
+   if max_edits > 0 and core.name_index is None:
+      return jsonify({"validation error": "max_edits needs a name index; set name_index under bionames in greent.conf"}), 400
    q_key = f"{q}"
    concept_key = f"{concept}"
    include_similar_key = f"{include_similar}"
-   full_key = q_key + concept_key + include_similar_key
+   full_key = (q_key, concept_key, include_similar_key, max_edits, limit)
    if full_key in cache:
       result = cache[full_key]
    else:  
-      result = core.lookup_router(q_key, concept=concept_key)
-      if include_similar_key == 'false':
-        result = [x for x in result if x['label'] == q_key]
+      result = core.lookup_router(q_key, concept=concept_key, max_edits=max_edits, limit=limit,
+                                  include_similar=include_similar_key != 'false')
       cache[full_key] = result
    return jsonify(result)
 
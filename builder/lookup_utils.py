@@ -1,6 +1,12 @@
 import logging
-import requests
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
 from flask import jsonify
+from greent.cache import Cache
+from greent.httpsession import CircuitBreaker, CircuitOpen, create_session
+
+session = create_session()
 
 def lookup_phenotype_by_name( name, greent ):
     """Return type is a list of HPO identifiers."""
@@ -13,8 +19,8 @@ def lookup_phenotype_by_name( name, greent ):
         logger.debug('Found ids for phenotype name: {} {}.'.format(name,' '.join(hpo_ids)))
     return hpo_ids
 
-def pubchem_drug_name_to_chemical_identifier(drug_name_as_string):
-    pubchem_query = requests.get(f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{drug_name_as_string}/property/MolecularFormula/JSON").json()
+def pubchem_drug_name_to_chemical_identifier(drug_name_as_string, timeout=30):
+    pubchem_query = session.get(f"https://pubchem.ncbi.nlm.nih.gov/rest/pug/compound/name/{drug_name_as_string}/property/MolecularFormula/JSON", timeout=timeout).json()
     if 'Fault' in pubchem_query:
         empty_pubchem_query = []
         return empty_pubchem_query
@@ -24,9 +30,9 @@ def pubchem_drug_name_to_chemical_identifier(drug_name_as_string):
         pubchem_IDs_formatted = [ { "id" : i, "label" : drug_name_as_string } for i in pubchem_IDs_annotated ] if pubchem_IDs_annotated else []
         return pubchem_IDs_formatted
 
-def onto_drug_name_to_chemical_identifier(drug_name_as_string):
+def onto_drug_name_to_chemical_identifier(drug_name_as_string, timeout=30):
     query_text = f"https://onto.renci.org/search/{drug_name_as_string}?regex=false"
-    onto_response = requests.get(query_text).json()
+    onto_response = session.get(query_text, timeout=timeout).json()
     onto_IDs_annotated = []
     new_dict = {}
     for substance in onto_response['values']:
@@ -34,23 +40,91 @@ def onto_drug_name_to_chemical_identifier(drug_name_as_string):
         onto_IDs_annotated.append(substance)
     return onto_IDs_annotated
 
+def ctd_drug_name_to_chemical_identifier(drug_name_as_string, timeout=30):
+    CTD_query = session.get(f"http://ctdapi.renci.org/CTD_chemicals_ChemicalName/{drug_name_as_string}/", timeout=timeout).json()
+    return [ { "id" : x['ChemicalID'], "label" : x['ChemicalName'].lower() } for x in CTD_query if x['ChemicalName'].upper() == drug_name_as_string.upper()]
+
+def ctd_drug_synonym_to_chemical_identifier(drug_name_as_string, timeout=30):
+    CTD_synonym_query = session.get (f"https://ctdapi.renci.org/CTD_chemicals_Synonyms/{drug_name_as_string}/", timeout=timeout).json()
+    return [ { "id" : x['ChemicalID'], "label" : x.get('ChemicalName', drug_name_as_string).lower() } for x in CTD_synonym_query ]
+
 def ctd_drug_name_string_to_chemical_identifier(drug_name_as_string):  
-    CTD_query = requests.get(f"http://ctdapi.renci.org/CTD_chemicals_ChemicalName/{drug_name_as_string}/").json()
-    matches_from_CTD_query = [ { "id" : x['ChemicalID'], "label" : x['ChemicalName'].lower() } for x in CTD_query if x['ChemicalName'].upper() == drug_name_as_string.upper()]
+    matches_from_CTD_query = ctd_drug_name_to_chemical_identifier(drug_name_as_string)
     if not matches_from_CTD_query:
-        CTD_synonym_query = requests.get (f"https://ctdapi.renci.org/CTD_chemicals_Synonyms/{drug_name_as_string}/").json()
-        synonym_matches_from_CTD_query = [x['ChemicalID'] for x in CTD_synonym_query]
-        matches_from_CTD_query = matches_from_CTD_query + synonym_matches_from_CTD_query
+        matches_from_CTD_query = ctd_drug_synonym_to_chemical_identifier(drug_name_as_string)
     return matches_from_CTD_query
 
-def chemical_ids_from_drug_names( drug_name_as_string ):
+logger = logging.getLogger('application')
+
+class ChemicalResolver:
+    """ Resolves a drug name against every source at once. Each source has its own timeout and
+    circuit breaker, and its answers are cached per (source, name). Results are merged in source
+    order and de-duplicated by id. CTD synonyms are only used when CTD has no exact name match, but
+    are queried alongside it rather than after it. """
+
+    def __init__(self, timeouts={ 'onto' : 10, 'pubchem' : 10, 'ctd' : 10, 'ctd_synonyms' : 10 },
+                 ttl=24 * 60 * 60, failure_threshold=5, reset_timeout=60):
+        self.sources = {
+            'onto'         : onto_drug_name_to_chemical_identifier,
+            'pubchem'      : pubchem_drug_name_to_chemical_identifier,
+            'ctd'          : ctd_drug_name_to_chemical_identifier,
+            'ctd_synonyms' : ctd_drug_synonym_to_chemical_identifier
+        }
+        self.timeouts = timeouts
+        self.breakers = { name : CircuitBreaker(name, failure_threshold, reset_timeout) for name in self.sources }
+        self.cache = Cache(ttl=ttl)
+        self.executor = ThreadPoolExecutor(max_workers=16)
+
+    def resolve(self, drug_name_as_string, timeout=None):
+        """ Return the merged results, and the status of each source: ok, cached, error, timeout or open.
+        A timeout (seconds) shortens every source's own. """
+        timeouts = { name : min(self.timeouts[name], timeout or self.timeouts[name]) for name in self.sources }
+        responses = {}
+        status = {}
+        futures = {}
+        start = time.time()
+        for name, source in self.sources.items():
+            key = f"{name}:{drug_name_as_string}"
+            cached = self.cache.get(key)
+            if cached is not None:
+                responses[name] = cached
+                status[name] = 'cached'
+            else:
+                futures[name] = self.executor.submit(self.breakers[name].call, source, drug_name_as_string,
+                                                     timeouts[name])
+        for name, future in futures.items():
+            try:
+                responses[name] = future.result(timeout=max(0, start + timeouts[name] - time.time()))
+                self.cache.set(f"{name}:{drug_name_as_string}", responses[name])
+                status[name] = 'ok'
+            except FutureTimeout:
+                self.breakers[name].failed()
+                status[name] = 'timeout'
+            except CircuitOpen:
+                status[name] = 'open'
+            except Exception as e:
+                logger.warning(f"{name} failed for {drug_name_as_string}: {e}")
+                status[name] = 'error'
+        ctd = responses.get('ctd', [])
+        if not ctd:
+            ctd = responses.get('ctd_synonyms', [])
+        result = []
+        seen = set()
+        for item in responses.get('onto', []) + responses.get('pubchem', []) + ctd:
+            identifier = item['id'] if isinstance(item, dict) else item
+            if identifier not in seen:
+                seen.add(identifier)
+                result.append(item)
+        return result, status
+
+resolver = ChemicalResolver()
+
+def chemical_ids_from_drug_names( drug_name_as_string, timeout=None ):
     """Look up drugs by name.  We will pull results from multiple sources in this case,
     and return them all."""
     logger=logging.getLogger('application')
-    ctd_ids = ctd_drug_name_string_to_chemical_identifier(drug_name_as_string)
-    pubchem_ids = pubchem_drug_name_to_chemical_identifier (drug_name_as_string)
-    onto_ids = onto_drug_name_to_chemical_identifier(drug_name_as_string)
-    chemical_ids_from_drug_names =  onto_ids + pubchem_ids + ctd_ids
+    chemical_ids_from_drug_names, status = resolver.resolve(drug_name_as_string, timeout)
+    logger.debug(f"chemical sources for {drug_name_as_string}: {status}")
     return chemical_ids_from_drug_names
 
 def lookup_identifier( name, name_type, greent ):
@@ -0,0 +1,219 @@
+# usage: gunicorn onto_async:app --worker-class aiohttp.GunicornWebWorker --workers 1 --pythonpath=$PWD/greent/api
+import argparse
+import json
+from aiohttp import web
+from greent.services.async_ontology import AsyncOntology
+from greent.util import Curie_Resolver
+from onto_gunicorn import Core, batch_curies, batch_conversion, curie_normalize, synonym_rows, page_params, wants_ndjson, windows, \
+    encode_cursor, property_count
+
+""" The onto routes served from an asyncio event loop. Responses match onto_gunicorn's; Swagger docs are served by onto_gunicorn only. """
+
+routes = web.RouteTableDef()
+
+def validation_error(curie, error):
+    return web.json_response({"validation error": f"{error}. Curie provided : `{curie}`"}, status=400)
+
+def get_ontology_service (request):
+    return request.app['ontology']
+
+def curie_route(path, operation, shape=lambda curie, value: value):
+    """ Register a GET route that normalizes its curie and awaits one ontology operation. """
+    async def handler(request):
+        curie = request.match_info['curie']
+        try:
+            normalized_curie = curie_normalize(curie)
+        except AssertionError as error:
+            return validation_error(curie, error)
+        value = await get_ontology_service(request).run(operation, normalized_curie)
+        return web.json_response(shape(curie, value))
+    routes.get(path)(handler)
+
+async def paged_response(request, operation, args, shape=lambda values: values, count=len):
+    """ Answer with one JSON page of an operation's results, or stream them all as NDJSON, like onto_gunicorn. """
+    try:
+        limit, offset = page_params(request.query)
+    except AssertionError as error:
+        return web.json_response({"validation error": str(error)}, status=400)
+    ontology = get_ontology_service(request)
+    if wants_ndjson(request.query, request.headers.get('Accept')):
+        response = web.StreamResponse(headers={ 'Content-Type' : 'application/x-ndjson' })
+        await response.prepare(request)
+        for size, start in windows(limit, offset):
+            values = await ontology.run(operation, *args, size, start)
+            if count(values) == 0:
+                break
+            await response.write(''.join(json.dumps(value) + '\n' for value in values).encode('utf-8'))
+        await response.write_eof()
+        return response
+    values = await ontology.run(operation, *args, limit, offset)
+    headers = {}
+    if limit is not None and count(values) > 0:
+        headers['X-Next-Cursor'] = encode_cursor(offset + limit)
+    return web.json_response(shape(values), headers=headers)
+
+def paged_curie_route(path, operation, shape=lambda values: values, count=len):
+    """ Register a GET route that normalizes its curie and answers with paged_response. """
+    async def handler(request):
+        curie = request.match_info['curie']
+        try:
+            normalized_curie = curie_normalize(curie)
+        except AssertionError as error:
+            return validation_error(curie, error)
+        return await paged_response(request, operation, [ normalized_curie ], shape, count)
+    routes.get(path)(handler)
+
+curie_route('/label/{curie}', 'label', lambda curie, label: { 'id': curie, 'label': label })
+curie_route('/xrefs/{curie}', 'xrefs', lambda curie, xrefs: { "xrefs": [ x.split(' ')[0] if ' ' in x else x for x in xrefs ] })
+curie_route('/synonyms/{curie}', 'synonyms', lambda curie, syns: synonym_rows(syns))
+curie_route('/exactMatch/{curie}', 'exactMatch', lambda curie, matches: { 'exact matches': matches })
+curie_route('/closeMatch/{curie}', 'closeMatch', lambda curie, matches: { 'close matches': matches })
+curie_route('/subterms/{curie}', 'descendants', lambda curie, terms: { "subterms": terms })
+curie_route('/superterms/{curie}', 'ancestors', lambda curie, terms: { "superterms": terms })
+curie_route('/siblings/{curie}', 'siblings', lambda curie, siblings: { "siblings": siblings })
+curie_route('/parents/{curie}', 'parents', lambda curie, parents: { "parents": parents })
+paged_curie_route('/all_properties/{curie}', 'all_properties', lambda properties: { "all_properties": properties },
+                  count=property_count)
+paged_curie_route('/descendants/{curie}', 'descendants')
+curie_route('/ancestors/{curie}', 'ancestors')
+curie_route('/children/{curie}', 'children')
+
+async def request_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+def batch_route(path, operation, shape=lambda value: value, normalize=True):
+    """ Register a POST route answering a list of curies with one *_many operation. """
+    async def handler(request):
+        try:
+            curies = batch_curies(await request_json(request), normalize)
+            results = await get_ontology_service(request).run(operation, list(dict.fromkeys(curies.values())))
+        except AssertionError as error:
+            return web.json_response({"validation error": str(error)}, status=400)
+        return web.json_response({ curie : shape(results[normalized]) for curie, normalized in curies.items() if normalized in results })
+    routes.post(path)(handler)
+
+batch_route('/label', 'label_many')
+batch_route('/xrefs', 'xrefs_many', lambda xrefs: [ x.split(' ')[0] if ' ' in x else x for x in xrefs ])
+batch_route('/synonyms', 'synonyms_many', synonym_rows)
+batch_route('/lookup', 'lookup_many', normalize=False)
+batch_route('/parents', 'parents_many')
+batch_route('/children', 'children_many')
+batch_route('/ancestors', 'ancestors_many')
+batch_route('/descendants', 'descendants_many')
+
+@routes.post('/is_a')
+async def is_a_batch(request):
+    body = await request_json(request)
+    pairs = body.get('pairs') if isinstance(body, dict) else None
+    if not isinstance(pairs, list) or len(pairs) == 0:
+        return web.json_response({
+            "error": "Request body must be a JSON object with a non-empty list of 'pairs'"
+        }, status=400)
+    for pair in pairs:
+        if not isinstance(pair, dict) or not pair.get('id') or not isinstance(pair.get('ancestors'), (str, list)):
+            return web.json_response({
+                "error": f"Each pair must have an id and one or more ancestors. Pair provided : `{pair}`"
+            }, status=400)
+    return web.json_response(await get_ontology_service(request).run(
+        'is_a_many', [ (pair['id'], pair['ancestors']) for pair in pairs ]))
+
+@routes.get('/id_list/{curie}')
+async def id_list(request):
+    return await paged_response(request, 'id_list', [ request.match_info['curie'] ])
+
+@routes.get('/is_a/{curie}/{ancestors}')
+async def is_a(request):
+    curie = request.match_info['curie']
+    is_a, ancestors = await get_ontology_service(request).run('is_a', curie, request.match_info['ancestors'])
+    return web.json_response({
+        "is_a"      : is_a,
+        "id"        : curie,
+        "ancestors" : ancestors
+    })
+
+@routes.get('/search/{pattern}')
+async def search(request):
+    regex = request.query.get('regex') == 'true'
+    if request.query.get('words') == 'true':
+        try:
+            values = await get_ontology_service(request).run('search_words', request.match_info['pattern'])
+        except ValueError as e:
+            return web.json_response({ "error" : str(e) }, status=400)
+        return web.json_response({ "values" : values })
+    return await paged_response(request, 'search', [ request.match_info['pattern'], regex, True ],
+                                lambda values: { "values" : values })
+
+@routes.get('/lookup/{curie}')
+async def lookup(request):
+    try:
+        refs = await get_ontology_service(request).run('lookup', request.match_info['curie'])
+    except AssertionError as error:
+        return web.json_response({"validation error": f"{error}"}, status=400)
+    return web.json_response({ "refs" : refs })
+
+@routes.get('/property_value/{curie}/{property_key:.+}')
+async def property_value(request):
+    curie = request.match_info['curie']
+    try:
+        normalized_curie = curie_normalize(curie)
+    except AssertionError as error:
+        return validation_error(curie, error)
+    value = await get_ontology_service(request).run('property_value', normalized_curie, request.match_info['property_key'])
+    return web.json_response({ "property_value" : value })
+
+@routes.get('/uri/{curie}')
+async def uri_from_curie(request):
+    curie = request.match_info['curie']
+    try:
+        normalized_curie = curie_normalize(curie)
+    except AssertionError as error:
+        return validation_error(curie, error)
+    return web.json_response({ 'uri': Curie_Resolver.curie_to_uri(normalized_curie) })
+
+def conversion_route(path, key):
+    """ Register a POST route converting a list of curies or uris in one pass. """
+    async def handler(request):
+        try:
+            return web.json_response(batch_conversion(await request_json(request), key))
+        except AssertionError as error:
+            return web.json_response({"validation error": str(error)}, status=400)
+    routes.post(path)(handler)
+
+conversion_route('/curie_to_uri', 'curies')
+conversion_route('/uri_to_curie', 'uris')
+
+@routes.get('/curie_uri_map')
+async def get_curie_uri_map(request):
+    return web.json_response(dict(Curie_Resolver.get_curie_to_uri_map()))
+
+@routes.get('/cache_stats')
+async def get_cache_stats(request):
+    return web.json_response(request.app['cache'].stats())
+
+async def create_ontology(app):
+    core = Core()
+    app['cache'] = core.context.cache
+    app['ontology'] = AsyncOntology(core.ont(), pool_size=app['pool_size'])
+
+async def close_ontology(app):
+    await app['ontology'].close()
+
+def create_app(pool_size=100):
+    app = web.Application()
+    app['pool_size'] = pool_size
+    app.add_routes(routes)
+    app.on_startup.append(create_ontology)
+    app.on_cleanup.append(close_ontology)
+    return app
+
+app = create_app()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Async Onto Server')
+    parser.add_argument('-p', '--port',  type=int, help='Port to run service on.', default=5000)
+    parser.add_argument('-s', '--pool-size', type=int, help='Concurrent SPARQL connections.', default=100)
+    args = parser.parse_args ()
+    web.run_app(create_app(args.pool_size), host='0.0.0.0', port=args.port)
@@ -1,12 +1,14 @@
 import argparse
+import base64
 import glob
+import json
 import os
-from lru import LRU
 from greent.services.ontology import GenericOntology
+from greent.services.cached_ontology import CachedOntology
+from greent.services.local_ontology import LocalOntology
 from greent.servicecontext import ServiceContext
-from flask import Flask, jsonify, g, Response, request
+from flask import Flask, jsonify, g, Response, request, stream_with_context
 from flasgger import Swagger
-from SPARQLWrapper import SPARQLWrapper, JSON
 from greent.util import Curie_Resolver
 app = Flask(__name__, instance_relative_config=True)
 
@@ -42,14 +44,19 @@ app.config['onto'] = {
 }
 
 swagger = Swagger(app, template=template)
-cache = LRU(100)
 
 class Core:
     
     """ Core ontology services. """
     def __init__(self):
         self.context = service_context = ServiceContext (config=os.environ.get('greent.conf'))
-        self.generic_ont = GenericOntology(self.context, '') 
+        backend = self.context.config.get('system', {}).get('ontology_backend', 'sparql')
+        if backend == 'local':
+            self.generic_ont = LocalOntology(self.context)
+        else:
+            version_interval = self.context.config.get('cache', {}).get('version_interval', 3600)
+            self.generic_ont = CachedOntology(GenericOntology(self.context, ''), self.context.cache,
+                                              version_interval = float(version_interval))
 
     def ont (self):
         return self.generic_ont
@@ -66,12 +73,118 @@ def get_ontology_service ():
   
 def curie_normalize(curie):    
     assert ':' in curie, "Curie format invalid. Format should be <PREFIX>:<ID>"
-    curie_parts = curie.split(':')
-    print(curie_parts[0])
-    prefix_list = list(Curie_Resolver.get_curie_to_uri_map().   keys())
-    assert curie_parts[0].upper() in prefix_list, "Curie prefix not supported " \
-                                       f"support prefixes are {prefix_list}"# since this is going to raise an exception in our sparql either way
-    return ':'.join([curie_parts[0].upper()] + curie_parts[1:])
+    prefix, local_id = curie.split(':', 1)
+    # since this is going to raise an exception in our sparql either way
+    assert Curie_Resolver.has_prefix(prefix), f"Curie prefix {prefix} not supported; supported prefixes are listed at /curie_uri_map"
+    return f"{prefix.upper()}:{local_id}"
+
+def batch_curies(body, normalize=True):
+    """ Read a posted {"curies": [...]} body, mapping each curie provided to its normalized form. Curies
+    that normalize alike, like mondo:1 and MONDO:1, each keep their own entry. """
+    assert isinstance(body, dict) and isinstance(body.get('curies'), list) and len(body['curies']) > 0, \
+        "Request body must be a JSON object with a non-empty list of 'curies'"
+    curies = {}
+    for curie in body['curies']:
+        assert isinstance(curie, str), f"Curies must be strings. Curie provided : `{curie}`"
+        if normalize:
+            try:
+                curies[curie] = curie_normalize(curie)
+            except AssertionError as error:
+                raise AssertionError(f"{error}. Curie provided : `{curie}`")
+        else:
+            curies[curie] = curie
+    return curies
+
+def batch_response(operation, shape=lambda value: value, normalize=True):
+    """ Answer a batch request with one call to the ontology's *_many operation, keyed by the curies provided. """
+    ont = get_ontology_service ()
+    try:
+        curies = batch_curies(request.get_json(silent=True), normalize)
+        results = getattr(ont, operation)(list(dict.fromkeys(curies.values())))
+    except AssertionError as error:
+        return jsonify({"validation error": str(error)}), 400
+    return jsonify({ curie : shape(results[normalized]) for curie, normalized in curies.items() if normalized in results })
+
+def batch_conversion(body, key):
+    """ Convert the posted {"curies": [...]} or {"uris": [...]} body in one pass, mapping each value to its
+    conversion, or to None where its prefix or namespace is unknown. """
+    assert isinstance(body, dict) and isinstance(body.get(key), list) and len(body[key]) > 0, \
+        f"Request body must be a JSON object with a non-empty list of '{key}'"
+    values = body[key]
+    for value in values:
+        assert isinstance(value, str), f"{key.capitalize()} must be strings. Value provided : `{value}`"
+    if key == 'curies':
+        return dict(zip(values, Curie_Resolver.curie_to_uri_many(values)))
+    return { uri : (None if curie == uri else curie) for uri, curie in zip(values, Curie_Resolver.uri_to_curie_many(values)) }
+
+def synonym_rows(syns):
+    return [ {
+        "desc" : syn.get('desc', ''),
+        "scope" : syn.get('scope', ''),
+        "syn_type" : syn.get('type', None),
+        "xref"     : syn.get('xref', '')
+    } for syn in syns or [] ]
+
+PAGE_SIZE = 10000
+
+def encode_cursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({ 'offset' : offset }).encode('utf-8')).decode('ascii')
+
+def page_params(args):
+    """ The limit and offset of a request for a page of results, from limit and either offset or cursor. """
+    try:
+        limit = int(args['limit']) if args.get('limit') else None
+        if args.get('cursor'):
+            offset = int(json.loads(base64.urlsafe_b64decode(args['cursor'].encode('ascii')))['offset'])
+        else:
+            offset = int(args.get('offset', 0))
+    except (ValueError, KeyError, TypeError):
+        raise AssertionError("limit and offset must be integers, and cursor one returned in X-Next-Cursor")
+    assert (limit is None or limit > 0) and offset >= 0, "limit must be positive and offset not negative"
+    return limit, offset
+
+def wants_ndjson(args, accept):
+    return args.get('format') == 'ndjson' or 'application/x-ndjson' in (accept or '')
+
+def windows(limit, offset, page_size=None):
+    """ The (limit, offset) of each page fetched to stream limit results from offset, or all of them. """
+    page_size = page_size or PAGE_SIZE
+    while limit is None or limit > 0:
+        size = page_size if limit is None else min(page_size, limit)
+        yield size, offset
+        offset += size
+        if limit is not None:
+            limit -= size
+
+def paged_response(operation, args, shape=lambda values: values, count=len):
+    """ Answer a request for results of an ontology operation, which takes limit and offset after args,
+    as one JSON page, or as NDJSON streamed a PAGE_SIZE page at a time so the full set is never held.
+    Limit and offset count the rows behind the results, and de-duplicating or grouping rows can leave a
+    page short, so only an empty page marks the end. """
+    ont = get_ontology_service ()
+    try:
+        limit, offset = page_params(request.args)
+    except AssertionError as error:
+        return jsonify({"validation error": str(error)}), 400
+    fetch = getattr(ont, operation)
+    if wants_ndjson(request.args, request.headers.get('Accept')):
+        def generate():
+            for size, start in windows(limit, offset):
+                values = fetch(*args, size, start)
+                if count(values) == 0:
+                    break
+                for value in values:
+                    yield json.dumps(value) + '\n'
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    values = fetch(*args, limit, offset)
+    response = jsonify(shape(values))
+    if limit is not None and count(values) > 0:
+        response.headers['X-Next-Cursor'] = encode_cursor(offset + limit)
+    return response
+
+def property_count(properties):
+    """ The number of property values in an all_properties page. """
+    return sum(len(p['property_values']) for p in properties)
 
 
 
@@ -91,12 +204,40 @@ def id_list(curie):
        x-requestTemplate:
          - valueType: http://schema.org/string
            template: /label/{{ input }}/
+     - name: limit
+       in: query
+       type: integer
+       required: false
+       description: "Return at most this many results. A page with any results sets an X-Next-Cursor header for the next one; pages may hold fewer than limit results before the last."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: offset
+       in: query
+       type: integer
+       required: false
+       default: 0
+       description: "Skip this many results."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: cursor
+       in: query
+       type: string
+       required: false
+       description: "The X-Next-Cursor of the previous page, instead of an offset."
+       x-valueType:
+         - http://schema.org/string
+     - name: format
+       in: query
+       type: string
+       required: false
+       description: "ndjson to stream one result per line as it is fetched, rather than one JSON document."
+       x-valueType:
+         - http://schema.org/string
    responses:
      200:
        description: ...
    """
-  ont = get_ontology_service ()
-  return jsonify(ont.id_list(curie))
+  return paged_response('id_list', [ curie ])
 
 
 @app.route('/is_a/<curie>/<ancestors>')
@@ -148,6 +289,48 @@ def is_a (curie, ancestors):
        "ancestors" : ancestors
    })
 
+@app.route('/is_a', methods=['POST'])
+def is_a_batch ():
+   """ Determine ancestry for many identifiers in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of pairs, each an id and a list (or comma separated string) of candidate ancestors."
+       schema:
+         type: object
+         properties:
+           pairs:
+             type: array
+             items:
+               type: object
+               properties:
+                 id:
+                   type: string
+                 ancestors:
+                   type: array
+                   items:
+                     type: string
+             example: [{"id": "MONDO:0005737", "ancestors": ["MONDO:0005762", "MONDO:0021198"]}]
+   responses:
+     200:
+       description: ...
+   """
+   body = request.get_json(silent=True)
+   pairs = body.get('pairs') if isinstance(body, dict) else None
+   if not isinstance(pairs, list) or len(pairs) == 0:
+       return jsonify({
+           "error": "Request body must be a JSON object with a non-empty list of 'pairs'"
+       }), 400
+   for pair in pairs:
+       if not isinstance(pair, dict) or not pair.get('id') or not isinstance(pair.get('ancestors'), (str, list)):
+           return jsonify({
+               "error": f"Each pair must have an id and one or more ancestors. Pair provided : `{pair}`"
+           }), 400
+   ont = get_ontology_service ()
+   return jsonify (ont.is_a_many([ (pair['id'], pair['ancestors']) for pair in pairs ]))
+
 @app.route('/search/<pattern>')
 def search (pattern):
    """ Search for terms in an ontology based on a pattern, optionally a regular expression. Look up is done on the synonyms, labels and definitions. Ids
@@ -176,6 +359,46 @@ def search (pattern):
        x-requestTemplate:
          - valueType: http://schema.org/boolean
            template: /search/{{ pattern }}/?regex={{ regex }}
+     - name: words
+       in: query
+       type: boolean
+       required: false
+       default: false
+       description: "Match the pattern as words in any order, word* prefixes and \"quoted phrases\" instead. Needs the text index."
+       x-valueType:
+         - http://schema.org/boolean
+       x-requestTemplate:
+         - valueType: http://schema.org/boolean
+           template: /search/{{ pattern }}/?words={{ words }}
+     - name: limit
+       in: query
+       type: integer
+       required: false
+       description: "Return at most this many results. A page with any results sets an X-Next-Cursor header for the next one; pages may hold fewer than limit results before the last."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: offset
+       in: query
+       type: integer
+       required: false
+       default: 0
+       description: "Skip this many results."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: cursor
+       in: query
+       type: string
+       required: false
+       description: "The X-Next-Cursor of the previous page, instead of an offset."
+       x-valueType:
+         - http://schema.org/string
+     - name: format
+       in: query
+       type: string
+       required: false
+       description: "ndjson to stream one result per line as it is fetched, rather than one JSON document."
+       x-valueType:
+         - http://schema.org/string
    responses:
      200:
        description: ...
@@ -183,9 +406,13 @@ def search (pattern):
    params = request.args
    regex = 'regex' in params and params['regex'] == 'true'
    ont = get_ontology_service ()  
-   values = ont.search(pattern, regex)      
-  
-   return jsonify ({ "values" : values })
+   if params.get('words') == 'true':
+       try:
+           values = ont.search_words(pattern)
+       except ValueError as e:
+           return jsonify({ "error" : str(e) }), 400
+       return jsonify ({ "values" : values })
+   return paged_response('search', [ pattern, regex, True ], lambda values: { "values" : values })
      
 @app.route('/xrefs/<curie>')
 def xrefs (curie):
@@ -525,18 +752,47 @@ def all_properties (curie):
        x-requestTemplate:
          - valueType: http://schema.org/string
            template: /all_properties/{{ curie }}/
+     - name: limit
+       in: query
+       type: integer
+       required: false
+       description: "Return at most this many results. A page with any results sets an X-Next-Cursor header for the next one; pages may hold fewer than limit results before the last."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: offset
+       in: query
+       type: integer
+       required: false
+       default: 0
+       description: "Skip this many results."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: cursor
+       in: query
+       type: string
+       required: false
+       description: "The X-Next-Cursor of the previous page, instead of an offset."
+       x-valueType:
+         - http://schema.org/string
+     - name: format
+       in: query
+       type: string
+       required: false
+       description: "ndjson to stream one result per line as it is fetched, rather than one JSON document."
+       x-valueType:
+         - http://schema.org/string
    responses:
      200:
         description: ...
    """
-   ont = get_ontology_service()
    try:
        normalized_curie = curie_normalize(curie)
    except AssertionError as error:
        error_msg = str(error)
        return jsonify({"validation error": f"{error_msg}. Curie provided : `{curie}`"}), 400
 
-   return jsonify({"all_properties" : ont.all_properties(normalized_curie)})
+   return paged_response('all_properties', [ normalized_curie ], lambda properties: {"all_properties" : properties},
+                         count = property_count)
    
 @app.route('/descendants/<curie>')
 def descendants(curie):
@@ -554,18 +810,46 @@ def descendants(curie):
        x-requestTemplate:
          - valueType: http://schema.org/string
            template: /descendants/{{ input }}/
+     - name: limit
+       in: query
+       type: integer
+       required: false
+       description: "Return at most this many results. A page with any results sets an X-Next-Cursor header for the next one; pages may hold fewer than limit results before the last."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: offset
+       in: query
+       type: integer
+       required: false
+       default: 0
+       description: "Skip this many results."
+       x-valueType:
+         - http://schema.org/Integer
+     - name: cursor
+       in: query
+       type: string
+       required: false
+       description: "The X-Next-Cursor of the previous page, instead of an offset."
+       x-valueType:
+         - http://schema.org/string
+     - name: format
+       in: query
+       type: string
+       required: false
+       description: "ndjson to stream one result per line as it is fetched, rather than one JSON document."
+       x-valueType:
+         - http://schema.org/string
    responses:
      200:
        description: ...
    """
-  ont = get_ontology_service()
   try:
       normalized_curie = curie_normalize(curie)
   except AssertionError as error:
       error_msg = str(error)
       return jsonify({"validation error": f"{error_msg}. Curie provided : `{curie}`"}), 400
 
-  return jsonify(ont.descendants(normalized_curie))
+  return paged_response('descendants', [ normalized_curie ])
 
 @app.route('/ancestors/<curie>')
 def ancestors(curie):
@@ -655,6 +939,190 @@ def label(curie):
   output = {'id':curie, 'label': ont.label(normalized_curie)}
   return jsonify(output)
 
+@app.route('/label', methods=['POST'])
+def label_batch ():
+   """ Get the labels of many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('label_many')
+
+@app.route('/xrefs', methods=['POST'])
+def xrefs_batch ():
+   """ Get external references to other ontologies for many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('xrefs_many', lambda xrefs: [ x.split(' ')[0] if ' ' in x else x for x in xrefs ])
+
+@app.route('/synonyms', methods=['POST'])
+def synonyms_batch ():
+   """ Get synonym terms for many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('synonyms_many', synonym_rows)
+
+@app.route('/lookup', methods=['POST'])
+def lookup_batch ():
+   """ Get ids for which each curie is an external reference, for many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["OMIM:143100", "UMLS:C0282687"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('lookup_many', normalize=False)
+
+@app.route('/parents', methods=['POST'])
+def parents_batch ():
+   """ Get ontological parents (1st gen. ancestors) of many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('parents_many')
+
+@app.route('/children', methods=['POST'])
+def children_batch ():
+   """ Get once-removed subterms of many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('children_many')
+
+@app.route('/ancestors', methods=['POST'])
+def ancestors_batch ():
+   """ Get all cascading 'is_a' ancestors of many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('ancestors_many')
+
+@app.route('/descendants', methods=['POST'])
+def descendants_batch ():
+   """ Get all cascading 'is_a' descendants of many curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Returns a map of each curie provided to its result."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0004979", "MONDO:0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   return batch_response('descendants_many')
+
 @app.route('/uri/<curie>')
 def uri_from_curie(curie):
    """ Expands a curie to uri.
@@ -675,6 +1143,8 @@ def uri_from_curie(curie):
      200:
        description: ...
    """
+   # The ontology service's context loads the configured prefix registry.
+   get_ontology_service ()
    try:
        normalized_curie = curie_normalize(curie)
    except AssertionError as error:
@@ -685,6 +1155,60 @@ def uri_from_curie(curie):
      'uri': Curie_Resolver.curie_to_uri(normalized_curie)
    })
 
+@app.route('/curie_to_uri', methods=['POST'])
+def curie_to_uri_batch():
+   """ Expands many curies to uris in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of curies. Each maps to its uri, or to null if its prefix is unknown."
+       schema:
+         type: object
+         properties:
+           curies:
+             type: array
+             items:
+               type: string
+             example: ["MONDO:0005737", "HP:0002099"]
+   responses:
+     200:
+       description: ...
+   """
+   get_ontology_service ()
+   try:
+       return jsonify (batch_conversion (request.get_json(silent=True), 'curies'))
+   except AssertionError as error:
+       return jsonify({"validation error": str(error)}), 400
+
+@app.route('/uri_to_curie', methods=['POST'])
+def uri_to_curie_batch():
+   """ Contracts many uris to curies in one request.
+   ---
+   parameters:
+     - name: body
+       in: body
+       required: true
+       description: "A JSON object with a list of uris. Each maps to its curie, or to null if no known namespace begins it."
+       schema:
+         type: object
+         properties:
+           uris:
+             type: array
+             items:
+               type: string
+             example: ["http://purl.obolibrary.org/obo/MONDO_0005737"]
+   responses:
+     200:
+       description: ...
+   """
+   get_ontology_service ()
+   try:
+       return jsonify (batch_conversion (request.get_json(silent=True), 'uris'))
+   except AssertionError as error:
+       return jsonify({"validation error": str(error)}), 400
+
 @app.route('/curie_uri_map')
 def get_curie_uri_map():
    """ Gets the curie map used to convert curies to uri(s).
@@ -693,8 +1217,22 @@ def get_curie_uri_map():
      200:
        description: ...
     """
+   get_ontology_service ()
+   return jsonify(
+     dict(Curie_Resolver.get_curie_to_uri_map())
+    )
+
+@app.route('/cache_stats')
+def get_cache_stats():
+   """ Gets hit rate, evictions and resident bytes of this worker's result cache.
+   ---
+   responses:
+     200:
+       description: ...
+    """
+   get_ontology_service()
    return jsonify(
-     Curie_Resolver.get_curie_to_uri_map()
+     core.context.cache.stats()
     )
 
 
@@ -1,12 +1,35 @@
+import heapq
 import json
 import logging
-import operator
 import os
 import pickle
-import requests
+import re
+import redis
+import sqlite3
+import sys
+import threading
+import time
 import traceback
+import uuid
+import zlib
 from greent.util import LoggingUtil
-from lru import LRU
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
 
 logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
 
@@ -25,30 +48,491 @@ class PickleCacheSerializer(CacheSerializer):
         return pickle.loads (str)
 
 class JSONCacheSerializer(CacheSerializer):
-    pass # would be nice
+    """ Serialize JSON shaped values, with orjson when it is installed. Tuples come back as lists. """
+    def dumps(self, obj):
+        if orjson is not None:
+            return orjson.dumps (obj, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps (obj, separators=(',', ':')).encode ('utf-8')
+    def loads(self, str):
+        if orjson is not None:
+            return orjson.loads (str)
+        return json.loads (str)
+
+class MsgpackCacheSerializer(CacheSerializer):
+    """ Serialize JSON shaped values to msgpack, which is more compact than JSON. Tuples come back as lists. """
+    def __init__(self):
+        if msgpack is None:
+            raise ValueError ("The msgpack cache serializer requires the msgpack package; install it or set cache.serializer to pickle or json.")
+    def dumps(self, obj):
+        return msgpack.packb (obj, use_bin_type=True)
+    def loads(self, str):
+        return msgpack.unpackb (str, raw=False, strict_map_key=False)
+
+SERIALIZERS = {
+    'pickle'  : PickleCacheSerializer,
+    'json'    : JSONCacheSerializer,
+    'msgpack' : MsgpackCacheSerializer
+}
+
+class Compressor:
+    """ Compresses serialized values of at least threshold bytes. The first byte of every stored value
+    names its codec, so values written under different settings can still be read back. """
+    def __init__(self, codec="none", threshold=4096):
+        if codec == "zstd" and zstandard is None:
+            raise ValueError ("zstd compression requires the zstandard package; install it or set cache.compression to zlib or none.")
+        if codec == "lz4" and lz4 is None:
+            raise ValueError ("lz4 compression requires the lz4 package; install it or set cache.compression to zlib or none.")
+        if codec not in ("none", "zlib", "zstd", "lz4"):
+            raise ValueError (f"Unknown cache compression: {codec}")
+        self.codec = codec
+        self.threshold = threshold
+
+    def compress(self, data):
+        if self.codec == "none" or len(data) < self.threshold:
+            return b'n' + data
+        if self.codec == "zstd":
+            return b's' + zstandard.ZstdCompressor ().compress (data)
+        if self.codec == "lz4":
+            return b'l' + lz4.frame.compress (data)
+        return b'z' + zlib.compress (data)
+
+    def decompress(self, data):
+        codec = data[:1]
+        if codec == b'n':
+            return data[1:]
+        if codec == b's':
+            return zstandard.ZstdDecompressor ().decompress (data[1:])
+        if codec == b'l':
+            return lz4.frame.decompress (data[1:])
+        if codec == b'z':
+            return zlib.decompress (data[1:])
+        return data
+
+def estimate_size(value):
+    """ Approximate the bytes a value holds in memory, following containers and object attributes. """
+    size = 0
+    seen = set ()
+    pending = [ value ]
+    while pending:
+        item = pending.pop ()
+        if id(item) in seen:
+            continue
+        seen.add (id(item))
+        size += sys.getsizeof (item)
+        if isinstance(item, dict):
+            pending.extend (item.keys ())
+            pending.extend (item.values ())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            pending.extend (item)
+        elif hasattr(item, '__dict__'):
+            pending.append (item.__dict__)
+    return size
+
+class SizedCache:
+    """ An in-process cache bounded by the approximate bytes of its values rather than an entry count.
+
+    Eviction follows Greedy-Dual-Size-Frequency: each entry is ranked at clock + hits / size, and the
+    lowest ranked entry goes first, with the clock advancing to its rank. Small, often read entries
+    outlive large, rarely read ones, and entries that stop being read age out as the clock moves on.
+    Values larger than max_bytes are never admitted. """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = {}
+        self.heap = []
+        self.clock = 0.0
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock ()
+
+    def get(self, key):
+        """ Return the (value, expires) stored for key, or None. """
+        with self.lock:
+            entry = self.entries.get (key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry[3] += 1
+            entry[4] = self.clock + entry[3] / entry[2]
+            heapq.heappush (self.heap, (entry[4], key))
+            self.compact ()
+            return entry[0], entry[1]
+
+    def set(self, key, value, expires=None):
+        size = estimate_size (value)
+        with self.lock:
+            self.remove (key)
+            if size > self.max_bytes:
+                return
+            while self.resident_bytes + size > self.max_bytes:
+                self.evict ()
+            priority = self.clock + 1 / size
+            self.entries[key] = [ value, expires, size, 1, priority ]
+            heapq.heappush (self.heap, (priority, key))
+            self.resident_bytes += size
+            self.compact ()
+
+    def delete(self, key):
+        with self.lock:
+            self.remove (key)
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries.keys ())
+
+    def remove(self, key):
+        entry = self.entries.pop (key, None)
+        if entry is not None:
+            self.resident_bytes -= entry[2]
+
+    def compact(self):
+        """ Drop the stale heap records left behind by re-ranked and removed entries. """
+        if len(self.heap) > 4 * len(self.entries) + 64:
+            self.heap = [ (entry[4], k) for k, entry in self.entries.items () ]
+            heapq.heapify (self.heap)
+
+    def evict(self):
+        """ Evict the lowest ranked entry, skipping heap records that no longer match an entry. """
+        while self.heap:
+            priority, key = heapq.heappop (self.heap)
+            entry = self.entries.get (key)
+            if entry is not None and entry[4] == priority:
+                self.clock = priority
+                self.remove (key)
+                self.evictions += 1
+                return
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits'           : self.hits,
+                'misses'         : self.misses,
+                'hit_rate'       : self.hits / lookups if lookups else 0.0,
+                'evictions'      : self.evictions,
+                'entries'        : len(self.entries),
+                'resident_bytes' : self.resident_bytes,
+                'max_bytes'      : self.max_bytes
+            }
+
+class SQLiteCacheTier:
+    """ Serialized entries in a SQLite file, shared by every worker process on a host. """
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local ()
+        with self.connection () as connection:
+            connection.execute ("PRAGMA journal_mode=WAL")
+            connection.execute ("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+
+    def connection(self):
+        """ SQLite connections can't be shared between threads, so each thread opens its own. """
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect (self.path, timeout=30)
+        return connection
+
+    def get_many(self, keys):
+        """ Map each key with a live entry to its (value, expires). """
+        result = {}
+        now = time.time ()
+        connection = self.connection ()
+        # Stay well under SQLite's limit on bound parameters.
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = connection.execute (
+                f"SELECT key, value, expires FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            for key, value, expires in rows:
+                if expires is None or expires >= now:
+                    result[key] = (value, expires)
+        return result
+
+    def set_many(self, entries):
+        """ Store (key, value, expires) entries. """
+        with self.connection () as connection:
+            connection.executemany ("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", entries)
+
+    def size(self):
+        """ Bytes of serialized values stored. """
+        return self.connection().execute ("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone ()[0]
+
+    def purge(self, prefix):
+        """ Delete every entry whose key starts with prefix, along with anything expired. """
+        with self.connection () as connection:
+            connection.execute ("DELETE FROM cache WHERE substr(key, 1, ?) = ? OR expires < ?",
+                                (len(prefix), prefix, time.time ()))
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class RedisCacheTier:
+    """ Serialized entries in Redis, shared by every worker and pod pointed at the same server.
+    Multi-key reads and writes are pipelined into one round trip. """
+    def __init__(self, host="localhost", port=6379, db=0):
+        self.redis = redis.Redis (host=host, port=port, db=db)
+
+    def get_many(self, keys):
+        """ Map each key with a live entry to its (value, expires). """
+        pipeline = self.redis.pipeline (transaction=False)
+        for key in keys:
+            pipeline.get (key)
+            pipeline.pttl (key)
+        replies = pipeline.execute ()
+        result = {}
+        now = time.time ()
+        for index, key in enumerate(keys):
+            value, ttl = replies[2 * index], replies[2 * index + 1]
+            if value is not None:
+                result[key] = (value, now + ttl / 1000 if ttl >= 0 else None)
+        return result
+
+    def set_many(self, entries):
+        """ Store (key, value, expires) entries. """
+        pipeline = self.redis.pipeline (transaction=False)
+        now = time.time ()
+        for key, value, expires in entries:
+            if expires is None:
+                pipeline.set (key, value)
+            elif expires > now:
+                pipeline.set (key, value, px=max(1, int((expires - now) * 1000)))
+        pipeline.execute ()
+
+    def acquire(self, lock, token, timeout):
+        """ Take a lock that lapses after timeout seconds unless released first. """
+        return bool(self.redis.set (lock, token, nx=True, px=int(timeout * 1000)))
+
+    def release(self, lock, token):
+        """ Release a lock, but only if it is still held under token. """
+        try:
+            self.redis.eval (RELEASE_LOCK_SCRIPT, 1, lock, token)
+        except Exception as e:
+            logger.warning (f"unable to release {lock}: {e}")
+
+    def size(self):
+        """ Bytes of memory used by the Redis server. """
+        return self.redis.info ('memory')['used_memory']
+
+    def purge(self, prefix):
+        """ Delete every entry whose key starts with prefix. """
+        pattern = re.sub (r'([\\*?\[\]])', r'\\\1', prefix) + '*'
+        batch = []
+        for key in self.redis.scan_iter (match=pattern, count=1000):
+            batch.append (key)
+            if len(batch) == 1000:
+                self.redis.delete (*batch)
+                batch = []
+        if batch:
+            self.redis.delete (*batch)
+
+class Flight:
+    """ One in-progress computation of a cache key, awaited by every other caller for that key. """
+    def __init__(self):
+        self.event = threading.Event ()
+        self.value = None
+        self.error = None
 
 class Cache:
-    """ Cache objects by configurable means. """
-    def __init__(self, cache_path="cache",
+    """ Cache objects by configurable means.
+
+    Entries are held in an in-process SizedCache (L1) of at most max_bytes. Given a cache_path, they
+    are also written to a SQLite file shared by the worker processes on a host; with use_redis, to a
+    Redis server shared by every host. Reads fall through L1 to the shared tiers in that order and copy
+    hits back into L1. A ttl (seconds) expires entries in every tier; None keeps them until evicted or
+    purged. Values bound for the shared tiers are serialized by serializer and compressed past
+    compression_threshold bytes.
+
+    get_or_compute lets concurrent callers missing the same key share one computation: threads in a
+    process wait on the first caller, and with use_redis and a lock_timeout, other processes wait on
+    a Redis lock held by whichever process got there first. """
+    def __init__(self, cache_path=None,
                  serializer=PickleCacheSerializer,
                  redis_host="localhost", redis_port=6379, redis_db=0,
-                 enabled=True):
+                 enabled=True, ttl=None, use_redis=False,
+                 compression="none", compression_threshold=4096,
+                 max_bytes=256 * 1024 * 1024, lock_timeout=30):
         
         """ Connect to cache. """
         self.enabled = enabled
-        self.cache = LRU (1000) 
+        self.ttl = ttl
+        self.cache = SizedCache (max_bytes)
         self.serializer = serializer ()
+        self.compressor = Compressor (compression, compression_threshold)
+        self.bytes_written = 0
+        self.tier_hits = 0
+        self.lock_timeout = lock_timeout
+        self.flights = {}
+        self.flights_lock = threading.Lock ()
+        self.tiers = []
+        self.redis_tier = None
+        if enabled and cache_path:
+            self.tiers.append (SQLiteCacheTier (cache_path))
+        if enabled and use_redis:
+            self.redis_tier = RedisCacheTier (redis_host, redis_port, redis_db)
+            self.tiers.append (self.redis_tier)
         
     def get(self, key):
         """ Get a cached item by key. """
-        result = None
-        if self.enabled:
-            if key in self.cache:
-                result = self.cache[key]
+        return self.get_many ([ key ]).get (key)
+
+    def get_many(self, keys):
+        """ Map each cached key to its item, asking each shared tier at most once for the L1 misses. """
+        result = {}
+        if not self.enabled:
+            return result
+        now = time.time ()
+        missing = []
+        for key in keys:
+            entry = self.cache.get (key)
+            if entry is not None:
+                value, expires = entry
+                if expires is None or expires >= now:
+                    result[key] = value
+                    continue
+                self.cache.delete (key)
+            missing.append (key)
+        for tier in self.tiers:
+            if not missing:
+                break
+            try:
+                found = tier.get_many (missing)
+            except Exception as e:
+                logger.warning (f"cache tier {tier.__class__.__name__} unavailable: {e}")
+                continue
+            self.tier_hits += len(found)
+            for key, (data, expires) in found.items ():
+                result[key] = self.loads (data)
+                self.cache.set (key, result[key], expires)
+            missing = [ key for key in missing if key not in found ]
         return result
     
-    def set(self, key, value):
-        """ Add an item to the cache. """
-        if self.enabled:
-            self.cache[key] = value
+    def set(self, key, value, ttl=None):
+        """ Add an item to the cache, expiring after ttl seconds if given, else after the cache's ttl. """
+        self.set_many ({ key : value }, ttl)
+
+    def set_many(self, items, ttl=None):
+        """ Add a map of keys to items, writing each shared tier once. """
+        if not self.enabled or not items:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.time () + ttl if ttl else None
+        for key, value in items.items ():
+            self.cache.set (key, value, expires)
+        if self.tiers:
+            entries = []
+            for key, value in items.items ():
+                try:
+                    entries.append ((key, self.dumps (value), expires))
+                except Exception as e:
+                    # Kept in L1 only; the serializer may not handle every value, e.g. a set as JSON.
+                    logger.warning (f"unable to serialize {key} for the shared cache tiers: {e}")
+            for tier in self.tiers if entries else []:
+                try:
+                    tier.set_many (entries)
+                except Exception as e:
+                    logger.warning (f"cache tier {tier.__class__.__name__} unavailable: {e}")
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """ Get a cached item, or compute and cache it. Concurrent callers for the same key share a single
+        call to compute, and its result or exception. A None result is returned but not cached. ttl may
+        be a function of the computed item. """
+        value = self.get (key)
+        if value is not None:
+            return value
+        with self.flights_lock:
+            flight = self.flights.get (key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight ()
+        if not leader:
+            flight.event.wait ()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self.compute_shared (key, compute, ttl)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.flights_lock:
+                del self.flights[key]
+            flight.event.set ()
+
+    def compute_shared(self, key, compute, ttl=None):
+        """ Compute and cache an item, holding a Redis lock on the key so other processes wait for this
+        result rather than computing their own. A process that can't get the lock polls the cache for the
+        holder's result, and computes it itself if none appears within lock_timeout. """
+        if self.redis_tier is not None and self.lock_timeout:
+            lock = f"lock:{key}"
+            token = uuid.uuid4 ().hex
+            deadline = time.time () + self.lock_timeout
+            delay = 0.01
+            while time.time () < deadline:
+                try:
+                    acquired = self.redis_tier.acquire (lock, token, self.lock_timeout)
+                except Exception as e:
+                    logger.warning (f"unable to lock {key}: {e}")
+                    break
+                if acquired:
+                    try:
+                        return self.compute_and_set (key, compute, ttl)
+                    finally:
+                        self.redis_tier.release (lock, token)
+                time.sleep (delay)
+                delay = min(delay * 2, 0.5)
+                value = self.get (key)
+                if value is not None:
+                    return value
+        return self.compute_and_set (key, compute, ttl)
+
+    def compute_and_set(self, key, compute, ttl=None):
+        value = compute ()
+        if value is not None:
+            self.set (key, value, ttl (value) if callable(ttl) else ttl)
+        return value
 
+    def dumps(self, value):
+        """ Serialize and, past the compression threshold, compress a value for the shared tiers. """
+        data = self.compressor.compress (self.serializer.dumps (value))
+        self.bytes_written += len(data)
+        return data
+
+    def loads(self, data):
+        return self.serializer.loads (self.compressor.decompress (data))
+
+    def stats(self):
+        """ Hit rate, evictions and resident bytes of the in-process tier, with the bytes written to
+        and held by the shared tiers. """
+        result = self.cache.stats ()
+        result['tier_hits'] = self.tier_hits
+        result['bytes_written'] = self.bytes_written
+        result['stored_bytes'] = self.stored_bytes ()
+        return result
+
+    def stored_bytes(self):
+        """ Map each shared tier to the bytes it holds. """
+        result = {}
+        for tier in self.tiers:
+            try:
+                result[tier.__class__.__name__] = tier.size ()
+            except Exception as e:
+                logger.warning (f"cache tier {tier.__class__.__name__} unavailable: {e}")
+        return result
+
+    def purge(self, prefix):
+        """ Drop every entry whose key starts with prefix. """
+        if self.enabled:
+            for key in [ k for k in self.cache.keys () if k.startswith (prefix) ]:
+                self.cache.delete (key)
+            for tier in self.tiers:
+                try:
+                    tier.purge (prefix)
+                except Exception as e:
+                    logger.warning (f"cache tier {tier.__class__.__name__} unavailable: {e}")
@@ -1,26 +1,129 @@
-import re
+import hashlib
+import json
+import logging
 import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from greent.service import Service
 from greent.cache import Cache
+from greent.util import LoggingUtil
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+# Request headers that can change the body of a response; any others are left out of cache keys.
+KEY_HEADERS = ('accept', 'accept-language', 'content-type')
+
+def cache_key(method, url, params=None, headers=None):
+    """ A canonical key for a request: a digest of its method, url, sorted params and the headers in
+    KEY_HEADERS, so requests differing only in parameter order share a key and no two differing
+    requests do. """
+    params = sorted((str(k), str(v)) for k, v in (params or {}).items())
+    headers = sorted((k.lower(), str(v)) for k, v in (headers or {}).items() if k.lower() in KEY_HEADERS)
+    request = json.dumps([ method.upper(), url, params, headers ], separators=(',', ':'))
+    return f"http:{hashlib.sha256(request.encode('utf-8')).hexdigest()}"
 
 class CachedService(Service):
-    """ A service that caches requests. """
+    """ A service that caches requests.
+
+    Responses are cached with the time they stay fresh: cache.ttl for results, and the shorter
+    cache.negative_ttl for empty ones ([], {}, null), so unknown identifiers aren't re-fetched on every
+    call. For cache.stale_ttl seconds after that, a stale response is still returned at once while a
+    background thread fetches a fresh one. """
     def __init__(self, name, context):
         super(CachedService,self).__init__(name, context)
-        self.punctuation = re.compile('[ ?=\./:{}]+')
+        cache_config = context.config.get('cache', {})
+        ttl = cache_config.get('ttl', None)
+        self.ttl = float(ttl) if ttl else None
+        self.negative_ttl = float(cache_config.get('negative_ttl', 3600))
+        self.stale_ttl = float(cache_config.get('stale_ttl', 0))
+        self.refreshing = set()
+        self.refreshing_lock = threading.Lock()
+        self.refresher = ThreadPoolExecutor(max_workers=4)
     
-    def get(self, url, params=None, headers=None):
-        key = self.punctuation.sub ('', url)
-        obj = self.context.cache.get(key)
-        if not obj:
-            if params==None and headers==None:
-                obj = requests.get(url).json()
-            elif params and headers:
-                obj = requests.get(url, params=params, headers=headers).json()
-            elif params and headers==None: # pragma: no cover
-                obj = requests.get(url, params=params).json()
-            elif params==None and headers: # pragma: no cover
-                obj = requests.get(url, headers=headers).json()
-            self.context.cache.set(key, obj)
+    def get(self, url, params=None, headers=None, timeout=None):
+        """ Get a url's JSON, sharing one request between concurrent callers for the same key. A timeout
+        (seconds) overrides the session's for this request; it is not part of the key. """
+        key = cache_key('GET', url, params, headers)
+        fresh_until, obj = self.context.cache.get_or_compute(key,
+                                                             lambda : self.fetch_entry(url, params, headers, timeout),
+                                                             ttl=self.entry_ttl)
+        if fresh_until is not None and fresh_until < time.time():
+            self.refresh(key, url, params, headers)
         return obj
 
+    def get_many(self, urls, fetch_many):
+        """ Get the JSON of a map of ids to urls, sharing get's cache entries for those urls. The ids not
+        cached, or stale, are passed together to fetch_many, which returns a map of ids to the JSON get
+        would have returned. If fetch_many fails, the urls are fetched concurrently instead. """
+        keys = { identifier : cache_key('GET', url) for identifier, url in urls.items() }
+        cached = self.context.cache.get_many(list(keys.values()))
+        now = time.time()
+        results = {}
+        missing = []
+        for identifier, key in keys.items():
+            entry = cached.get(key)
+            if entry is None or (entry[0] is not None and entry[0] < now):
+                missing.append(identifier)
+            else:
+                results[identifier] = entry[1]
+        if missing:
+            try:
+                fetched = fetch_many(missing)
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"batch request failed, fetching {len(missing)} urls one at a time: {e}")
+                with ThreadPoolExecutor(max_workers=8) as executor:
+                    fetched = dict(zip(missing, executor.map(lambda identifier : self.get(urls[identifier]), missing)))
+                results.update(fetched)
+            else:
+                found, empty = {}, {}
+                for identifier in missing:
+                    entry = self.entry(fetched.get(identifier))
+                    results[identifier] = entry[1]
+                    (found if entry[1] else empty)[keys[identifier]] = entry
+                for entries in (found, empty):
+                    if entries:
+                        self.context.cache.set_many(entries, self.entry_ttl(next(iter(entries.values()))))
+        return { identifier : results[identifier] for identifier in urls if identifier in results }
+
+    def post(self, url, body):
+        """ Post a JSON body and return the JSON response. Responses are not cached. """
+        response = self.context.http_session.post(url, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_entry(self, url, params=None, headers=None, timeout=None):
+        """ Fetch a url's JSON, paired with the time it stays fresh until. """
+        return self.entry(self.fetch(url, params, headers, timeout))
+
+    def entry(self, obj):
+        """ Pair a response with the time it stays fresh until. """
+        fresh_for = self.ttl if obj else self.negative_ttl
+        return (time.time() + fresh_for if fresh_for else None, obj)
+
+    def entry_ttl(self, entry):
+        """ Keep an entry for stale_ttl seconds after it goes stale. """
+        fresh_until = entry[0]
+        return fresh_until - time.time() + self.stale_ttl if fresh_until is not None else None
+
+    def refresh(self, key, url, params=None, headers=None):
+        """ Replace a stale entry in the background, at most once at a time per key. """
+        with self.refreshing_lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        def run():
+            try:
+                entry = self.fetch_entry(url, params, headers)
+                self.context.cache.set(key, entry, self.entry_ttl(entry))
+            except Exception as e:
+                logger.warning(f"unable to refresh {url}: {e}")
+            finally:
+                with self.refreshing_lock:
+                    self.refreshing.discard(key)
+        self.refresher.submit(run)
+
+    def fetch(self, url, params=None, headers=None, timeout=None):
+        if timeout is None:
+            return self.context.http_session.get(url, params=params, headers=headers).json()
+        return self.context.http_session.get(url, params=params, headers=headers, timeout=timeout).json()
@@ -0,0 +1,96 @@
+from bisect import bisect_right
+
+class ClosureIndex:
+    """ Reflexive subclass closure of an is_a DAG using interval labelling.
+
+    Terms are numbered in DFS post-order over a spanning tree, so the descendants of a term
+    reached through tree edges occupy one contiguous range of that numbering. Descendants
+    reached through additional parents (multiple inheritance) contribute extra ranges, which are
+    merged bottom up. Checking is_a(term, ancestor) is then a lookup of the term's number in the
+    ancestor's ranges - constant time for tree shaped regions - and descendants are slices of the
+    post-order. """
+
+    def __init__(self, parents, terms=None):
+        """ Build from a term -> parent terms mapping. Terms without parents may be supplied separately. """
+        children = {}
+        for term, term_parents in parents.items():
+            for parent in term_parents:
+                children.setdefault(parent, []).append(term)
+        nodes = set(parents)
+        nodes.update(children)
+        if terms is not None:
+            nodes.update(terms)
+        self.parents = parents
+        self.post = {}
+        self.order = []
+        low = {}
+        roots = sorted(n for n in nodes if not parents.get(n))
+        # Anything left over after the roots sits on an is_a cycle; still number it.
+        for root in roots + sorted(nodes):
+            if root in self.post or root in low:
+                continue
+            low[root] = len(self.order)
+            stack = [ (root, iter(children.get(root, ()))) ]
+            while stack:
+                node, pending = stack[-1]
+                for child in pending:
+                    if child not in low:
+                        low[child] = len(self.order)
+                        stack.append((child, iter(children.get(child, ()))))
+                        break
+                else:
+                    stack.pop()
+                    self.post[node] = len(self.order)
+                    self.order.append(node)
+        self.starts = {}
+        self.ends = {}
+        for node in self.order:
+            intervals = [ (low[node], self.post[node]) ]
+            for child in children.get(node, ()):
+                if child in self.starts:
+                    intervals.extend(zip(self.starts[child], self.ends[child]))
+            intervals.sort()
+            starts, ends = [], []
+            for start, end in intervals:
+                if ends and start <= ends[-1] + 1:
+                    if end > ends[-1]:
+                        ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            self.starts[node] = tuple(starts)
+            self.ends[node] = tuple(ends)
+
+    def __contains__(self, term):
+        return term in self.post
+
+    def is_a(self, term, ancestor):
+        """ True if ancestor is term or one of its transitive superclasses. """
+        position = self.post.get(term)
+        starts = self.starts.get(ancestor)
+        if position is None or starts is None:
+            return False
+        i = bisect_right(starts, position) - 1
+        return i >= 0 and self.ends[ancestor][i] >= position
+
+    def descendants(self, term):
+        """ The term and all of its transitive subclasses. """
+        result = []
+        for start, end in zip(self.starts.get(term, ()), self.ends.get(term, ())):
+            result.extend(self.order[start:end + 1])
+        return result
+
+    def ancestors(self, term):
+        """ The term and all of its transitive superclasses. """
+        if term not in self.post:
+            return []
+        seen = { term }
+        result = [ term ]
+        stack = [ term ]
+        while stack:
+            for parent in self.parents.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    result.append(parent)
+                    stack.append(parent)
+        return result
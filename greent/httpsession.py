@@ -0,0 +1,96 @@
+import requests
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+class PooledSession(requests.Session):
+    """ A requests session that keeps connections alive in bounded per-host pools, retries failed
+    idempotent requests with exponential backoff, and gives every request a default timeout. One is
+    safe to share between threads. """
+
+    def __init__(self, timeout=30, retries=3, backoff=0.5, pool_connections=20, pool_maxsize=20, hosts={}):
+        super(PooledSession, self).__init__()
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        adapter = self.adapter(pool_connections, pool_maxsize)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        for host, maxsize in hosts.items():
+            adapter = self.adapter(1, int(maxsize))
+            self.mount(f'http://{host}', adapter)
+            self.mount(f'https://{host}', adapter)
+
+    def adapter(self, pool_connections, pool_maxsize):
+        retry = Retry(total=self.retries, backoff_factor=self.backoff, status_forcelist=RETRY_STATUSES,
+                      raise_on_status=False)
+        return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(PooledSession, self).request(method, url, **kwargs)
+
+def create_session(config={}):
+    """ Build a PooledSession from the http block of greent.conf. """
+    hosts = config.get('hosts', None)
+    # A nested block of greent.conf comes back as a Config, which holds its keys in conf.
+    hosts = getattr(hosts, 'conf', hosts) or {}
+    return PooledSession(timeout = float(config.get('timeout', 30)),
+                         retries = int(config.get('retries', 3)),
+                         backoff = float(config.get('backoff', 0.5)),
+                         pool_connections = int(config.get('pool_connections', 20)),
+                         pool_maxsize = int(config.get('pool_maxsize', 20)),
+                         hosts = hosts)
+
+class CircuitOpen(Exception):
+    """ Raised instead of calling a source whose circuit breaker is open. """
+    pass
+
+class CircuitBreaker:
+    """ Stops calling a failing source for a while. After failure_threshold consecutive failures the
+    circuit opens and calls fail fast with CircuitOpen; after reset_timeout seconds one trial call is
+    let through, closing the circuit again if it succeeds. """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """ Whether a call may go ahead now. """
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.time() - self.opened >= self.reset_timeout:
+                # Let one trial call through; a failure re-opens the circuit for another reset_timeout.
+                self.opened = time.time()
+                return True
+            return False
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened = time.time()
+
+    def call(self, function, *args):
+        if not self.allow():
+            raise CircuitOpen(f"{self.name} is failing; not calling it for up to {self.reset_timeout} seconds")
+        try:
+            result = function(*args)
+        except Exception:
+            self.failed()
+            raise
+        self.succeeded()
+        return result
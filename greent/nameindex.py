@@ -0,0 +1,299 @@
+import argparse
+import glob
+import logging
+import mmap
+import os
+import re
+import shutil
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from functools import partial
+from greent.util import LoggingUtil
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+# The biolink-model concept of the terms in each ontology.
+PREFIX_CONCEPTS = {
+    'MONDO'  : 'disease',
+    'DOID'   : 'disease',
+    'HP'     : 'phenotypic_feature',
+    'GO'     : 'biological_process_or_activity',
+    'UBERON' : 'anatomical_entity',
+    'CL'     : 'cell',
+    'CHEBI'  : 'chemical_substance',
+    'HGNC'   : 'gene'
+}
+
+NON_WORD = re.compile(r'[\W_]+')
+
+def normalize(text):
+    """ Fold case and accents, and reduce punctuation and runs of whitespace to single spaces. """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+def trigrams(word):
+    """ The distinct trigrams of a word padded with $, so short words and word ends have some. """
+    padded = f"${word}$"
+    return { padded[i:i+3] for i in range(max(1, len(padded) - 2)) }
+
+def edit_distance(a, b, bound):
+    """ The Levenshtein distance between a and b, or bound + 1 as soon as it is known to exceed bound. """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [ i ]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        if min(current) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[-1], bound + 1)
+
+class SortedLines:
+    """ A file of sorted lines, each starting with a tab terminated key, and a packed array of the
+    offsets of the lines. Both are memory-mapped, so opening one costs nothing and lookups only page
+    in the few blocks a binary search touches. """
+
+    def __init__(self, path):
+        self.data = self.map(path)
+        self.offsets = memoryview(self.map(f"{path}.offsets")).cast('Q')
+
+    def map(self, path):
+        with open(path, 'rb') as stream:
+            if os.fstat(stream.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return max(0, len(self.offsets) - 1)
+
+    def line(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def key(self, index):
+        start = self.offsets[index]
+        return self.data[start:self.data.find(b'\t', start, self.offsets[index + 1])]
+
+    def lower_bound(self, key):
+        """ The index of the first line whose key is not less than key. """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def upper_bound(self, key, prefix=False):
+        """ The index past the last line whose key equals key, or starts with it if prefix is set. """
+        if not prefix:
+            return self.lower_bound(key + b'\x00')
+        # Every key starting with the prefix sorts below the prefix followed by the highest byte.
+        return self.lower_bound(key + b'\xff')
+
+    def lines(self, key, prefix=False):
+        """ The indices of the lines whose key equals, or starts with, key. """
+        return range(self.lower_bound(key), self.upper_bound(key, prefix))
+
+    @staticmethod
+    def write(path, lines):
+        """ Sort and write lines, given as bytes with no newline, along with their offsets. """
+        offsets = array('Q', [ 0 ])
+        with open(path, 'wb') as stream:
+            for line in sorted(set(lines)):
+                stream.write(line)
+                stream.write(b'\n')
+                offsets.append(offsets[-1] + len(line) + 1)
+        with open(f"{path}.offsets", 'wb') as stream:
+            offsets.tofile(stream)
+
+class NameIndex:
+    """ Maps normalized term names and synonyms to CURIEs, for exact, prefix, token and fuzzy lookups.
+
+    names holds a "name<TAB>id<TAB>label<TAB>concept" line per name of each term; tokens holds a
+    "token<TAB>line" line per word of each name, pointing back into names; trigrams holds a
+    "trigram<TAB>token" line per trigram of each distinct token. Build one offline from ontology
+    snapshots with build, or from the command line.
+
+    path is a symbolic link to the directory of the current build. A rebuild writes a new directory and
+    then repoints the link, so an index opened during a rebuild reads files all from one build. """
+
+    def __init__(self, path):
+        self.path = path
+        # Resolve the link once, so every file comes from the same build.
+        directory = os.path.realpath(path)
+        self.names = SortedLines(os.path.join(directory, 'names'))
+        self.tokens = SortedLines(os.path.join(directory, 'tokens'))
+        # Indexes built before fuzzy matching have no trigrams; they just don't do fuzzy lookups.
+        trigrams = os.path.join(directory, 'trigrams')
+        self.trigrams = SortedLines(trigrams) if os.path.exists(trigrams) else None
+
+    def entry(self, index):
+        name, identifier, label, concept = self.names.line(index).decode('utf-8').split('\t')
+        return { 'id' : identifier, 'label' : label, 'type' : concept }
+
+    def collect(self, indices, concept=None, limit=50, seen=None):
+        """ Entries for line indices, once per id, optionally of one concept only. """
+        seen = set() if seen is None else seen
+        result = []
+        for index in indices:
+            entry = self.entry(index)
+            if entry['id'] in seen or (concept and entry['type'] != concept):
+                continue
+            seen.add(entry['id'])
+            result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    def exact(self, text, concept=None, limit=50):
+        """ Terms with a name equal to text, after normalization. """
+        return self.collect(self.names.lines(normalize(text).encode('utf-8')), concept, limit)
+
+    def prefix(self, text, concept=None, limit=50):
+        """ Terms with a name starting with text, after normalization. """
+        key = normalize(text).encode('utf-8')
+        return self.collect(self.names.lines(key, prefix=True), concept, limit) if key else []
+
+    def token(self, text, concept=None, limit=50, scan=10000):
+        """ Terms with a name containing every word of text in any order, the last word as a prefix so
+        partially typed text matches. Candidates come from the rarest word, checking at most scan. """
+        words = normalize(text).split(' ')
+        if not words or not words[0]:
+            return []
+        ranges = [ self.tokens.lines(word.encode('utf-8'), prefix=(i == len(words) - 1))
+                   for i, word in enumerate(words) ]
+        rarest = min(ranges, key=len)
+        def matches(index):
+            name_words = self.names.key(index).decode('utf-8').split(' ')
+            return all(word in name_words for word in words[:-1]) and \
+                any(name_word.startswith(words[-1]) for name_word in name_words)
+        candidates = sorted({ int(self.tokens.line(i).split(b'\t')[1]) for i in rarest[:scan] })
+        return self.collect((index for index in candidates if matches(index)), concept, limit)
+
+    def similar_words(self, word, max_edits, scan=20000):
+        """ Indexed words within max_edits edits of word, with their distances. An edit changes at most
+        three trigrams, so only words sharing enough trigrams with word are worth measuring. """
+        grams = trigrams(word)
+        shared = Counter()
+        for gram in grams:
+            for index in self.trigrams.lines(gram.encode('utf-8'))[:scan]:
+                shared[self.trigrams.line(index).split(b'\t')[1]] += 1
+        needed = max(1, len(grams) - 3 * max_edits)
+        result = {}
+        for candidate, count in shared.items():
+            if count >= needed:
+                candidate = candidate.decode('utf-8')
+                distance = edit_distance(word, candidate, max_edits)
+                if distance <= max_edits:
+                    result[candidate] = distance
+        return result
+
+    def fuzzy(self, text, concept=None, limit=50, max_edits=2, scan=10000):
+        """ Terms with a name containing, for every word of text, a word at most max_edits edits away.
+        Results are ranked by total edits, then by how many words the name has beyond those of text. """
+        words = normalize(text).split(' ')
+        if self.trigrams is None or not words[0]:
+            return []
+        alternatives = [ self.similar_words(word, max_edits) for word in words ]
+        if not all(alternatives):
+            return []
+        # Candidates come from the query word whose spellings are the rarest.
+        postings = [ [ self.tokens.lines(w.encode('utf-8')) for w in similar ] for similar in alternatives ]
+        rarest = min(postings, key=lambda ranges: sum(len(r) for r in ranges))
+        candidates = { int(self.tokens.line(i).split(b'\t')[1]) for lines in rarest for i in lines[:scan] }
+        ranked = []
+        for index in candidates:
+            name_words = self.names.key(index).decode('utf-8').split(' ')
+            edits = 0
+            for similar in alternatives:
+                distances = [ similar[w] for w in name_words if w in similar ]
+                if not distances:
+                    break
+                edits += min(distances)
+            else:
+                ranked.append((edits, len(name_words) - len(words), index))
+        return self.collect((index for edits, extra, index in sorted(ranked)), concept, limit)
+
+    def search(self, text, concept=None, limit=50, max_edits=0):
+        """ Exact matches, then prefix matches, then token matches, then, if max_edits is set, fuzzy
+        matches, once per id. """
+        key = normalize(text).encode('utf-8')
+        if not key:
+            return []
+        seen = set()
+        result = []
+        for lookup in (self.names.lines(key), self.names.lines(key, prefix=True)):
+            result += self.collect(lookup, concept, limit - len(result), seen)
+            if len(result) >= limit:
+                return result
+        lookups = [ self.token ] + ([ partial(self.fuzzy, max_edits=max_edits) ] if max_edits > 0 else [])
+        for lookup in lookups:
+            for entry in lookup(text, concept, limit):
+                if entry['id'] not in seen and len(result) < limit:
+                    seen.add(entry['id'])
+                    result.append(entry)
+            if len(result) >= limit:
+                break
+        return result
+
+    @staticmethod
+    def build(path, snapshot, concepts=PREFIX_CONCEPTS):
+        """ Write an index of the labels and exact and related synonyms of a snapshot's terms into a new
+        directory beside path, then point path at it. The build before it is kept for processes still
+        opening it; older ones are removed. """
+        path = os.path.abspath(path)
+        directory = f"{path}.{time.time_ns()}"
+        os.makedirs(directory)
+        NameIndex.write(directory, snapshot, concepts)
+        previous = os.path.realpath(path) if os.path.islink(path) else None
+        if os.path.isdir(path) and not os.path.islink(path):
+            # An index from before builds were linked; move it aside so the link can take its place.
+            previous = f"{path}.{time.time_ns()}"
+            os.rename(path, previous)
+        link = f"{directory}.link"
+        os.symlink(os.path.basename(directory), link)
+        os.replace(link, path)
+        kept = { directory, previous }
+        for old in glob.glob(f"{glob.escape(path)}.*"):
+            if old not in kept and os.path.isdir(old) and not os.path.islink(old) and old[len(path) + 1:].isdigit():
+                shutil.rmtree(old)
+        logger.info(f"{path} now points at {directory}")
+
+    @staticmethod
+    def write(path, snapshot, concepts):
+        """ Write the names, tokens and trigrams of a snapshot's terms into the directory path. """
+        names = []
+        for identifier, label in snapshot.labels.items():
+            concept = concepts.get(identifier.split(':')[0], 'named_thing')
+            label = ' '.join(label.split())
+            texts = { label } | { desc for desc, scope, xrefs in snapshot.synonyms.get(identifier, ())
+                                  if scope in ('EXACT', 'RELATED') }
+            for text in texts:
+                name = normalize(text)
+                if name:
+                    names.append(f"{name}\t{identifier}\t{label}\t{concept}".encode('utf-8'))
+        names = sorted(set(names))
+        SortedLines.write(os.path.join(path, 'names'), names)
+        tokens = []
+        for index, line in enumerate(names):
+            for word in set(line.split(b'\t')[0].split(b' ')):
+                tokens.append(word + b'\t' + str(index).encode('ascii'))
+        SortedLines.write(os.path.join(path, 'tokens'), tokens)
+        words = { token.split(b'\t')[0].decode('utf-8') for token in tokens }
+        SortedLines.write(os.path.join(path, 'trigrams'),
+                          (f"{gram}\t{word}".encode('utf-8') for word in words for gram in trigrams(word)))
+        logger.info(f"indexed {len(names)} names of {len(snapshot.labels)} terms in {path}")
+
+if __name__ == "__main__":
+    from greent.services.local_ontology import OntologySnapshot
+    parser = argparse.ArgumentParser(description='Build a name index from OBO snapshots.')
+    parser.add_argument('-o', '--output', help='Directory to write the index to.', required=True)
+    parser.add_argument('snapshots', nargs='+', help='OBO files (paths or URLs) to index.')
+    args = parser.parse_args ()
+    NameIndex.build(args.output, OntologySnapshot(args.snapshots))
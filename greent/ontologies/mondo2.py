@@ -56,7 +56,10 @@ class Mondo2(Onto):
     def has_ancestor(self,obj, terms):
         """ Is is_a(obj,t) true for any t in terms ? """
         ids = self.get_mondo_id(obj.identifier)        
-        results = [ i for i in ids for candidate_ancestor in terms if super(Mondo2,self).is_a(i, candidate_ancestor) ] \
+        if isinstance(terms, str):
+            terms = [ terms ]
+        # One is_a request per id checks every candidate ancestor at once.
+        results = [ i for i in ids if super(Mondo2,self).is_a(i, ','.join(terms)) ] \
                  if terms else []
         return len(results) > 0, results
 
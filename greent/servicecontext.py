@@ -1,8 +1,9 @@
 import os
-from greent.cache import Cache
+from greent.cache import Cache, SERIALIZERS
 from greent.core import GreenT
 from greent.config import Config
-from greent.util import LoggingUtil
+from greent.httpsession import create_session
+from greent.util import LoggingUtil, Curie_Resolver
 
 class ServiceContext:
     """ A context for all service objects. Centralizes control over how services behave
@@ -14,7 +15,28 @@ class ServiceContext:
             config = os.path.join (os.path.dirname (__file__), config_name)
         self.config = Config (config)
         self.core = GreenT (self)
-        self.cache = Cache ()
+        self.http_session = create_session (self.config.get ('http', {}))
+        curie_contexts = self.config.get ('curies', {}).get ('contexts', None) or []
+        if isinstance (curie_contexts, str):
+            curie_contexts = curie_contexts.split (',')
+        Curie_Resolver.load_contexts ([ context.strip () for context in curie_contexts ])
+        cache_config = self.config.get ('cache', {})
+        redis_config = self.config.get ('redis', {})
+        ttl = cache_config.get ('ttl', None)
+        serializer = cache_config.get ('serializer', 'pickle')
+        if serializer not in SERIALIZERS:
+            raise ValueError (f"Unknown cache serializer {serializer}; choose one of {', '.join (SERIALIZERS)}.")
+        self.cache = Cache (cache_path = cache_config.get ('path', None) or None,
+                            ttl = float (ttl) if ttl else None,
+                            use_redis = str (cache_config.get ('redis', False)).lower () == 'true',
+                            redis_host = redis_config.get ('host', 'localhost'),
+                            redis_port = int (redis_config.get ('port', 6379)),
+                            redis_db = int (redis_config.get ('db', 0)),
+                            serializer = SERIALIZERS[serializer],
+                            compression = cache_config.get ('compression', 'none'),
+                            compression_threshold = int (cache_config.get ('compression_threshold', 4096)),
+                            max_bytes = int (cache_config.get ('max_bytes', 256 * 1024 * 1024)),
+                            lock_timeout = float (cache_config.get ('lock_timeout', 30)))
         
     @staticmethod
     def create_context (config=None):
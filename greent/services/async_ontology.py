@@ -0,0 +1,174 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+from greent.services.cached_ontology import CachedOntology
+from greent.services.ontology import GenericOntology, page_clause, row_curies, LABEL_QUERY, IS_A_QUERY, CHILDREN_QUERY, DESCENDANTS_QUERY, \
+    ANCESTORS_QUERY, XREFS_QUERY, SYNONYMS_QUERY, LOOKUP_QUERY, PARENTS_QUERY
+from greent.triplestore import AsyncTripleStore
+from greent.util import LoggingUtil, Curie_Resolver
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+def backend_fallback(method):
+    """ Answer straight from the backend when there is no SPARQL endpoint to await. The backend, not
+    a CachedOntology around it, is called: run has already consulted the cache off the event loop. """
+    @wraps(method)
+    async def wrapper(self, *args):
+        if self.triplestore is None:
+            return getattr(self.backend, method.__name__)(*args)
+        return await method(self, *args)
+    return wrapper
+
+class AsyncOntology:
+    """ Asyncio front for an ontology backend.
+
+    For GenericOntology, the lookups behind the busiest routes are issued through an AsyncTripleStore
+    using the same queries as the blocking methods. Anything else runs the backend's own method on a
+    thread pool. In-memory backends are called directly since they never wait on I/O. A CachedOntology
+    is consulted before, and filled after, the native lookups too, and concurrent requests missing the
+    same key await a single lookup. """
+
+    def __init__(self, ontology, pool_size=100):
+        self.ontology = ontology
+        self.cached = ontology if isinstance(ontology, CachedOntology) else None
+        self.backend = backend = ontology.backend if self.cached else ontology
+        self.resolve_uri = Curie_Resolver.uri_to_curie
+        self.triplestore = None
+        self.executor = None
+        self.flights = {}
+        if isinstance(backend, GenericOntology):
+            self.triplestore = AsyncTripleStore(backend.url,
+                                                timeout = backend.triplestore.timeout,
+                                                pool_size = pool_size)
+            self.executor = ThreadPoolExecutor(max_workers = backend.triplestore.pool_size)
+
+    async def close(self):
+        if self.triplestore is not None:
+            await self.triplestore.close()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def run(self, operation, *args):
+        """ Run any backend operation without blocking the event loop, preferring a native coroutine. """
+        native = getattr(self, operation, None)
+        if native is not None and asyncio.iscoroutinefunction(native):
+            if self.cached is None:
+                return await native(*args)
+            # Keying may check the backend's version and the cache may be SQLite or Redis, so both block.
+            key, result = await self.blocking(self.cached_get, operation, *args)
+            if result is None:
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = asyncio.ensure_future(self.fill(key, native(*args)))
+                    flight.add_done_callback(lambda _: self.flights.pop(key, None))
+                # A cancelled caller must not cancel the lookup the others are waiting on.
+                result = await asyncio.shield(flight)
+            return result
+        method = getattr(self.ontology, operation)
+        if self.executor is None:
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(method, *args))
+
+    async def blocking(self, function, *args):
+        """ Run a blocking call on the loop's default thread pool. """
+        return await asyncio.get_running_loop().run_in_executor(None, partial(function, *args))
+
+    def cached_get(self, operation, *args):
+        """ The cache key of an operation and its cached result, if any. """
+        key = self.cached.key(operation, *args)
+        return key, self.cached.cache.get(key)
+
+    async def fill(self, key, lookup):
+        """ Await a lookup and cache its result. """
+        result = await lookup
+        if result is not None:
+            await self.blocking(partial(self.cached.cache.set, ttl=self.cached.ttl), key, result)
+        return result
+
+    async def query_sparql(self, query_template, inputs, outputs, post=False):
+        return await self.triplestore.query_template(
+            template_text = self.ontology.add_sparql_prefixes(query_template, inputs),
+            inputs = inputs,
+            outputs = outputs,
+            post = post
+        )
+
+    def curies(self, rows, variable):
+        return row_curies(rows, variable, self.resolve_uri)
+
+    @backend_fallback
+    async def label(self, identifier):
+        results = await self.query_sparql(LABEL_QUERY, { 'identifier': identifier }, [ 'labels' ])
+        return results[0]["labels"] if len(results) > 0 else ''
+
+    @backend_fallback
+    async def is_a(self, identifier, ancestors):
+        candidates, uris = self.backend.is_a_candidates(ancestors)
+        if len(candidates) == 0:
+            return False, []
+        response = await self.query_sparql(IS_A_QUERY, {
+            'identifier': identifier,
+            'ancestors': ' '.join(f'<{uri}>' for uri in uris)
+        }, [ 'ancestor' ])
+        return self.backend.is_a_result(candidates, uris, response)
+
+    @backend_fallback
+    async def children(self, identifier):
+        rows = await self.query_sparql(CHILDREN_QUERY, { 'identifier': identifier }, [ 'descendant', 'descendant_id' ])
+        return self.curies(rows, 'descendant')
+
+    @backend_fallback
+    async def descendants(self, identifier, limit=None, offset=0):
+        rows = await self.query_sparql(DESCENDANTS_QUERY + page_clause('?descendant', limit, offset),
+                                       { 'identifier': identifier }, [ 'descendant', 'descendant_id' ])
+        return self.curies(rows, 'descendant')
+
+    @backend_fallback
+    async def ancestors(self, identifier):
+        rows = await self.query_sparql(ANCESTORS_QUERY, { 'identifier': identifier }, [ 'ancestor', 'ancestor_id' ])
+        return self.curies(rows, 'ancestor')
+
+    @backend_fallback
+    async def parents(self, identifier):
+        rows = await self.query_sparql(PARENTS_QUERY, { 'identifier': identifier }, [ 'parent', 'parent_id' ])
+        return self.curies(rows, 'parent')
+
+    @backend_fallback
+    async def siblings(self, identifier):
+        """ Children of every parent, fetched concurrently. """
+        parents = [ self.backend.parent_identifier(parent) for parent in await self.parents(identifier) ]
+        return self.backend.merge_siblings(identifier, await asyncio.gather(*[ self.children(parent) for parent in parents ]))
+
+    @backend_fallback
+    async def xrefs(self, identifier):
+        rows = await self.query_sparql(XREFS_QUERY, { 'identifier': identifier }, [ 'xrefs' ])
+        return [ row['xrefs'] for row in rows ]
+
+    @backend_fallback
+    async def synonyms(self, identifier):
+        """ Exact and related synonyms, queried concurrently. """
+        outputs = [ 'desc', 'xref', 'defn' ]
+        exact, related = await asyncio.gather(
+            self.query_sparql(SYNONYMS_QUERY, { 'identifier': identifier, 'predicate': "EXACT_SYNONYM:" }, outputs),
+            self.query_sparql(SYNONYMS_QUERY, { 'identifier': identifier, 'predicate': "RELATED_SYNONYM:" }, outputs))
+        return self.backend.scoped_synonyms(exact, related)
+
+    @backend_fallback
+    async def search(self, text, is_regex=False, ignore_case=True, limit=None, offset=0):
+        if self.backend.text_index is not None:
+            # A regular expression with no required literals scans every document, so keep it off the loop.
+            return await self.blocking(self.backend.search, text, is_regex, ignore_case, limit, offset)
+        query_text, search_string = self.ontology.search_query(text, is_regex, ignore_case)
+        response = await self.query_sparql(query_text + page_clause('?id', limit, offset), { 'search_string': search_string },
+                                           [ 'id', 'label', 'defined_by', 'definition' ])
+        for row in response:
+            row['id'] = self.resolve_uri(row['id'])
+        return response
+
+    @backend_fallback
+    async def lookup(self, identifier):
+        assert identifier and ':' in identifier, "Must provide a valid curie. Curie must have format " \
+                                                 "<PREFIX>:<ID>"
+        rows = await self.query_sparql(LOOKUP_QUERY, { 'identifier': identifier }, [ 'xrefs', 'term_id', 'term_label' ])
+        return self.backend.lookup_terms(rows)
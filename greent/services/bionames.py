@@ -1,8 +1,12 @@
 import json
-import requests
+import os
+import time
 import traceback
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
 from greent.service import Service
+from greent.nameindex import NameIndex
 from greent.services.mesh import MeshKS
 from greent.servicecontext import ServiceContext
 from greent.util import LoggingUtil
@@ -44,62 +48,136 @@ class BioNames(Service):
             "Molecular Activity" : "biological_process_or_activity",
             "genetic_condition" : "disease"
         }
+        config = self.get_config()
+        self.deadline = float(config.get('deadline', 10))
+        self.executor = ThreadPoolExecutor(max_workers=int(config.get('workers', 16)))
+        name_index = config.get('name_index', None)
+        self.name_index = None
+        if name_index and os.path.exists(os.path.join(name_index, 'names')):
+            self.name_index = NameIndex(name_index)
         
-    def lookup_router(self, q, concept=None):
-        """ Lookup a term with an optional concept. """
-        result = []
+    def lookup_router(self, q, concept=None, max_edits=0, limit=None, include_similar=True):
+        """ Lookup a term with an optional concept. Unless similar results are included, only those
+        labelled q itself are kept; limit applies after that. """
+        result, status = self.lookup(q, concept, max_edits=max_edits)
+        logger.debug (f"search q: {q} sources: {status}")
+        if not include_similar:
+            result = [ x for x in result if x['label'] == q ]
+        return result[:limit]
+
+    def lookup(self, q, concept=None, deadline=None, max_edits=0, limit=None):
+        """ Lookup a term under a concept, or under every concept if none is given, querying every
+        source concurrently. Returns the results that arrived within deadline seconds, in router order,
+        and the status of each source: ok, error or timeout. Each source is given the deadline as its own
+        timeout, since a source still running past it can't be cancelled and would hold a worker. With a name index, names up to max_edits
+        edits per word away from q match too, ranked after closer ones. Returns at most limit results. """
         if concept and not concept=="{concept}":
             """ Route the search by concept. """
             if concept in self.normalize:
                 concept = self.normalize[concept]
-            if concept in self.router_directory:
-                result = self.router_directory[concept](q, concept)
-            else:
+            if concept not in self.router_directory:
                 raise ValueError (f"Unknown concept {concept} is not a biolink-model concept.")
+            concepts = [ concept ]
         else:
             """ Try everything? Union the lot. """
-            for concept in self.router_directory.keys():
-                route = self.router_directory[concept]
-                result = result + route(q, concept)
-        #logger.debug (f"search q: {q} results: {result}")
-        return result
+            concepts = list(self.router_directory.keys())
+        deadline = deadline or self.deadline
+        sources = {}
+        for concept in concepts:
+            route = self.router_directory[concept]
+            if route == self._find:
+                """ One onto search serves every concept; Monarch is searched per concept. """
+                sources.setdefault('onto', partial(self._search_onto, q, max_edits=max_edits, timeout=deadline))
+                sources[f'monarch:{concept}'] = partial(self._search_monarch, q, concept, timeout=deadline)
+            else:
+                sources[concept] = partial(route, q, concept, timeout=deadline)
+        futures = { self.executor.submit(self._timed, source) : name for name, source in sources.items() }
+        done, pending = wait(futures, timeout=deadline)
+        responses = {}
+        status = {}
+        for future, name in futures.items():
+            if future in pending:
+                future.cancel()
+                status[name] = { 'status' : 'timeout' }
+            elif future.exception() is not None:
+                status[name] = { 'status' : 'error', 'error' : str(future.exception()) }
+            else:
+                responses[name], seconds = future.result()
+                status[name] = { 'status' : 'ok', 'count' : len(responses[name]), 'seconds' : round(seconds, 3) }
+        sourced = []
+        for concept in concepts:
+            if self.router_directory[concept] == self._find:
+                onto = [ r for r in responses.get('onto', []) if 'type' not in r or r['type'] == concept ]
+                if self.name_index is None:
+                    onto = self._containing(q, onto)
+                sourced.append(('onto', onto))
+                sourced.append((f'monarch:{concept}', self._containing(q, responses.get(f'monarch:{concept}', []))))
+            else:
+                sourced.append((concept, responses.get(concept, [])))
+        return self._merge(q, sourced)[:limit], status
+
+    def _timed(self, source):
+        start = time.time()
+        result = source()
+        return result, time.time() - start
     
-    def _find_chemical_substance(self, q, concept):
-        return chemical_ids_from_drug_names (q)
+    def _find_chemical_substance(self, q, concept, timeout=None):
+        return chemical_ids_from_drug_names (q, timeout)
     
     def _find(self, q, concept):
-        all_find_results_filtered = []
-        all_find_results = self._search_onto(q, concept=concept) + self._search_monarch(q, concept)
-        for x in all_find_results:
-            label = x['label'].lower()
-            if q.lower() in label:
-                if x['id'] not in str(all_find_results_filtered):
-                    all_find_results_filtered.append(x)
-        return all_find_results_filtered
+        onto = self._search_onto(q, concept=concept)
+        if self.name_index is None:
+            onto = self._containing(q, onto)
+        return self._merge(q, [ ('onto', onto), ('monarch', self._containing(q, self._search_monarch(q, concept))) ])
+
+    def _containing(self, q, results):
+        """ The results whose label contains q. The name index has already matched its results, which
+        may be spelled differently from q, so only results of scans and remote searches go through this. """
+        return [ x for x in results if q.lower() in x['label'].lower() ]
 
-    def _search_monarch(self, q, concept):
+    def _merge(self, q, sourced):
+        """ Merge (source, results) pairs into one result per id, in the order ids are first seen. A
+        duplicate adds its source to the result's sources, fills in a missing type, and replaces the label
+        if its own label is q itself. A bare id, as older chemical sources return, stands for itself. """
+        merged = {}
+        for source, results in sourced:
+            for x in results:
+                if isinstance(x, str):
+                    x = { 'id' : x, 'label' : x }
+                entry = merged.get(x['id'])
+                if entry is None:
+                    # Copy, since results may be shared with a cache.
+                    merged[x['id']] = dict(x, sources=[ source ])
+                    continue
+                if source not in entry['sources']:
+                    entry['sources'].append(source)
+                if not entry.get('type') and x.get('type'):
+                    entry['type'] = x['type']
+                if entry['label'].lower() != q.lower() and x['label'].lower() == q.lower():
+                    entry['label'] = x['label']
+        return list(merged.values())
+
+    def _search_monarch(self, q, concept, timeout=None):
+        """ Search Monarch. Failures raise, so lookup can report them. """
         result = []
-        try:
-            monarch_query = f"https://api.monarchinitiative.org/api/search/entity/autocomplete/{q}?category={concept}"
-            response = requests.get (monarch_query).json ()
-            if response:
-                for x in response['docs']:
-                    if 'category' in x :
-                        if concept in x['category']:
-                            result.append({'id' : x['id'], 'label' : x['label'][0], 'type' : x['category'][0]})
-        except:
-            traceback.print_exc ()
+        monarch_query = f"https://api.monarchinitiative.org/api/search/entity/autocomplete/{q}?category={concept}"
+        response = self.context.http_session.get (monarch_query, timeout=timeout or self.deadline).json ()
+        if response:
+            for x in response['docs']:
+                if 'category' in x :
+                    if concept in x['category']:
+                        result.append({'id' : x['id'], 'label' : x['label'][0], 'type' : x['category'][0]})
         return result
     
-    def _search_onto(self, q, concept=None):
-        result = []
-        try:
-            result = self.context.core.onto.search (q, is_regex=True, full=True)
-            if concept:
-                # Added fix for KeyException when there's no 'type' key in dict r
-                result = [r for r in result if 'type' not in r or r['type'] == concept]
-        except:
-            traceback.print_exc ()
+    def _search_onto(self, q, concept=None, max_edits=0, timeout=None):
+        """ Search the local name index if one is configured, otherwise onto. Failures raise, so lookup
+        can report them. """
+        if self.name_index is not None:
+            return self.name_index.search(q, concept, limit=200, max_edits=max_edits)
+        result = self.context.core.onto.search (q, is_regex=True, full=True, timeout=timeout or self.deadline)
+        if concept:
+            # Added fix for KeyException when there's no 'type' key in dict r
+            result = [r for r in result if 'type' not in r or r['type'] == concept]
         return result
 
     def ID_to_label_lookup(self, ID):
@@ -0,0 +1,86 @@
+import json
+import logging
+import threading
+import time
+from functools import partial
+from greent.util import LoggingUtil
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+CACHED_OPERATIONS = {
+    'label', 'is_a', 'single_level_is_a', 'descendants', 'ancestors', 'xrefs', 'synonyms', 'search', 'search_words',
+    'lookup', 'id_list', 'exactMatch', 'closeMatch', 'subterms', 'superterms', 'parents', 'children',
+    'siblings', 'property_value', 'all_properties'
+}
+
+BATCH_OPERATIONS = {
+    'label_many', 'children_many', 'descendants_many', 'ancestors_many', 'xrefs_many', 'synonyms_many',
+    'lookup_many', 'parents_many'
+}
+
+class CachedOntology:
+    """ Answers ontology questions from the service context's cache, asking the backend on a miss.
+
+    Keys carry the backend's build version, which is re-checked every version_interval seconds. When it
+    changes, entries written under the old version are purged, so a new Uberongraph build is picked up
+    without waiting for TTLs to lapse. Batch operations are cached per identifier, so a batch only asks
+    the backend for the identifiers it hasn't seen. Anything else passes straight through. """
+
+    def __init__(self, ontology, cache, ttl=None, version_interval=3600):
+        self.backend = ontology
+        self.cache = cache
+        self.ttl = ttl
+        self.version_interval = version_interval
+        self.version = None
+        self.version_checked = 0
+        self.lock = threading.Lock()
+
+    def current_version(self):
+        """ The backend's build version, checked at most once per version_interval. """
+        if self.version is None or time.time() - self.version_checked > self.version_interval:
+            with self.lock:
+                if self.version is None or time.time() - self.version_checked > self.version_interval:
+                    try:
+                        version = self.backend.version()
+                    except Exception as e:
+                        logger.warning(f"unable to get ontology version: {e}")
+                        version = self.version or 'unknown'
+                    previous = self.version
+                    self.version = version
+                    self.version_checked = time.time()
+                    if previous is not None and version != previous:
+                        # Keys carry the version, so entries of the old one are only purged to free space.
+                        logger.info(f"ontology version changed from {previous} to {version}")
+                        try:
+                            self.cache.purge(f"onto:{previous}:")
+                        except Exception as e:
+                            logger.warning(f"unable to purge entries of ontology version {previous}: {e}")
+        return self.version
+
+    def key(self, operation, *args):
+        return f"onto:{self.current_version()}:{operation}:{json.dumps(args)}"
+
+    def call(self, operation, *args):
+        """ Concurrent calls for the same key share one backend call. """
+        return self.cache.get_or_compute(self.key(operation, *args),
+                                         partial(getattr(self.backend, operation), *args),
+                                         ttl=self.ttl)
+
+    def call_many(self, operation, identifiers):
+        keys = { identifier : self.key(operation, identifier) for identifier in identifiers }
+        cached = self.cache.get_many(list(keys.values()))
+        results = { identifier : cached[key] for identifier, key in keys.items() if key in cached }
+        missing = [ identifier for identifier in keys if identifier not in results ]
+        if missing:
+            fetched = getattr(self.backend, operation)(missing)
+            results.update(fetched)
+            self.cache.set_many({ keys[identifier] : value for identifier, value in fetched.items() if identifier in keys },
+                                ttl=self.ttl)
+        return { identifier : results[identifier] for identifier in keys if identifier in results }
+
+    def __getattr__(self, name):
+        if name in CACHED_OPERATIONS:
+            return partial(self.call, name)
+        if name in BATCH_OPERATIONS:
+            return partial(self.call_many, name)
+        return getattr(self.backend, name)
@@ -1,4 +1,3 @@
-import requests
 import json
 from greent.service import Service
 from greent.util import LoggingUtil
@@ -10,7 +9,7 @@ class CHEMBL(Service):
         super(CHEMBL,self).__init__(name, context)
         self.name = name
     def get_label(self, identifier):
-        obj = requests.get(
+        obj = self.context.http_session.get(
             url = f"{self.url}/data/compound_record/{identifier}",
             headers = {
                 "Accept" : "application/json"
@@ -1,4 +1,3 @@
-import requests
 import json
 from greent.service import Service
 from greent.util import LoggingUtil
@@ -11,7 +10,7 @@ class HGNC(Service):
         self.name = name
     def get_label(self, identifier):
         source, accessor = identifier.split(':')
-        obj = requests.get(
+        obj = self.context.http_session.get(
             url = f"{self.url}/fetch/hgnc_id/{accessor}",
             headers = {
                 "Accept" : "application/json"
@@ -0,0 +1,319 @@
+import hashlib
+import logging
+from itertools import islice
+import os
+import re
+import sys
+import obonet
+from greent.closure import ClosureIndex
+from greent.service import Service
+from greent.textindex import TextIndex
+from greent.util import LoggingUtil, Curie_Resolver
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+SYNONYM_PATTERN = re.compile(r'^"((?:[^"\\]|\\.)*)"\s+(EXACT|RELATED|BROAD|NARROW)\b[^\[]*\[(.*)\]')
+DEFINITION_PATTERN = re.compile(r'^"((?:[^"\\]|\\.)*)"')
+PROPERTY_VALUE_PATTERN = re.compile(r'^(\S+)\s+(?:"((?:[^"\\]|\\.)*)"|(\S+))')
+
+EXACT_MATCH_KEYS = ('skos:exactMatch', 'http://www.w3.org/2004/02/skos/core#exactMatch')
+CLOSE_MATCH_KEYS = ('skos:closeMatch', 'http://www.w3.org/2004/02/skos/core#closeMatch')
+
+LABEL_URI = 'http://www.w3.org/2000/01/rdf-schema#label'
+DEFINITION_URI = 'http://purl.obolibrary.org/obo/IAO_0000115'
+SUBCLASS_OF_URI = 'http://www.w3.org/2000/01/rdf-schema#subClassOf'
+XREF_URI = 'http://www.geneontology.org/formats/oboInOwl#hasDbXref'
+EXACT_SYNONYM_URI = 'http://www.geneontology.org/formats/oboInOwl#hasExactSynonym'
+RELATED_SYNONYM_URI = 'http://www.geneontology.org/formats/oboInOwl#hasRelatedSynonym'
+
+def unescape(text):
+    return text.replace('\\"', '"').replace('\\\\', '\\')
+
+class OntologySnapshot:
+    """ Terms from one or more OBO snapshots, loaded once and held in flat, interned lookup tables. """
+
+    def __init__(self, paths=[]):
+        self.labels = {}
+        self.definitions = {}
+        self.defined_by = {}
+        self.synonyms = {}
+        self.xrefs = {}
+        self.parents = {}
+        self.children = {}
+        self.equivalents = {}
+        self.property_values = {}
+        self.xref_index = {}
+        self.closure = None
+        self.sources = []
+        self.versions = []
+        for path in paths:
+            self.load(path)
+        self.index()
+
+    def load(self, path):
+        """ Load an OBO file (path or URL) into the tables. """
+        logger.debug(f"loading ontology snapshot {path}")
+        graph = obonet.read_obo(path)
+        ontology = graph.graph.get('ontology', os.path.basename(path).split('.')[0])
+        defined_by = sys.intern(f"http://purl.obolibrary.org/obo/{ontology}.owl")
+        self.sources.append(path)
+        self.versions.append(f"{ontology}:{graph.graph.get('data-version', path)}")
+        for identifier, data in graph.nodes(data=True):
+            if 'name' not in data:
+                # Dangling reference to a term defined elsewhere.
+                continue
+            identifier = sys.intern(identifier)
+            self.labels[identifier] = data['name']
+            self.defined_by[identifier] = defined_by
+            definition = DEFINITION_PATTERN.match(data.get('def', ''))
+            if definition:
+                self.definitions[identifier] = unescape(definition.group(1))
+            synonyms = []
+            for synonym in data.get('synonym', []):
+                match = SYNONYM_PATTERN.match(synonym)
+                if match:
+                    desc, scope, xrefs = match.groups()
+                    synonyms.append((unescape(desc), sys.intern(scope), xrefs.strip()))
+            if synonyms:
+                self.synonyms[identifier] = tuple(synonyms)
+            if 'xref' in data:
+                self.xrefs[identifier] = tuple(sys.intern(x.split(' ')[0]) for x in data['xref'])
+            if 'is_a' in data:
+                self.parents[identifier] = tuple(sys.intern(p) for p in data['is_a'])
+            if 'equivalent_to' in data:
+                self.equivalents[identifier] = tuple(data['equivalent_to'])
+            properties = []
+            for property_value in data.get('property_value', []):
+                match = PROPERTY_VALUE_PATTERN.match(property_value)
+                if match:
+                    key, quoted, value = match.groups()
+                    properties.append((sys.intern(key), unescape(quoted) if quoted is not None else value))
+            if properties:
+                self.property_values[identifier] = tuple(properties)
+
+    def index(self):
+        """ Build the reverse lookups once all snapshots are loaded. """
+        children = {}
+        for identifier, parents in self.parents.items():
+            for parent in parents:
+                children.setdefault(parent, []).append(identifier)
+        self.children = { k : tuple(v) for k, v in children.items() }
+        xref_index = {}
+        for identifier, xrefs in self.xrefs.items():
+            for xref in xrefs:
+                xref_index.setdefault(xref, []).append(identifier)
+        self.xref_index = { k : tuple(v) for k, v in xref_index.items() }
+        self.closure = ClosureIndex(self.parents, self.labels)
+
+def paginate(values, limit=None, offset=0):
+    """ The page of values starting at offset, of at most limit values. """
+    return values[offset:] if limit is None else values[offset:offset + limit]
+
+def load_snapshot(config):
+    """ Load the snapshots listed in a local_ontology block of greent.conf. """
+    snapshot_dir = config.get('snapshot_dir', '')
+    paths = [ p if '://' in p or os.path.isabs(p) else os.path.join(snapshot_dir, p)
+              for p in config.get('snapshots', []) ]
+    return OntologySnapshot(paths)
+
+class LocalOntology(Service):
+    """ Answers GenericOntology questions from in-memory OBO snapshots instead of Uberongraph. """
+
+    def __init__(self, context, snapshot=None):
+        super(LocalOntology, self).__init__("local_ontology", context)
+        if snapshot is None:
+            snapshot = load_snapshot(self.get_config())
+        self.snapshot = snapshot
+        self.text_index = TextIndex(snapshot)
+        self.resolve_uri = Curie_Resolver.uri_to_curie
+
+    def version(self):
+        """ Identify the loaded snapshots by a digest of their data-versions. """
+        return hashlib.sha1('\n'.join(sorted(self.snapshot.versions)).encode('utf-8')).hexdigest()[:12]
+
+    def label(self, identifier):
+        """Return the label for an identifier"""
+        return self.snapshot.labels.get(identifier, '')
+
+    def label_many(self, identifiers):
+        """ Return a map of identifier to label. """
+        return { identifier : self.label(identifier) for identifier in identifiers }
+
+    def is_a(self, identifier, ancestors):
+        """Determine whether a term has a particular ancestor"""
+        if identifier not in self.snapshot.labels:
+            return False, []
+        closure = self.snapshot.closure
+        result = [ a.strip(' ') for a in ancestors.split(',') if closure.is_a(identifier, a.strip(' ')) ]
+        return len(result) > 0, result
+
+    def is_a_many(self, pairs):
+        """ Check many (identifier, ancestors) pairs, where ancestors is a list or a comma separated string. """
+        response = []
+        for identifier, ancestors in pairs:
+            is_a, result = self.is_a(identifier, ancestors if isinstance(ancestors, str) else ','.join(ancestors))
+            response.append({
+                'id'        : identifier,
+                'is_a'      : is_a,
+                'ancestors' : result
+            })
+        return response
+
+    def single_level_is_a(self, identifier):
+        """ Get single-level 'is_a' descendants. """
+        return list(self.snapshot.children.get(identifier, ()))
+
+    def children_many(self, identifiers):
+        return { identifier : self.single_level_is_a(identifier) for identifier in identifiers }
+
+    def descendants(self, identifier, limit=None, offset=0):
+        """ This is also known as a recursive-'is_a' function, returning all levels below the input"""
+        if identifier not in self.snapshot.labels:
+            return []
+        return paginate(self.snapshot.closure.descendants(identifier), limit, offset)
+
+    def descendants_many(self, identifiers):
+        return { identifier : self.descendants(identifier) for identifier in identifiers }
+
+    def ancestors(self, identifier):
+        """ All levels above the input, including the input itself. """
+        if identifier not in self.snapshot.labels:
+            return []
+        return self.snapshot.closure.ancestors(identifier)
+
+    def ancestors_many(self, identifiers):
+        return { identifier : self.ancestors(identifier) for identifier in identifiers }
+
+    def xrefs(self, identifier):
+        """ Get external references. """
+        return list(self.snapshot.xrefs.get(identifier, ()))
+
+    def xrefs_many(self, identifiers):
+        return { identifier : self.xrefs(identifier) for identifier in identifiers }
+
+    def synonyms(self, identifier, curie_pattern=None):
+        """ Get synonyms, exact before related to match the SPARQL backend. """
+        synonyms = self.snapshot.synonyms.get(identifier, ())
+        return [ { 'desc' : desc, 'scope' : scope } for scope_order in ('EXACT', 'RELATED')
+                 for desc, scope, xrefs in synonyms if scope == scope_order ]
+
+    def synonyms_many(self, identifiers):
+        return { identifier : self.synonyms(identifier) for identifier in identifiers }
+
+    def search(self, text, is_regex=False, ignore_case=True, limit=None, offset=0):
+        """ Search labels, definitions and synonyms, treating text as a regular expression if indicated. """
+        return paginate(self.text_index.search(text, is_regex, ignore_case), limit, offset)
+
+    def search_words(self, text, limit=None):
+        """ Search labels, definitions and synonyms for words, word* prefixes and "quoted phrases". """
+        return self.text_index.match(text, limit)
+
+    def lookup(self, identifier):
+        """ Given an identifier, find ids in the ontology for which it is an xref. """
+        assert identifier and ':' in identifier, "Must provide a valid curie. Curie must have format " \
+                                                 "<PREFIX>:<ID>"
+        return [ {
+            'id'    : term_id,
+            'label' : self.snapshot.labels[term_id],
+            'xrefs' : list(self.snapshot.xrefs[term_id])
+        } for term_id in self.snapshot.xref_index.get(identifier, ()) ]
+
+    def lookup_many(self, identifiers):
+        return { identifier : self.lookup(identifier) for identifier in identifiers }
+
+    def id_list(self, identifier, limit=None, offset=0):
+        prefix = identifier.upper()
+        if not Curie_Resolver.has_prefix(prefix):
+            return []
+        prefix = f"{prefix}:"
+        ids = ( i for i in self.snapshot.labels if i.upper().startswith(prefix) )
+        return list(islice(ids, offset, None if limit is None else offset + limit))
+
+    def _matches(self, identifier, keys):
+        return [ self.resolve_uri(value) for key, value in self.snapshot.property_values.get(identifier, ())
+                 if key in keys ]
+
+    def exactMatch(self, identifier):
+        result = self._matches(identifier, EXACT_MATCH_KEYS)
+        seen = set(result)
+        for match in self.snapshot.equivalents.get(identifier, ()):
+            if match not in seen:
+                seen.add(match)
+                result.append(match)
+        return result
+
+    def closeMatch(self, identifier):
+        return self._matches(identifier, CLOSE_MATCH_KEYS)
+
+    def subterms(self, identifier):
+        return self.descendants(identifier)
+
+    def superterms(self, identifier):
+        return self.ancestors(identifier)
+
+    def parents(self, identifier):
+        """First generation ancestors"""
+        return list(self.snapshot.parents.get(identifier, ()))
+
+    def parents_many(self, identifiers):
+        return { identifier : self.parents(identifier) for identifier in identifiers }
+
+    def children(self, identifier):
+        """first generation descedants"""
+        return self.single_level_is_a(identifier)
+
+    def siblings(self, identifier):
+        """
+        Common parents
+        """
+        siblings = []
+        seen = { identifier }
+        for parent in self.parents(identifier):
+            for child in self.children(parent):
+                if child not in seen:
+                    seen.add(child)
+                    siblings.append(child)
+        return siblings
+
+    def _property_uri(self, key):
+        if '://' in key or ':' not in key:
+            return key
+        return Curie_Resolver.curie_to_uri(key) if key.split(':')[0] in Curie_Resolver.get_curie_to_uri_map() else key
+
+    def property_value(self, identifier, property_key):
+        """ Get properties """
+        response = [ value for key, value in self.snapshot.property_values.get(identifier, ())
+                     if self._property_uri(key) == property_key ]
+        if len(response) == 1:
+            return response[0]
+        else: return response
+
+    def all_properties(self, identifier, limit=None, offset=0):
+        """ Get ALL properties for a CURIE. A page holds limit property values, so one property's values
+        may continue on the next page. """
+        snapshot = self.snapshot
+        if identifier not in snapshot.labels:
+            return []
+        rows = []
+        def add(key, value):
+            if (key, value) not in rows:
+                rows.append((key, value))
+        add(LABEL_URI, snapshot.labels[identifier])
+        if identifier in snapshot.definitions:
+            add(DEFINITION_URI, snapshot.definitions[identifier])
+        for parent in snapshot.parents.get(identifier, ()):
+            add(SUBCLASS_OF_URI, Curie_Resolver.curie_to_uri(parent))
+        for xref in snapshot.xrefs.get(identifier, ()):
+            add(XREF_URI, xref)
+        for desc, scope, xrefs in snapshot.synonyms.get(identifier, ()):
+            if scope == 'EXACT':
+                add(EXACT_SYNONYM_URI, desc)
+            elif scope == 'RELATED':
+                add(RELATED_SYNONYM_URI, desc)
+        for key, value in snapshot.property_values.get(identifier, ()):
+            add(self._property_uri(key), value)
+        grouped = {}
+        for key, value in paginate(rows, limit, offset):
+            grouped.setdefault(key, { 'property_label' : None, 'property_values' : [], 'property_key' : key })
+            grouped[key]['property_values'].append(value)
+        return list(grouped.values())
@@ -4,6 +4,9 @@ from greent.util import LoggingUtil
 
 logger = LoggingUtil.init_logging(__name__)
 
+# Identifiers per POST to the onto batch routes.
+BATCH_SIZE = 1000
+
 class Onto(CachedService):
     """ An abstraction for generic questions about ontologies. """
     def __init__(self, name, context):
@@ -16,16 +19,33 @@ class Onto(CachedService):
         obj = self.get(f"{self.url}/is_a/{identifier}/{candidate_ancestor}/")
         #print (f"obj: {json.dumps(obj, indent=2)}")
         return obj is not None and 'is_a' in obj and obj['is_a']
+    def is_a_many(self, pairs):
+        """ Map each (identifier, candidate_ancestor) pair to whether the identifier is_a the ancestor. """
+        pairs = list(dict.fromkeys(pairs))
+        def fetch_many(missing):
+            fetched = {}
+            for chunk in self.chunks(missing):
+                results = self.post(f"{self.url}/is_a", { 'pairs' : [ { 'id' : i, 'ancestors' : a } for i, a in chunk ] })
+                fetched.update(zip(chunk, results))
+            return fetched
+        objs = self.get_many({ pair : f"{self.url}/is_a/{pair[0]}/{pair[1]}/" for pair in pairs }, fetch_many)
+        return { pair : obj is not None and 'is_a' in obj and obj['is_a'] for pair, obj in objs.items() }
     def get_label(self,identifier):
         """ Get the label for an identifier. """
         obj = self.get(f"{self.url}/label/{identifier}")
         return obj['label'] if 'label' in obj else None
-    def search(self,name,is_regex=False, full=False):
-        """ Search ontologies for a term. """
+    def get_labels(self, identifiers):
+        """ Map identifiers to labels. """
+        objs = self.get_many({ i : f"{self.url}/label/{i}" for i in identifiers },
+                             lambda missing : { i : { 'id' : i, 'label' : label }
+                                                for i, label in self.post_batch('label', missing).items() })
+        return { i : obj['label'] if 'label' in obj else None for i, obj in objs.items() }
+    def search(self,name,is_regex=True, full=False, timeout=None):
+        """ Search ontologies for a term, as a regular expression unless is_regex is False. """
         url = f"{self.url}/search/{name}"
-        params = {'regex' : 'true'}
+        params = {'regex' : 'true' if is_regex else 'false'}
         headers = {'Accept' : 'application/json'}
-        obj = self.get(url, params, headers)
+        obj = self.get(url, params, headers, timeout)
         results = []
         if full:
             results = obj['values'] if 'values' in obj else []
@@ -35,14 +55,22 @@ class Onto(CachedService):
     def get_xrefs(self,identifier, filter=None):
         """ Get external references. Optionally filter results. """
         obj = self.get(f"{self.url}/xrefs/{identifier}")
+        return self.filter_xrefs(obj, filter)
+    def get_xrefs_many(self, identifiers, filter=None):
+        """ Map identifiers to their external references. Optionally filter results. """
+        objs = self.get_many({ i : f"{self.url}/xrefs/{i}" for i in identifiers },
+                             lambda missing : { i : { 'xrefs' : xrefs }
+                                                for i, xrefs in self.post_batch('xrefs', missing).items() })
+        return { i : self.filter_xrefs(obj, filter) for i, obj in objs.items() }
+    def filter_xrefs(self, obj, filter=None):
         result = []
         if 'xrefs' in obj:
             for xref in obj['xrefs']:
                 if filter:
+                    xref_id = xref['id'] if isinstance(xref, dict) else xref
                     for f in filter:
-                        if 'id' in xref:
-                            if xref['id'].startswith(f):
-                                result.append (xref['id'])
+                        if xref_id.startswith(f):
+                            result.append (xref_id)
                 else:
                     result.append (xref)
         return result
@@ -51,3 +79,18 @@ class Onto(CachedService):
     def lookup(self,identifier):
         obj = self.get(f"{self.url}/lookup/{identifier}")
         return [ ref["id"] for ref in obj['refs'] ] if 'refs' in obj else []
+    def lookup_many(self, identifiers):
+        """ Map identifiers to the ids of the terms that reference them. """
+        objs = self.get_many({ i : f"{self.url}/lookup/{i}" for i in identifiers },
+                             lambda missing : { i : { 'refs' : refs }
+                                                for i, refs in self.post_batch('lookup', missing).items() })
+        return { i : [ ref["id"] for ref in obj['refs'] ] if 'refs' in obj else [] for i, obj in objs.items() }
+    def post_batch(self, route, identifiers):
+        """ Post identifiers to one of the onto batch routes, BATCH_SIZE at a time. """
+        result = {}
+        for chunk in self.chunks(identifiers):
+            result.update(self.post(f"{self.url}/{route}", { 'curies' : chunk }))
+        return result
+    def chunks(self, items):
+        items = list(items)
+        return [ items[start:start + BATCH_SIZE] for start in range(0, len(items), BATCH_SIZE) ]
@@ -3,6 +3,7 @@ import networkx
 import obonet
 import re
 import logging
+import hashlib
 from orderedset import OrderedSet
 from greent.util import LoggingUtil, Curie_Resolver
 from greent.service import Service
@@ -10,105 +11,333 @@ from pronto.relationship import Relationship
 from greent.servicecontext import ServiceContext
 from flask import jsonify
 from greent.triplestore import TripleStore
-from SPARQLWrapper import SPARQLWrapper, JSON
-from functools import reduce
+from greent.services.local_ontology import load_snapshot, paginate
+from greent.textindex import TextIndex
 
 logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
 
+LABEL_QUERY = """
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            SELECT DISTINCT ?labels
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {    
+               $identifier rdfs:label ?labels.               
+            }
+        """
+
+IS_A_QUERY = """
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            SELECT DISTINCT ?ancestor
+            FROM <http://reasoner.renci.org/ontology/closure>
+            FROM <http://reasoner.renci.org/ontology>
+            WHERE {
+                VALUES ?ancestor { $ancestors }
+                $identifier rdfs:subClassOf ?ancestor.
+            }
+            """
+
+CHILDREN_QUERY = """
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?descendant ?descendant_id
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {    
+              ?descendant rdfs:subClassOf  $identifier
+              OPTIONAL {                
+                ?descendant ID: ?descendant_id
+              }
+            }
+            """
+
+PREFIX_NAME = re.compile(r'(?<![\w.-])([A-Za-z][\w.-]*):')
+DECLARED_PREFIX = re.compile(r'PREFIX\s+([\w.-]*):', re.IGNORECASE)
+
+def row_curies(rows, variable, resolve_uri=Curie_Resolver.uri_to_curie):
+    """ The CURIE bound to variable in each row, once each, in row order. The oboInOwl id bound to
+    variable_id is preferred, falling back to contracting the IRI. """
+    id_variable = f"{variable}_id"
+    return list(dict.fromkeys(row[id_variable] if id_variable in row else resolve_uri(row[variable]) for row in rows))
+
+def page_clause(order, limit=None, offset=0):
+    """ ORDER BY, LIMIT and OFFSET clauses selecting one page of a query's results, or nothing for all of them. """
+    if limit is None and not offset:
+        return ''
+    clause = f"ORDER BY {order}"
+    if limit is not None:
+        clause += f" LIMIT {int(limit)}"
+    if offset:
+        clause += f" OFFSET {int(offset)}"
+    return clause
+
+DESCENDANTS_QUERY = """
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?descendant ?descendant_id
+            FROM <http://reasoner.renci.org/ontology/closure>
+            WHERE {    
+                ?descendant rdfs:subClassOf $identifier.
+                OPTIONAL { ?descendant ID: ?descendant_id. }
+            }
+            """
+
+ANCESTORS_QUERY = """
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?ancestor ?ancestor_id
+            FROM <http://reasoner.renci.org/ontology/closure>
+            WHERE {    
+                $identifier  rdfs:subClassOf ?ancestor.
+                OPTIONAL {
+                    ?ancestor ID: ?ancestor_id.
+                }
+            }
+            """
+
+XREFS_QUERY = """prefix xref: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        SELECT DISTINCT ?xrefs
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {    
+                $identifier xref: ?xrefs
+            }
+        """
+
+LOOKUP_QUERY = """
+        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        PREFIX LABEL: <http://www.w3.org/2000/01/rdf-schema#label>
+        PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+                SELECT DISTINCT  ?xrefs ?term_id ?term_label
+                    FROM     <http://reasoner.renci.org/ontology>
+                    WHERE {
+                    ?term XREF: ?o;
+                            XREF: ?xrefs;
+                            ID: ?term_id;
+                            LABEL: ?term_label.
+                    FILTER(?o = '$identifier' && !isBlank(?term)).               
+                    } 
+        """
+
+PARENTS_QUERY = """PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?parent ?parent_id
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {    
+             $identifier  rdfs:subClassOf  ?parent.
+             OPTIONAL {
+                 ?parent ID: ?parent_id
+             } 
+            FILTER(!isBlank(?parent))
+            }"""
+
+SYNONYMS_QUERY = """
+        PREFIX RELATED_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasRelatedSynonym>
+        PREFIX EXACT_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasExactSynonym>
+        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        PREFIX DEFENITION: <http://purl.obolibrary.org/obo/IAO_0000115>
+        SELECT DISTINCT ?desc ?xref ?defn
+        WHERE {
+            $identifier $predicate ?desc.
+            OPTIONAL {
+                ?desc XREF: ?xref.
+                ?desc DEFENITION: ?defn.
+             }
+        }
+        """
+
+VERSION_QUERY = """
+        PREFIX owl: <http://www.w3.org/2002/07/owl#>
+        SELECT DISTINCT ?version
+        FROM <http://reasoner.renci.org/ontology>
+        WHERE {
+            ?ontology a owl:Ontology ;
+                      owl:versionIRI ?version .
+        }
+        """
+
 class GenericOntology(Service):
     """ Sure, don't just dig around in obo files they say. But when the SPARQL is dry, we will drink straight from the obo if need be. """
 
     def __init__(self, context, obo):
         """ Load an obo file. """
         super(GenericOntology, self).__init__("go", context)
-        self.url = context.config.get_service ('uberongraph').get("url", None)
-        self.triplestore = TripleStore(self.url)
-        self.sparql_wrapper = SPARQLWrapper(self.url)
-        curie_prefix_map = Curie_Resolver.get_curie_to_uri_map()
+        uberongraph = context.config.get_service ('uberongraph')
+        self.url = uberongraph.get("url", None)
+        self.triplestore = TripleStore(self.url,
+                                       timeout = float(uberongraph.get("timeout", 60)),
+                                       pool_size = int(uberongraph.get("pool_size", 10)))
         self.resolve_uri = Curie_Resolver.uri_to_curie
-        self.ontology_prefixes = list(map(lambda x : f'PREFIX {x}: <{curie_prefix_map[x]}>', curie_prefix_map))
-
-
-    def add_sparql_prefixes(self, query_template):
-        return  '\n'.join(self.ontology_prefixes) + '\n' + query_template
+        self.batch_size = int(uberongraph.get("batch_size", 500))
+        self.text_index = None
+        if str(uberongraph.get("text_index", False)).lower() == 'true':
+            # Built before serving, so a process answers every search from the same source.
+            self.load_text_index()
+
+    def load_text_index(self):
+        """ Index the text of the local_ontology snapshots for search. If that fails, searches go to
+        Uberongraph for the life of the process. """
+        try:
+            self.text_index = TextIndex(load_snapshot(self.context.config.get_service('local_ontology')))
+        except Exception as e:
+            logger.error(f"unable to build the text index: {e}")
+
+
+    def add_sparql_prefixes(self, query_template, inputs={}):
+        """ Declare the known prefixes a query and its inputs use and don't declare themselves. Only those
+        used are declared, so a large prefix map doesn't bloat every query. """
+        text = query_template + ' ' + ' '.join(str(value) for value in inputs.values())
+        declared = set(DECLARED_PREFIX.findall(query_template))
+        used = sorted(set(PREFIX_NAME.findall(text)) - declared)
+        declarations = [ f'PREFIX {prefix}: <{Curie_Resolver.namespace(prefix)}>' for prefix in used
+                         if Curie_Resolver.namespace(prefix) ]
+        return '\n'.join(declarations) + '\n' + query_template
 
     def run_sparql_query_raw(self, query):
         query = self.add_sparql_prefixes(query)
-        self.sparql_wrapper.setQuery(query)
-        self.sparql_wrapper.setReturnFormat(JSON)
-        results = self.sparql_wrapper.query().convert()
-        return results
+        return self.triplestore.execute_query(query)
 
-    def query_sparql(self, query_template, inputs, outputs):
+    def query_sparql(self, query_template, inputs, outputs, post=False):
         # prepend prefixes here to avoid every one doing the same thing
-        q = self.add_sparql_prefixes(query_template)
+        q = self.add_sparql_prefixes(query_template, inputs)
         logger.error(q)
         return self.triplestore.query_template(
             template_text = q,
             inputs = inputs,
-            outputs = outputs
+            outputs = outputs,
+            post = post
         )
 
+    def query_sparql_many(self, query_template, identifiers, outputs, literal=False):
+        """ Run a query once per chunk of identifiers, bound through `VALUES ?identifier { $identifiers }`.
+        Rows are grouped by the requested identifier, in request order. Identifiers are bound as IRIs,
+        or as plain strings when literal is set. """
+        identifiers = list(dict.fromkeys(identifiers))
+        grouped = { identifier : [] for identifier in identifiers }
+        for start in range(0, len(identifiers), self.batch_size):
+            chunk = identifiers[start:start + self.batch_size]
+            if literal:
+                keys = { identifier : identifier for identifier in chunk }
+                values = ' '.join('"{}"'.format(identifier.replace('\\', '\\\\').replace('"', '\\"')) for identifier in chunk)
+            else:
+                keys = { Curie_Resolver.curie_to_uri(identifier) : identifier for identifier in chunk }
+                values = ' '.join(f'<{uri}>' for uri in keys)
+            rows = self.query_sparql(
+                query_template,
+                inputs = {
+                    'identifiers': values
+                },
+                outputs = [ 'identifier' ] + outputs,
+                post = True
+            )
+            for row in rows:
+                identifier = keys.get(row.pop('identifier', None))
+                if identifier is not None:
+                    grouped[identifier].append(row)
+        return grouped
+
+
+    def version(self):
+        """ Identify the Uberongraph build by a digest of the version IRIs of the ontologies it holds. """
+        rows = self.query_sparql(VERSION_QUERY, inputs = {}, outputs = [ 'version' ])
+        versions = sorted(row['version'] for row in rows)
+        return hashlib.sha1('\n'.join(versions).encode('utf-8')).hexdigest()[:12]
 
     def label(self,identifier):
         """Return the label for an identifier"""
-        query_text = f"""
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            SELECT DISTINCT ?labels
-            FROM     <http://reasoner.renci.org/ontology>
-            WHERE {{    
-               $identifier rdfs:label ?labels.               
-            }}
-        """
         results = self.query_sparql(
-            query_text,
+            LABEL_QUERY,
             inputs = {
                 'identifier': identifier
             },
             outputs = ['labels']
         )
         return results[0]["labels"] if len(results) > 0 else ''
+
+    def label_many(self, identifiers):
+        """ Return a map of identifier to label. """
+        query_text = """
+        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            SELECT DISTINCT ?identifier ?labels
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {
+               VALUES ?identifier { $identifiers }
+               ?identifier rdfs:label ?labels.
+            }
+        """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'labels' ])
+        return { identifier : rows[0]['labels'] if len(rows) > 0 else '' for identifier, rows in grouped.items() }
         
  
     def is_a(self,identifier, ancestors):
-        """Determine whether a term has a particular ancestor"""
-        query_template =lambda ancestor: f"""
+        """Determine whether a term has any of the comma separated ancestors, checking them all in one query."""
+        candidates, uris = self.is_a_candidates(ancestors)
+        if len(candidates) == 0:
+            return False, []
+        response = self.query_sparql(
+            IS_A_QUERY,
+            inputs = {
+                'identifier': identifier,
+                'ancestors': ' '.join(f'<{uri}>' for uri in uris)
+            },
+            outputs = [ 'ancestor' ]
+        )
+        return self.is_a_result(candidates, uris, response)
+
+    def is_a_candidates(self, ancestors):
+        """ The candidate ancestors in a comma separated string, and a map of their uris back to them. """
+        candidates = [ ancestor.strip(' ') for ancestor in ancestors.split(',') if ancestor.strip(' ') ]
+        return candidates, { Curie_Resolver.curie_to_uri(ancestor) : ancestor for ancestor in candidates }
+
+    def is_a_result(self, candidates, uris, rows):
+        """ Whether any candidate was found among the ancestor rows, and those found, in candidate order. """
+        found = { uris[row['ancestor']] for row in rows if row['ancestor'] in uris }
+        result = [ ancestor for ancestor in candidates if ancestor in found ]
+        return len(result) > 0, result
+
+    def is_a_many(self, pairs):
+        """ Check many (identifier, ancestors) pairs, where ancestors is a list or a comma separated string.
+        Every identifier/ancestor combination is bound in a single VALUES block per chunk of batch_size. """
+        candidates = [ (identifier, [ a.strip(' ') for a in (ancestors.split(',') if isinstance(ancestors, str) else ancestors) if a.strip(' ') ])
+                       for identifier, ancestors in pairs ]
+        combinations = list(dict.fromkeys(
+            (Curie_Resolver.curie_to_uri(identifier), Curie_Resolver.curie_to_uri(ancestor))
+            for identifier, ancestors in candidates for ancestor in ancestors))
+        query_text = """
             PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            ASK
+            SELECT DISTINCT ?identifier ?ancestor
             FROM <http://reasoner.renci.org/ontology/closure>
             FROM <http://reasoner.renci.org/ontology>
-            WHERE {{    
-                {identifier} rdfs:subClassOf {ancestor}.               
-            }}
+            WHERE {
+                VALUES (?identifier ?ancestor) { $pairs }
+                ?identifier rdfs:subClassOf ?ancestor.
+            }
             """
-        result = []
-        for ancestor in ancestors.split(','):
-            ancestor = ancestor.strip(' ')
-            response = self.run_sparql_query_raw(
-                query_template(ancestor)
-            )            
-            if response['boolean']:
-                result.append(ancestor)        
-        is_a = len(result) > 0
-        return is_a , result
+        found = set()
+        for start in range(0, len(combinations), self.batch_size):
+            chunk = combinations[start:start + self.batch_size]
+            rows = self.query_sparql(
+                query_text,
+                inputs = {
+                    'pairs': ' '.join(f'(<{i}> <{a}>)' for i, a in chunk)
+                },
+                outputs = [ 'identifier', 'ancestor' ],
+                post = True
+            )
+            found.update((row['identifier'], row['ancestor']) for row in rows)
+        response = []
+        for identifier, ancestors in candidates:
+            uri = Curie_Resolver.curie_to_uri(identifier)
+            result = [ a for a in ancestors if (uri, Curie_Resolver.curie_to_uri(a)) in found ]
+            response.append({
+                'id'        : identifier,
+                'is_a'      : len(result) > 0,
+                'ancestors' : result
+            })
+        return response
         
 
     def single_level_is_a(self, identifier):
         """ Get single-level 'is_a' descendants. """
-        query_text = """
-            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
-            SELECT DISTINCT ?descendant ?descendant_id
-            FROM     <http://reasoner.renci.org/ontology>
-            WHERE {    
-              ?descendant rdfs:subClassOf  $identifier
-              OPTIONAL {                
-                ?descendant ID: ?descendant_id
-              }
-            }
-            """     
         results = self.query_sparql(
-            query_text,
+            CHILDREN_QUERY,
             inputs = {
                 'identifier': identifier
             },
@@ -117,24 +346,31 @@ class GenericOntology(Service):
                 'descendant_id'
             ]
         )      
-        response_curies = reduce(lambda x, y: x + [y['descendant_id'] if 'descendant_id' in y else self.resolve_uri(y['descendant'])], results, [])
-        return response_curies
-
+        return row_curies(results, 'descendant', self.resolve_uri)
 
-    def descendants (self, identifier):
-        """ This is also known as a recursive-'is_a' function, returning all levels below the input"""        
-        query_text = f"""
+    def children_many(self, identifiers):
+        """ Map each identifier to its single-level 'is_a' descendants. """
+        query_text = """
             PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
             PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
-            SELECT DISTINCT ?descendant ?descendant_id
-            FROM <http://reasoner.renci.org/ontology/closure>
-            WHERE {{    
-                ?descendant rdfs:subClassOf $identifier.
-                OPTIONAL {{ ?descendant ID: ?descendant_id. }}
-            }}
+            SELECT DISTINCT ?identifier ?descendant ?descendant_id
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {
+              VALUES ?identifier { $identifiers }
+              ?descendant rdfs:subClassOf ?identifier
+              OPTIONAL {
+                ?descendant ID: ?descendant_id
+              }
+            }
             """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'descendant', 'descendant_id' ])
+        return { identifier : row_curies(rows, 'descendant', self.resolve_uri) for identifier, rows in grouped.items() }
+
+
+    def descendants (self, identifier, limit=None, offset=0):
+        """ This is also known as a recursive-'is_a' function, returning all levels below the input"""        
         results = self.query_sparql(
-            query_template = query_text,
+            query_template = DESCENDANTS_QUERY + page_clause('?descendant', limit, offset),
             inputs = {
                 'identifier': identifier
             },
@@ -143,27 +379,29 @@ class GenericOntology(Service):
                 'descendant_id'
             ]
         )
-        
-        result_list = reduce(lambda x, y : x + [y['descendant_id'] if 'descendant_id' in y else self.resolve_uri(y['descendant'])], results, [])
-        return result_list
-    
+        return row_curies(results, 'descendant', self.resolve_uri)
 
-    def ancestors(self, identifier):
-         """ This is also known as a recursive-'is_a' function, returning all levels below the input"""        
-         query_text = f"""
+    def descendants_many(self, identifiers):
+        """ Map each identifier to all levels of 'is_a' descendants. """
+        query_text = """
             PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
             PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
-            SELECT DISTINCT ?ancestor ?ancestor_id
+            SELECT DISTINCT ?identifier ?descendant ?descendant_id
             FROM <http://reasoner.renci.org/ontology/closure>
-            WHERE {{    
-                $identifier  rdfs:subClassOf ?ancestor.
-                OPTIONAL {{
-                    ?ancestor ID: ?ancestor_id.
-                }}
-            }}
+            WHERE {
+                VALUES ?identifier { $identifiers }
+                ?descendant rdfs:subClassOf ?identifier.
+                OPTIONAL { ?descendant ID: ?descendant_id. }
+            }
             """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'descendant', 'descendant_id' ])
+        return { identifier : row_curies(rows, 'descendant', self.resolve_uri) for identifier, rows in grouped.items() }
+    
+
+    def ancestors(self, identifier):
+         """ This is also known as a recursive-'is_a' function, returning all levels below the input"""        
          results = self.query_sparql(
-            query_template = query_text,
+            query_template = ANCESTORS_QUERY,
             inputs = {
                 'identifier': identifier
             },
@@ -172,21 +410,31 @@ class GenericOntology(Service):
                 'ancestor_id'
             ]
          )
-         result_list = reduce(lambda x, y : x + [y['ancestor_id'] if 'ancestor_id' in y else self.resolve_uri(y['ancestor'])], results, [])
-         return result_list
+         return row_curies(results, 'ancestor', self.resolve_uri)
+
+    def ancestors_many(self, identifiers):
+        """ Map each identifier to all levels of 'is_a' ancestors. """
+        query_text = """
+            PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?identifier ?ancestor ?ancestor_id
+            FROM <http://reasoner.renci.org/ontology/closure>
+            WHERE {
+                VALUES ?identifier { $identifiers }
+                ?identifier rdfs:subClassOf ?ancestor.
+                OPTIONAL {
+                    ?ancestor ID: ?ancestor_id.
+                }
+            }
+            """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'ancestor', 'ancestor_id' ])
+        return { identifier : row_curies(rows, 'ancestor', self.resolve_uri) for identifier, rows in grouped.items() }
 
 
     def xrefs(self, identifier):
         """ Get external references. """
-        query_text = f"""prefix xref: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
-        SELECT DISTINCT ?xrefs
-            FROM     <http://reasoner.renci.org/ontology>
-            WHERE {{    
-                $identifier xref: ?xrefs
-            }}
-        """
         results = self.query_sparql(
-            query_template = query_text,
+            query_template = XREFS_QUERY,
             inputs = {
                 'identifier': identifier
             },
@@ -194,54 +442,79 @@ class GenericOntology(Service):
                 'xrefs'
             ]
         )
-        results = reduce(lambda x, y : x + [y['xrefs']], results, [])
-        return results
+        return [ row['xrefs'] for row in results ]
+
+    def xrefs_many(self, identifiers):
+        """ Map each identifier to its external references. """
+        query_text = """prefix xref: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        SELECT DISTINCT ?identifier ?xrefs
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {
+                VALUES ?identifier { $identifiers }
+                ?identifier xref: ?xrefs
+            }
+        """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'xrefs' ])
+        return { identifier : [ y['xrefs'] for y in rows ] for identifier, rows in grouped.items() }
     
 
     def synonyms(self, identifier, curie_pattern=None):
         """ Get synonyms. """
-        query_template = lambda predicate: f"""
-        PREFIX RELATED_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasRelatedSynonym>
-        PREFIX EXACT_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasExactSynonym>
-        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
-        PREFIX DEFENITION: <http://purl.obolibrary.org/obo/IAO_0000115>
-        SELECT DISTINCT ?desc ?xref ?defn
-        WHERE {{
-            $identifier {predicate} ?desc.
-            OPTIONAL {{
-                ?desc XREF: ?xref.
-                ?desc DEFENITION: ?defn.
-             }}
-        }}
-        """
         exact = self.query_sparql(
-            query_template = query_template("EXACT_SYNONYM:"),
+            query_template = SYNONYMS_QUERY,
             inputs = { 
-                'identifier': identifier
+                'identifier': identifier,
+                'predicate': "EXACT_SYNONYM:"
             }, outputs = [
                 'desc',
                 'xref',
                 'defn'
             ]
         )
-        for row in exact:
-            row['scope'] = 'EXACT'
         related =  self.query_sparql(
-            query_template = query_template("RELATED_SYNONYM:"),
+            query_template = SYNONYMS_QUERY,
             inputs = { 
-                'identifier': identifier
+                'identifier': identifier,
+                'predicate': "RELATED_SYNONYM:"
             }, outputs = [
                 'desc',
                 'xref',
                 'defn'
             ]
         )
+        return self.scoped_synonyms(exact, related)
+
+    def scoped_synonyms(self, exact, related):
+        """ Exact then related synonym rows, each marked with its scope. """
+        for row in exact:
+            row['scope'] = 'EXACT'
         for row in related:
             row['scope'] = 'RELATED'
         return exact + related
 
-    def search (self, text, is_regex=False, ignore_case=True):
-        """ Search for the text, treating it as a regular expression if indicated. """
+    def synonyms_many(self, identifiers):
+        """ Map each identifier to its synonyms, exact before related. """
+        query_text = """
+        PREFIX RELATED_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasRelatedSynonym>
+        PREFIX EXACT_SYNONYM: <http://www.geneontology.org/formats/oboInOwl#hasExactSynonym>
+        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        PREFIX DEFENITION: <http://purl.obolibrary.org/obo/IAO_0000115>
+        SELECT DISTINCT ?identifier ?desc ?xref ?defn ?scope
+        WHERE {
+            VALUES ?identifier { $identifiers }
+            VALUES (?predicate ?scope) { (EXACT_SYNONYM: "EXACT") (RELATED_SYNONYM: "RELATED") }
+            ?identifier ?predicate ?desc.
+            OPTIONAL {
+                ?desc XREF: ?xref.
+                ?desc DEFENITION: ?defn.
+             }
+        }
+        """
+        grouped = self.query_sparql_many(query_text, identifiers, outputs = [ 'desc', 'xref', 'defn', 'scope' ])
+        return { identifier : sorted(rows, key=lambda row: row['scope'] != 'EXACT') for identifier, rows in grouped.items() }
+
+    def search_query (self, text, is_regex=False, ignore_case=True):
+        """ Build the search query and the string to substitute into it. """
         search_string = text
         if is_regex and ignore_case: 
             filtr = f"""
@@ -305,8 +578,15 @@ class GenericOntology(Service):
             FILTER {filtr}.
         }}
         """
+        return query_text, search_string
+
+    def search (self, text, is_regex=False, ignore_case=True, limit=None, offset=0):
+        """ Search for the text, treating it as a regular expression if indicated. """
+        if self.text_index is not None:
+            return paginate(self.text_index.search(text, is_regex, ignore_case), limit, offset)
+        query_text, search_string = self.search_query(text, is_regex, ignore_case)
         response = self.query_sparql(
-            query_template = query_text,
+            query_template = query_text + page_clause('?id', limit, offset),
             inputs = {
                 'search_string': search_string
             }, outputs = [
@@ -319,28 +599,20 @@ class GenericOntology(Service):
         for row in response:
             row['id'] = Curie_Resolver.uri_to_curie(row['id'])
         return response
+
+    def search_words (self, text, limit=None):
+        """ Search for words, word* prefixes and "quoted phrases". Needs the text index. """
+        if self.text_index is None:
+            raise ValueError("Word search needs the text index; set text_index under uberongraph in greent.conf.")
+        return self.text_index.match(text, limit)
     
 
     def lookup(self, identifier):
         """ Given an identifier, find ids in the ontology for which it is an xref. """
         assert identifier and ':' in identifier, "Must provide a valid curie. Curie must have format " \
                                                  "<PREFIX>:<ID>"
-        query_template = """
-        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
-        PREFIX LABEL: <http://www.w3.org/2000/01/rdf-schema#label>
-        PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
-                SELECT DISTINCT  ?xrefs ?term_id ?term_label
-                    FROM     <http://reasoner.renci.org/ontology>
-                    WHERE {
-                    ?term XREF: ?o;
-                            XREF: ?xrefs;
-                            ID: ?term_id;
-                            LABEL: ?term_label.
-                    FILTER(?o = '$identifier' && !isBlank(?term)).               
-                    } 
-        """
         result = self.query_sparql(
-            query_template = query_template,
+            query_template = LOOKUP_QUERY,
             inputs= {
                 'identifier': identifier
             }, outputs = [
@@ -349,28 +621,48 @@ class GenericOntology(Service):
                 'term_label'
             ]
         )
-        response = []
-        buffer = {}
-        for row in result:
-            if row['term_id'] not in buffer:
-                buffer[row['term_id']] = {
-                    'label': row['term_label'],
-                    'xrefs': []
-                }
-            xref = row['xrefs']
-            buffer[row['term_id']]['xrefs'] += [row['xrefs']]  if row['xrefs'] not in buffer[row['term_id']]['xrefs'] else [] 
-        for term_id in buffer:
-            response.append({
-                'id': term_id,
-                'label': buffer[term_id]['label'],
-                'xrefs': buffer[term_id]['xrefs']
+        return self.lookup_terms(result)
 
-            })           
-        return response
+    def lookup_terms(self, rows):
+        """ Group lookup rows by term, listing each term's xrefs once. """
+        buffer = {}
+        for row in rows:
+            term = buffer.get(row['term_id'])
+            if term is None:
+                # xrefs are gathered as dict keys to drop duplicates without searching a list.
+                term = buffer[row['term_id']] = { 'id': row['term_id'], 'label': row['term_label'], 'xrefs': {} }
+            term['xrefs'][row['xrefs']] = None
+        for term in buffer.values():
+            term['xrefs'] = list(term['xrefs'])
+        return list(buffer.values())
+
+    def lookup_many(self, identifiers):
+        """ Map each identifier to the ids in the ontology for which it is an xref. """
+        for identifier in identifiers:
+            assert identifier and ':' in identifier, "Must provide a valid curie. Curie must have format " \
+                                                     "<PREFIX>:<ID>"
+        query_template = """
+        PREFIX XREF: <http://www.geneontology.org/formats/oboInOwl#hasDbXref>
+        PREFIX LABEL: <http://www.w3.org/2000/01/rdf-schema#label>
+        PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+                SELECT DISTINCT ?identifier ?xrefs ?term_id ?term_label
+                    FROM     <http://reasoner.renci.org/ontology>
+                    WHERE {
+                    VALUES ?identifier { $identifiers }
+                    ?term XREF: ?identifier;
+                            XREF: ?xrefs;
+                            ID: ?term_id;
+                            LABEL: ?term_label.
+                    FILTER(!isBlank(?term)).
+                    }
+        """
+        grouped = self.query_sparql_many(query_template, identifiers,
+                                         outputs = [ 'xrefs', 'term_id', 'term_label' ], literal=True)
+        return { identifier : self.lookup_terms(rows) for identifier, rows in grouped.items() }
 
 
-    def id_list(self, identifier):
-        identifier_uri = Curie_Resolver.get_curie_to_uri_map().get(identifier.upper(), None)
+    def id_list(self, identifier, limit=None, offset=0):
+        identifier_uri = Curie_Resolver.namespace(identifier)
         if identifier_uri == None:
             return []
         query = f"""
@@ -386,6 +678,7 @@ class GenericOntology(Service):
                             ?term ID: ?term_id #try to get the id from sparql else parse ?? 
                         }}
                         }} 
+                {page_clause('?term', limit, offset)}
                 """
         result = self.query_sparql(
             query_template = query,
@@ -396,8 +689,7 @@ class GenericOntology(Service):
                 'term_id'
             ]
         ) 
-        return reduce(lambda x, y: x + [y['term_id'] if 'term_id' in y else self.resolve_uri(y['term'])], result, [])
-       
+        return row_curies(result, 'term', self.resolve_uri)
 
 
     def exactMatch(self, identifier):
@@ -416,25 +708,18 @@ class GenericOntology(Service):
                      FILTER (!isBlank(?match)) #This sometimes returns blank nodes         
                     }} 
             """
-        result = reduce(lambda x, y: x + [y['match_id'] if 'match_id' in y else self.resolve_uri(y['match'])], self.query_sparql(
-            query_template = query_string('EXACT_MATCH:'),
-            inputs = {
-                'identifier': identifier
-            }, outputs = [
-                'match',
-                'match_id'
-            ]
-        ), [])
-        result += list(filter( lambda x : x not in result, reduce(lambda x, y: x + [y['match_id'] if 'match_id' in y else self.resolve_uri(y['match'])], self.query_sparql(
-            query_template = query_string('EQUIVALENT_CLASS:'),
-            inputs = {
-                'identifier': identifier
-            }, outputs = [
-                'match',
-                'match_id'
-            ]
-        ), [])))
-        return result
+        rows = []
+        for predicate in ('EXACT_MATCH:', 'EQUIVALENT_CLASS:'):
+            rows += self.query_sparql(
+                query_template = query_string(predicate),
+                inputs = {
+                    'identifier': identifier
+                }, outputs = [
+                    'match',
+                    'match_id'
+                ]
+            )
+        return row_curies(rows, 'match', self.resolve_uri)
 
 
     def closeMatch(self, identifier):
@@ -451,7 +736,7 @@ class GenericOntology(Service):
                      FILTER (!isBlank(?match)) #This sometimes returns blank nodes         
                     } 
         """
-        results = reduce( lambda x, y: x  + [y['match_id'] if 'match_id' in y else self.resolve_uri(y['match'])], self.query_sparql(
+        results = self.query_sparql(
             query_template = query_template,
             inputs = {
                 'identifier': identifier
@@ -459,8 +744,8 @@ class GenericOntology(Service):
                 'match',
                 'match_id'
             ]
-        ), [])
-        return results
+        )
+        return row_curies(results, 'match', self.resolve_uri)
 
    
     def subterms(self, identifier):
@@ -473,28 +758,33 @@ class GenericOntology(Service):
 
     def parents(self,identifier):
         """First generation ancestors"""
-        query_template = f"""PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
-            SELECT DISTINCT ?parent ?parent_id
-            FROM     <http://reasoner.renci.org/ontology>
-            WHERE {{    
-             $identifier  rdfs:subClassOf  ?parent.
-             OPTIONAL {{
-                 ?parent ID: ?parent_id
-             }} 
-            FILTER(!isBlank(?parent))
-            }}"""
-        result = reduce(lambda x, y: x + [y['parent_id'] if 'parent_id' in y else self.resolve_uri(y['parent'])],
-        self.query_sparql(
-            query_template = query_template,
+        results = self.query_sparql(
+            query_template = PARENTS_QUERY,
             inputs = {
                 'identifier': identifier
             }, outputs = [
                 'parent',
                 'parent_id'
             ]
-        ), [])
-        return result
+        )
+        return row_curies(results, 'parent', self.resolve_uri)
+
+    def parents_many(self, identifiers):
+        """ Map each identifier to its first generation ancestors. """
+        query_template = """PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+            PREFIX ID: <http://www.geneontology.org/formats/oboInOwl#id>
+            SELECT DISTINCT ?identifier ?parent ?parent_id
+            FROM     <http://reasoner.renci.org/ontology>
+            WHERE {
+             VALUES ?identifier { $identifiers }
+             ?identifier  rdfs:subClassOf  ?parent.
+             OPTIONAL {
+                 ?parent ID: ?parent_id
+             }
+            FILTER(!isBlank(?parent))
+            }"""
+        grouped = self.query_sparql_many(query_template, identifiers, outputs = [ 'parent', 'parent_id' ])
+        return { identifier : row_curies(rows, 'parent', self.resolve_uri) for identifier, rows in grouped.items() }
 
 
     def children(self, identifier):
@@ -507,11 +797,21 @@ class GenericOntology(Service):
         """
         Common parents 
         """
-        parents = self.parents(identifier)
-        sibilings = []
-        for parent in parents:
-            sibilings += list(filter(lambda x: x != identifier and x not in sibilings, self.children(parent if 'http' not in parent else f'<{parent}>')))
-        return sibilings
+        parents = [ self.parent_identifier(parent) for parent in self.parents(identifier) ]
+        return self.merge_siblings(identifier, [ self.children(parent) for parent in parents ])
+
+    def parent_identifier(self, parent):
+        """ A parent as an identifier to query by: a curie, or an IRI it couldn't be contracted from. """
+        return parent if 'http' not in parent else f'<{parent}>'
+
+    def merge_siblings(self, identifier, children):
+        """ The children of each parent, once each and in order, without identifier itself. """
+        siblings = {}
+        for children_of_parent in children:
+            for child in children_of_parent:
+                siblings[child] = None
+        siblings.pop(identifier, None)
+        return list(siblings)
 
 
     def property_value(self, identifier, property_key):
@@ -532,14 +832,15 @@ class GenericOntology(Service):
                 'property_value'
             ]
         )
-        response =  reduce(lambda x, y: x + [y['property_value']], result, [])
+        response = [ row['property_value'] for row in result ]
         if len(response) == 1:
             return response[0]
         else: return response
 
 
-    def all_properties(self, identifier):
-        """ Get ALL properties for a CURIE """
+    def all_properties(self, identifier, limit=None, offset=0):
+        """ Get ALL properties for a CURIE. A page holds limit property values, so one property's values
+        may continue on the next page. """
         query_template = """
         SELECT ?property_key ?property_value ?property_label
         FROM <http://reasoner.renci.org/ontology>
@@ -553,7 +854,7 @@ class GenericOntology(Service):
         }
         """
         results = self.query_sparql(
-            query_template = query_template,
+            query_template = query_template + page_clause('?property_key ?property_value', limit, offset),
             inputs = {
                 'identifier': identifier
             }, outputs = {
@@ -565,15 +866,15 @@ class GenericOntology(Service):
         # group it by property label for those which have label 
         grouped = {}
         for row in results: 
-            label = row['property_label'] if 'property_label' in row else None
             key = row['property_key']
-            if key not in grouped:
-                grouped[key] = {
-                    'property_label' : label,
-                    'property_values': []
+            group = grouped.get(key)
+            if group is None:
+                group = grouped[key] = {
+                    'property_label' : row.get('property_label'),
+                    'property_values': {},
+                    'property_key' : key
                 }
-            if row['property_value'] not in grouped[key]['property_values']:
-                grouped[key]['property_values'].append(row['property_value'])
-            for key in grouped:
-                grouped[key].update({'property_key': key})            
-        return list(map(lambda x : grouped[x], grouped))
+            group['property_values'][row['property_value']] = None
+        for group in grouped.values():
+            group['property_values'] = list(group['property_values'])
+        return list(grouped.values())
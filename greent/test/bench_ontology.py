@@ -0,0 +1,63 @@
+""" Micro-benchmark of GenericOntology's result shaping on large, canned SPARQL results.
+
+    python greent/test/bench_ontology.py [rows]
+
+Each operation is timed against the reduce/list-membership assembly it replaced. No SPARQL endpoint is
+used; query_sparql answers from rows built up front, so only the Python post-processing is measured. """
+import sys
+import time
+from functools import reduce
+from greent.services.ontology import GenericOntology
+from greent.util import Curie_Resolver
+
+def canned(rows):
+    """ A GenericOntology whose every query returns rows. """
+    ontology = GenericOntology.__new__(GenericOntology)
+    ontology.resolve_uri = Curie_Resolver.uri_to_curie
+    ontology.text_index = None
+    ontology.query_sparql = lambda query_template, inputs, outputs, post=False: rows
+    return ontology
+
+def reduce_descendants(ontology, rows):
+    return reduce(lambda x, y : x + [y['descendant_id'] if 'descendant_id' in y else ontology.resolve_uri(y['descendant'])], rows, [])
+
+def membership_properties(rows):
+    grouped = {}
+    for row in rows:
+        key = row['property_key']
+        if key not in grouped:
+            grouped[key] = { 'property_label' : row.get('property_label'), 'property_values': [] }
+        if row['property_value'] not in grouped[key]['property_values']:
+            grouped[key]['property_values'].append(row['property_value'])
+        for key in grouped:
+            grouped[key].update({'property_key': key})
+    return list(grouped.values())
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+def main(count):
+    # One row in ten lacks an oboInOwl id, so its IRI is contracted, as with real Uberongraph results.
+    rows = [ { 'descendant' : f'http://purl.obolibrary.org/obo/MONDO_{i:07}' } if i % 10 == 0 else
+             { 'descendant' : f'http://purl.obolibrary.org/obo/MONDO_{i:07}', 'descendant_id' : f'MONDO:{i:07}' }
+             for i in range(count) ]
+    ontology = canned(rows)
+    new, result = timed(ontology.descendants, 'MONDO:0000001')
+    old, expected = timed(reduce_descendants, ontology, rows)
+    assert result == expected
+    print(f"descendants     {count:>8} rows  single pass {new:8.3f}s  reduce {old:8.3f}s")
+
+    # Rows spread over 20 properties, each value of which appears twice.
+    rows = [ { 'property_key' : f'http://example.org/p{i % 20}', 'property_value' : f'value {i // 2}' }
+             for i in range(count) ]
+    ontology = canned(rows)
+    new, result = timed(ontology.all_properties, 'MONDO:0000001')
+    # The membership test is quadratic in the values per property, so it is timed on a tenth of the rows.
+    old, expected = timed(membership_properties, rows[:count // 10])
+    assert sum(len(p['property_values']) for p in result) == len({ (r['property_key'], r['property_value']) for r in rows })
+    print(f"all_properties  {count:>8} rows  single pass {new:8.3f}s  membership test on {count // 10} rows {old:8.3f}s")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
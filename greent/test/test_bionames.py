@@ -3,12 +3,13 @@ import pytest
 import requests
 import os
 import sys
+import time
 import traceback
 import logging
 from greent.service import Service
 from greent.servicecontext import ServiceContext
 from greent.services.bionames import BioNames
-from builder.lookup_utils import chemical_ids_from_drug_names
+from builder.lookup_utils import chemical_ids_from_drug_names, ChemicalResolver
 
 @pytest.fixture(scope='module')
 def bionames():
@@ -443,3 +444,100 @@ def test_ID_to_label_lookup(bionames):
     hgnc_result = bionames.ID_to_label_lookup(hgnc_id)
     paired_results3 = zip(hgnc_result, hgnc_expected_result)
     assert any(x == y for x, y in paired_results3)
+
+# test 7
+def test_lookup_status(bionames, monkeypatch):
+    """
+    Validates that an unscoped lookup reports every source it queried,
+    with failing and slow sources as errors and timeouts, and gives
+    each source the deadline as its timeout.
+    """
+    timeouts = []
+    def onto(q, concept=None, max_edits=0, timeout=None):
+        timeouts.append(timeout)
+        return [ { 'id' : 'MONDO:0004979', 'label' : 'asthma', 'type' : 'disease' } ]
+    def monarch(q, concept, timeout=None):
+        timeouts.append(timeout)
+        if concept == 'gene':
+            raise ConnectionError("monarch is down")
+        return []
+    def chemical(q, concept, timeout=None):
+        time.sleep(2)
+        return []
+    monkeypatch.setattr(bionames, '_search_onto', onto)
+    monkeypatch.setattr(bionames, '_search_monarch', monarch)
+    monkeypatch.setitem(bionames.router_directory, 'chemical_substance', chemical)
+    result, status = bionames.lookup('asthma', deadline=0.5)
+    assert set(status.keys()) == { 'onto', 'chemical_substance' } | \
+        { f'monarch:{concept}' for concept, route in bionames.router_directory.items() if route == bionames._find }
+    assert status['onto']['status'] == 'ok' and status['onto']['count'] == 1
+    assert status['monarch:gene'] == { 'status' : 'error', 'error' : 'monarch is down' }
+    assert status['chemical_substance'] == { 'status' : 'timeout' }
+    assert set(timeouts) == { 0.5 }
+    assert [ x['id'] for x in result ] == [ 'MONDO:0004979' ]
+
+# test 8
+def test_chemical_resolver():
+    """
+    Validates that the chemical resolver merges sources by id, skips
+    CTD synonyms when CTD has an exact match, and reports sources
+    that are slow or failing without waiting on them.
+    """
+    def slow(name, timeout):
+        time.sleep(2)
+        return [ { 'id' : 'CHEBI:15365', 'label' : name } ]
+    def failing(name, timeout):
+        raise ValueError("not json")
+    resolver = ChemicalResolver(timeouts={ 'onto' : 0.2, 'pubchem' : 1, 'ctd' : 1, 'ctd_synonyms' : 1 },
+                                failure_threshold=1)
+    resolver.sources = {
+        'onto'         : slow,
+        'pubchem'      : lambda name, timeout : [ { 'id' : 'PUBCHEM:2244', 'label' : name } ],
+        'ctd'          : lambda name, timeout : [ { 'id' : 'MESH:D001241', 'label' : name }, { 'id' : 'PUBCHEM:2244', 'label' : name } ],
+        'ctd_synonyms' : failing
+    }
+    result, status = resolver.resolve('aspirin')
+    assert [ x['id'] for x in result ] == [ 'PUBCHEM:2244', 'MESH:D001241' ]
+    assert status == { 'onto' : 'timeout', 'pubchem' : 'ok', 'ctd' : 'ok', 'ctd_synonyms' : 'error' }
+    result, status = resolver.resolve('aspirin')
+    assert status['pubchem'] == 'cached' and status['ctd_synonyms'] == 'open'
+
+# test 9
+def test_merge(bionames):
+    """
+    Validates that results are merged by exact id across sources,
+    keeping provenance, a known type and the label matching the query.
+    """
+    onto = [ { 'id' : 'MONDO:1', 'label' : 'Asthma, bronchial' }, { 'id' : 'MONDO:10', 'label' : 'asthma attack' } ]
+    monarch = [ { 'id' : 'MONDO:1', 'label' : 'asthma', 'type' : 'disease' } ]
+    result = bionames._merge('Asthma', [ ('onto', onto), ('monarch', monarch) ])
+    assert result == [
+        { 'id' : 'MONDO:1', 'label' : 'asthma', 'type' : 'disease', 'sources' : [ 'onto', 'monarch' ] },
+        { 'id' : 'MONDO:10', 'label' : 'asthma attack', 'sources' : [ 'onto' ] }
+    ]
+    assert 'sources' not in onto[0]
+
+# test 10
+def test_merge_bare_ids(bionames):
+    """
+    Validates that bare ids, as CTD synonym matches used to be returned,
+    merge alongside results that are dicts.
+    """
+    result = bionames._merge('tylenol', [ ('chemical_substance', [ { 'id' : 'PUBCHEM:1', 'label' : 'x' }, 'MESH:D000082', 'PUBCHEM:1' ]) ])
+    assert result == [
+        { 'id' : 'PUBCHEM:1', 'label' : 'x', 'sources' : [ 'chemical_substance' ] },
+        { 'id' : 'MESH:D000082', 'label' : 'MESH:D000082', 'sources' : [ 'chemical_substance' ] }
+    ]
+
+# test 11
+def test_lookup_router_limit(bionames, monkeypatch):
+    """
+    Validates that only results labelled with the query itself are
+    kept when similar ones are excluded, and that limit applies after.
+    """
+    results = [ { 'id' : f'MONDO:{i}', 'label' : f'asthma {i}' } for i in range(60) ] + \
+              [ { 'id' : 'MONDO:0004979', 'label' : 'asthma' } ]
+    monkeypatch.setattr(bionames, 'lookup', lambda q, concept=None, max_edits=0: (results, {}))
+    assert bionames.lookup_router('asthma', 'disease', limit=50, include_similar=False) == [ results[-1] ]
+    assert len(bionames.lookup_router('asthma', 'disease', limit=50)) == 50
+    assert len(bionames.lookup_router('asthma', 'disease')) == 61
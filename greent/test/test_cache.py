@@ -0,0 +1,199 @@
+import pytest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from greent.cache import Cache, RedisCacheTier, JSONCacheSerializer, MsgpackCacheSerializer, SizedCache, estimate_size
+from greent.cachedservice import CachedService, cache_key
+from greent.servicecontext import ServiceContext
+from greent.services.cached_ontology import CachedOntology
+
+class CountingOntology:
+    """ A stand-in backend that records the questions it is asked. """
+    def __init__(self):
+        self.build = 'v1'
+        self.calls = []
+    def version(self):
+        return self.build
+    def label(self, identifier):
+        self.calls.append(('label', identifier))
+        return f"label of {identifier}"
+    def label_many(self, identifiers):
+        self.calls.append(('label_many', tuple(identifiers)))
+        return { identifier : f"label of {identifier}" for identifier in identifiers }
+
+@pytest.fixture()
+def cache_path(tmpdir):
+    return str(tmpdir.join("cache.sqlite"))
+
+# test 1
+def test_ttl(cache_path):
+    cache = Cache(cache_path=cache_path)
+    cache.set('short', [ 1, 2 ], ttl=0.01)
+    cache.set('long', [ 3 ])
+    time.sleep(0.05)
+    assert cache.get('short') is None
+    assert cache.get('long') == [ 3 ]
+
+# test 2
+def test_shared_disk_tier(cache_path):
+    Cache(cache_path=cache_path).set('MONDO:0005737', { 'label': 'Ebola hemorrhagic fever' })
+    assert Cache(cache_path=cache_path).get('MONDO:0005737') == { 'label': 'Ebola hemorrhagic fever' }
+    assert Cache().get('MONDO:0005737') is None
+
+# test 3
+def test_purge(cache_path):
+    cache = Cache(cache_path=cache_path)
+    cache.set('onto:v1:label', 'a')
+    cache.set('onto:v2:label', 'b')
+    cache.purge('onto:v1:')
+    assert cache.get('onto:v1:label') is None
+    assert Cache(cache_path=cache_path).get('onto:v1:label') is None
+    assert cache.get('onto:v2:label') == 'b'
+
+# test 4
+def test_cached_ontology(cache_path):
+    backend = CountingOntology()
+    ontology = CachedOntology(backend, Cache(cache_path=cache_path), version_interval=0)
+    assert ontology.label('MONDO:1') == ontology.label('MONDO:1') == 'label of MONDO:1'
+    assert ontology.label_many([ 'MONDO:1', 'MONDO:2' ]) == { 'MONDO:1' : 'label of MONDO:1',
+                                                             'MONDO:2' : 'label of MONDO:2' }
+    assert backend.calls == [ ('label', 'MONDO:1'), ('label_many', ('MONDO:1', 'MONDO:2')) ]
+    ontology.label_many([ 'MONDO:2', 'MONDO:3' ])
+    assert backend.calls[-1] == ('label_many', ('MONDO:3',))
+    backend.build = 'v2'
+    ontology.label('MONDO:1')
+    assert backend.calls[-1] == ('label', 'MONDO:1')
+
+# test 5
+def test_redis_tier():
+    tier = RedisCacheTier()
+    try:
+        tier.redis.ping()
+    except Exception:
+        pytest.skip("no redis server")
+    cache = Cache(use_redis=True)
+    cache.set_many({ 'test:onto:a' : [ 1 ], 'test:onto:b' : { 'x' : 2 } }, ttl=60)
+    assert Cache(use_redis=True).get_many([ 'test:onto:a', 'test:onto:b', 'test:onto:c' ]) == \
+        { 'test:onto:a' : [ 1 ], 'test:onto:b' : { 'x' : 2 } }
+    cache.purge('test:onto:')
+    assert Cache(use_redis=True).get('test:onto:a') is None
+
+# test 6
+@pytest.mark.parametrize('serializer', [ JSONCacheSerializer, MsgpackCacheSerializer ])
+def test_serializers(cache_path, serializer):
+    rows = [ { 'id' : f'MONDO:{i:07}', 'label' : 'disease', 'xrefs' : [ 'DOID:4325' ] } for i in range(500) ]
+    cache = Cache(cache_path=cache_path, serializer=serializer, compression='zlib')
+    cache.set('rows', rows)
+    assert Cache(cache_path=cache_path, serializer=serializer).get('rows') == rows
+    assert 0 < cache.stored_bytes()['SQLiteCacheTier'] == cache.bytes_written < len(serializer().dumps(rows))
+
+# test 7
+def test_sized_cache():
+    small = [ 'MONDO:0005737' ]
+    large = [ f'MONDO:{i:07}' for i in range(2000) ]
+    cache = SizedCache(max_bytes=estimate_size(large) + 20 * estimate_size(small))
+    cache.set('large', large)
+    for i in range(10):
+        cache.set(f'small{i}', list(small))
+        cache.get(f'small{i}')
+    cache.set('larger', large + small)
+    assert cache.get('large') is None
+    assert all(cache.get(f'small{i}') is not None for i in range(10))
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['resident_bytes'] <= stats['max_bytes']
+    cache.set('huge', large * 2)
+    assert cache.get('huge') is None
+
+# test 8
+def test_single_flight():
+    cache = Cache()
+    calls = []
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [ 'MONDO:0004979' ]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: cache.get_or_compute('asthma', compute), range(16)))
+    assert len(calls) == 1
+    assert all(result == [ 'MONDO:0004979' ] for result in results)
+    def fail():
+        raise ValueError("upstream down")
+    with pytest.raises(ValueError):
+        cache.get_or_compute('down', fail)
+    assert cache.get_or_compute('down', lambda : 'up') == 'up'
+
+class CountingService(CachedService):
+    """ A CachedService whose upstream answers from a dict and counts requests. """
+    def __init__(self, context, responses):
+        super(CountingService, self).__init__("counting", context)
+        self.responses = responses
+        self.fetched = []
+    def fetch(self, url, params=None, headers=None, timeout=None):
+        self.fetched.append(url)
+        return self.responses.get(url, [])
+
+# test 9
+def test_negative_and_stale():
+    context = ServiceContext.create_context()
+    context.cache = Cache()
+    service = CountingService(context, { 'http://onto/label/MONDO:1' : { 'label' : 'disease' } })
+    service.ttl = 0.05
+    service.negative_ttl = 0.05
+    service.stale_ttl = 60
+    assert service.get('http://onto/label/FOO:1') == []
+    assert service.get('http://onto/label/FOO:1') == []
+    assert service.fetched == [ 'http://onto/label/FOO:1' ]
+    assert service.get('http://onto/label/MONDO:1') == { 'label' : 'disease' }
+    time.sleep(0.1)
+    service.responses['http://onto/label/MONDO:1'] = { 'label' : 'disease or disorder' }
+    assert service.get('http://onto/label/MONDO:1') == { 'label' : 'disease' }
+    service.refresher.shutdown(wait=True)
+    assert service.get('http://onto/label/MONDO:1') == { 'label' : 'disease or disorder' }
+
+# test 10
+def test_cache_key():
+    url = 'https://onto.renci.org/search/asthma'
+    assert cache_key('GET', url, { 'regex' : 'true', 'limit' : 10 }, { 'Accept' : 'application/json', 'X-Trace' : '1' }) == \
+        cache_key('get', url, { 'limit' : '10', 'regex' : 'true' }, { 'accept' : 'application/json' })
+    assert cache_key('GET', url, { 'regex' : 'true' }) != cache_key('GET', url, { 'regex' : 'false' })
+    assert cache_key('GET', url, headers={ 'Accept' : 'application/json' }) != cache_key('GET', url)
+    assert cache_key('GET', 'http://a/b.c') != cache_key('GET', 'http://a/bc')
+
+# test 11
+def test_get_many():
+    context = ServiceContext.create_context()
+    context.cache = Cache()
+    responses = { f'http://onto/label/MONDO:{i}' : { 'label' : f'disease {i}' } for i in range(3) }
+    service = CountingService(context, responses)
+    batches = []
+    def fetch_many(identifiers):
+        batches.append(identifiers)
+        return { i : responses.get(f'http://onto/label/{i}', []) for i in identifiers }
+    assert service.get('http://onto/label/MONDO:0') == { 'label' : 'disease 0' }
+    urls = { i : f'http://onto/label/{i}' for i in [ 'MONDO:0', 'MONDO:1', 'MONDO:2', 'FOO:1' ] }
+    assert list(service.get_many(urls, fetch_many).keys()) == list(urls.keys())
+    assert batches == [ [ 'MONDO:1', 'MONDO:2', 'FOO:1' ] ]
+    assert service.get('http://onto/label/MONDO:2') == { 'label' : 'disease 2' }
+    assert service.get_many(urls, fetch_many)['FOO:1'] == []
+    assert len(batches) == 1 and service.fetched == [ 'http://onto/label/MONDO:0' ]
+
+# test 12
+def test_unavailable_tier_purge():
+    class DownTier:
+        def purge(self, prefix):
+            raise ConnectionError("redis is down")
+    cache = Cache()
+    cache.tiers.append(DownTier())
+    backend = CountingOntology()
+    ontology = CachedOntology(backend, cache, version_interval=0)
+    ontology.label('MONDO:1')
+    backend.build = 'v2'
+    assert ontology.label('MONDO:1') == 'label of MONDO:1'
+    assert ontology.version == 'v2'
+
+# test 13
+def test_unserializable(cache_path):
+    cache = Cache(cache_path=cache_path, serializer=JSONCacheSerializer)
+    cache.set_many({ 'set' : { 1, 2 }, 'list' : [ 1, 2 ] })
+    assert cache.get('set') == { 1, 2 }
+    assert Cache(cache_path=cache_path, serializer=JSONCacheSerializer).get_many([ 'set', 'list' ]) == { 'list' : [ 1, 2 ] }
@@ -0,0 +1,58 @@
+import random
+import pytest
+from greent.closure import ClosureIndex
+
+@pytest.fixture(scope='module')
+def diamond():
+    """
+    A small DAG with multiple inheritance:
+        root <- a <- c <- e
+        root <- b <- c
+        b <- d
+    """
+    return ClosureIndex({
+        'a' : ('root',),
+        'b' : ('root',),
+        'c' : ('a', 'b'),
+        'd' : ('b',),
+        'e' : ('c',)
+    })
+
+# test 1
+def test_is_a(diamond):
+    assert diamond.is_a('e', 'root')
+    assert diamond.is_a('e', 'b')
+    assert diamond.is_a('c', 'c')
+    assert not diamond.is_a('d', 'a')
+    assert not diamond.is_a('root', 'e')
+    assert not diamond.is_a('unknown', 'root')
+
+# test 2
+def test_descendants(diamond):
+    assert sorted(diamond.descendants('b')) == [ 'b', 'c', 'd', 'e' ]
+    assert sorted(diamond.descendants('a')) == [ 'a', 'c', 'e' ]
+    assert diamond.descendants('unknown') == []
+
+# test 3
+def test_ancestors(diamond):
+    assert set(diamond.ancestors('e')) == { 'e', 'c', 'a', 'b', 'root' }
+    assert diamond.ancestors('unknown') == []
+
+# test 4
+def test_random_dag():
+    """ Compare against a naive closure on a random DAG. """
+    rng = random.Random(42)
+    terms = [ f"T:{i}" for i in range(300) ]
+    parents = { t : tuple(rng.sample(terms[:i], min(i, rng.randint(1, 3)))) for i, t in enumerate(terms) if i > 0 }
+    index = ClosureIndex(parents, terms)
+    expected = {}
+    for term in terms:
+        expected[term] = { term }.union(*[ expected[p] for p in parents.get(term, ()) ])
+    for term in terms:
+        assert set(index.ancestors(term)) == expected[term]
+        for candidate in terms:
+            assert index.is_a(term, candidate) == (candidate in expected[term])
+    for candidate in terms:
+        descendants = index.descendants(candidate)
+        assert len(descendants) == len(set(descendants))
+        assert set(descendants) == { t for t in terms if candidate in expected[t] }
@@ -0,0 +1,67 @@
+import json
+import pytest
+import requests
+from greent.util import Curie_Resolver, CURIE_PREFIXES
+
+@pytest.fixture
+def resolver():
+    """
+    Restores the built in prefixes after each test.
+    """
+    yield Curie_Resolver
+    Curie_Resolver.configure(CURIE_PREFIXES)
+
+# test 1
+def test_uri_to_curie(resolver):
+    assert resolver.uri_to_curie('http://purl.obolibrary.org/obo/MONDO_0005737') == 'MONDO:0005737'
+    assert resolver.uri_to_curie('http://example.org/thing') == 'http://example.org/thing'
+
+# test 2
+def test_longest_prefix(resolver):
+    resolver.configure({ 'obo' : 'http://purl.obolibrary.org/obo/', 'MONDO' : 'http://purl.obolibrary.org/obo/MONDO_' })
+    uris = [ 'http://purl.obolibrary.org/obo/MONDO_1', 'http://purl.obolibrary.org/obo/FOO_1',
+             'http://purl.obolibrary.org/obo/MONDO_2', 'http://example.org/1' ]
+    assert resolver.uri_to_curie_many(uris) == [ 'MONDO:1', 'obo:FOO_1', 'MONDO:2', 'http://example.org/1' ]
+    assert resolver.uri_to_curie_many(uris) == [ resolver.uri_to_curie(uri) for uri in uris ]
+
+# test 3
+def test_curie_to_uri(resolver):
+    assert resolver.curie_to_uri('mondo:0005737') == 'http://purl.obolibrary.org/obo/MONDO_0005737'
+    assert resolver.namespace('Mondo') == 'http://purl.obolibrary.org/obo/MONDO_'
+    assert not resolver.has_prefix('NOPE')
+    with pytest.raises(TypeError):
+        resolver.get_curie_to_uri_map()['NOPE'] = 'http://example.org/'
+
+# test 4
+def test_load_context(resolver, tmpdir):
+    path = tmpdir.join('context.jsonld')
+    path.write(json.dumps({ '@context' : {
+        '@vocab' : 'http://example.org/',
+        'NCBITaxon' : 'http://purl.obolibrary.org/obo/NCBITaxon_',
+        'biolink' : { '@id' : 'https://w3id.org/biolink/vocab/', '@prefix' : True },
+        'name' : { '@id' : 'rdfs:label' },
+        'MONDO' : 'http://example.org/MONDO_' } }))
+    resolver.load_context(str(path))
+    assert resolver.uri_to_curie('http://purl.obolibrary.org/obo/NCBITaxon_9606') == 'NCBITaxon:9606'
+    assert resolver.uri_to_curie('https://w3id.org/biolink/vocab/Gene') == 'biolink:Gene'
+    # Built in prefixes win over the context's.
+    assert resolver.namespace('MONDO') == 'http://purl.obolibrary.org/obo/MONDO_'
+    assert not resolver.has_prefix('name')
+
+# test 5
+def test_load_contexts(resolver, tmpdir, monkeypatch):
+    first = tmpdir.join('first.jsonld')
+    first.write(json.dumps({ '@context' : { 'NCBITaxon' : 'http://purl.obolibrary.org/obo/NCBITaxon_' } }))
+    second = tmpdir.join('second.jsonld')
+    second.write(json.dumps({ '@context' : { 'NCBITaxon' : 'http://example.org/taxon/', 'SO' : 'http://purl.obolibrary.org/obo/SO_' } }))
+    def fetch(*args, **kwargs):
+        raise AssertionError("contexts must not be fetched when loaded")
+    monkeypatch.setattr(requests, 'get', fetch)
+    resolver.load_contexts([ str(first), str(tmpdir.join('missing.jsonld')), 'https://example.org/context.jsonld', str(second) ])
+    assert resolver.namespace('NCBITaxon') == 'http://purl.obolibrary.org/obo/NCBITaxon_'
+    assert resolver.namespace('SO') == 'http://purl.obolibrary.org/obo/SO_'
+
+# test 6
+def test_curie_to_uri_many(resolver):
+    assert resolver.curie_to_uri_many([ 'MONDO:0005737', 'hp:0002099', 'NOPE:1', 'MONDO' ]) == [
+        'http://purl.obolibrary.org/obo/MONDO_0005737', 'http://purl.obolibrary.org/obo/HP_0002099', None, None ]
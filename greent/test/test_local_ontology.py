@@ -0,0 +1,138 @@
+import pytest
+from greent.servicecontext import ServiceContext
+from greent.services.local_ontology import LocalOntology, OntologySnapshot
+from greent.textindex import required_literals
+
+OBO = """format-version: 1.2
+ontology: mondo
+
+[Term]
+id: MONDO:0000001
+name: disease or disorder
+def: "A disposition to undergo pathological processes." [OGMS:0000031]
+synonym: "disease" EXACT []
+synonym: "disorder" RELATED []
+
+[Term]
+id: MONDO:0005737
+name: Ebola hemorrhagic fever
+def: "A viral infectious disease caused by \\"Ebola\\" virus." []
+synonym: "Ebola virus disease" EXACT []
+synonym: "EHF" RELATED [MONDO:0000001]
+xref: DOID:4325
+xref: UMLS:C0282687 {source="MONDO:equivalentTo"}
+is_a: MONDO:0005762 ! viral infectious disease
+property_value: skos:exactMatch http://purl.obolibrary.org/obo/DOID_4325
+property_value: skos:closeMatch http://linkedlifedata.com/resource/umls/id/C0282687
+
+[Term]
+id: MONDO:0005762
+name: viral infectious disease
+is_a: MONDO:0000001 ! disease or disorder
+
+[Term]
+id: MONDO:0005763
+name: bacterial infectious disease
+is_a: MONDO:0000001 ! disease or disorder
+"""
+
+@pytest.fixture(scope='module')
+def local_ontology(tmpdir_factory):
+    """
+    Creates a LocalOntology over a small, hand written MONDO snapshot.
+    """
+    path = tmpdir_factory.mktemp("snapshots").join("mondo.obo")
+    path.write(OBO)
+    return LocalOntology(ServiceContext.create_context(),
+                         snapshot=OntologySnapshot([str(path)]))
+
+# test 1
+def test_label(local_ontology):
+    assert local_ontology.label('MONDO:0005737') == "Ebola hemorrhagic fever"
+    assert local_ontology.label('MONDO:9999999') == ''
+
+# test 2
+def test_is_a(local_ontology):
+    assert local_ontology.is_a('MONDO:0005737', 'MONDO:0005762') == (True, ['MONDO:0005762'])
+    assert local_ontology.is_a('MONDO:0005737', 'MONDO:0005763, MONDO:0000001') == (True, ['MONDO:0000001'])
+    assert local_ontology.is_a('MONDO:0005763', 'MONDO:0005762') == (False, [])
+
+# test 3
+def test_ancestors_descendants(local_ontology):
+    assert set(local_ontology.ancestors('MONDO:0005737')) == { 'MONDO:0005737', 'MONDO:0005762', 'MONDO:0000001' }
+    assert set(local_ontology.descendants('MONDO:0000001')) == { 'MONDO:0000001', 'MONDO:0005762',
+                                                                'MONDO:0005763', 'MONDO:0005737' }
+    assert local_ontology.children('MONDO:0005762') == [ 'MONDO:0005737' ]
+    assert local_ontology.siblings('MONDO:0005762') == [ 'MONDO:0005763' ]
+
+# test 4
+def test_xrefs_lookup(local_ontology):
+    assert local_ontology.xrefs('MONDO:0005737') == [ 'DOID:4325', 'UMLS:C0282687' ]
+    result = local_ontology.lookup('UMLS:C0282687')
+    assert result[0]['id'] == 'MONDO:0005737'
+
+# test 5
+def test_synonyms(local_ontology):
+    result = local_ontology.synonyms('MONDO:0005737')
+    assert result == [ { 'desc' : 'Ebola virus disease', 'scope' : 'EXACT' },
+                       { 'desc' : 'EHF', 'scope' : 'RELATED' } ]
+
+# test 6
+def test_search(local_ontology):
+    result = local_ontology.search('ebola', is_regex=True)
+    assert result[0]['id'] == 'MONDO:0005737'
+    assert result[0]['definition'] == 'A viral infectious disease caused by "Ebola" virus.'
+    assert result[0]['defined_by'] == 'http://purl.obolibrary.org/obo/mondo.owl'
+    assert local_ontology.search('ehf')[0]['id'] == 'MONDO:0005737'
+    assert local_ontology.search('ehf', ignore_case=False) == []
+
+# test 7
+def test_matches(local_ontology):
+    assert local_ontology.exactMatch('MONDO:0005737') == [ 'DOID:4325' ]
+    assert local_ontology.closeMatch('MONDO:0005737') == [ 'UMLS:C0282687' ]
+
+# test 8
+def test_id_list(local_ontology):
+    assert len(local_ontology.id_list('MONDO')) == 4
+    assert local_ontology.id_list('A BAD ONTOLOGY') == []
+
+# test 9
+def test_is_a_many(local_ontology):
+    result = local_ontology.is_a_many([ ('MONDO:0005737', ['MONDO:0005762', 'MONDO:0005763']),
+                                        ('MONDO:0005763', 'MONDO:0005762') ])
+    assert result == [ { 'id' : 'MONDO:0005737', 'is_a' : True, 'ancestors' : [ 'MONDO:0005762' ] },
+                       { 'id' : 'MONDO:0005763', 'is_a' : False, 'ancestors' : [] } ]
+
+# test 10
+def test_required_literals():
+    assert required_literals('.*kojic ac(i)d[0-9]+') == [ 'kojic ac', 'd' ]
+    assert required_literals('ebola|marburg') == []
+
+# test 11
+def test_indexed_search(local_ontology):
+    assert [ r['id'] for r in local_ontology.search('INFECTIOUS dis', is_regex=True) ] == \
+        [ 'MONDO:0005737', 'MONDO:0005762', 'MONDO:0005763' ]
+    assert [ r['id'] for r in local_ontology.search('^(viral|bacterial)', is_regex=True) ] == \
+        [ 'MONDO:0005762', 'MONDO:0005763' ]
+    assert local_ontology.search('Ebola', is_regex=True, ignore_case=False)[0]['id'] == 'MONDO:0005737'
+    assert local_ontology.search('ebola', is_regex=True, ignore_case=False) == []
+    assert local_ontology.search('ebola virus disease')[0]['id'] == 'MONDO:0005737'
+    assert local_ontology.search('ebola virus') == []
+
+# test 12
+def test_search_words(local_ontology):
+    assert [ r['id'] for r in local_ontology.search_words('disease infect*') ] == \
+        [ 'MONDO:0005762', 'MONDO:0005763', 'MONDO:0005737' ]
+    assert [ r['id'] for r in local_ontology.search_words('"virus disease"') ] == [ 'MONDO:0005737' ]
+    assert local_ontology.search_words('"disease virus"') == []
+    assert [ r['id'] for r in local_ontology.search_words('hemorrhagic-fev*') ] == [ 'MONDO:0005737' ]
+    assert local_ontology.search_words('disease infect*', limit=1)[0]['id'] == 'MONDO:0005762'
+
+# test 13
+def test_pages(local_ontology):
+    ids = local_ontology.id_list('MONDO')
+    assert local_ontology.id_list('MONDO', 3) + local_ontology.id_list('MONDO', 3, 3) == ids
+    assert local_ontology.descendants('MONDO:0000001', None, 1) == local_ontology.descendants('MONDO:0000001')[1:]
+    properties = local_ontology.all_properties('MONDO:0005737', 2, 1)
+    assert sum(len(p['property_values']) for p in properties) == 2
+    assert properties[0]['property_key'] == 'http://purl.obolibrary.org/obo/IAO_0000115'
@@ -0,0 +1,93 @@
+import os
+import pytest
+from greent.nameindex import NameIndex, normalize, edit_distance
+from greent.services.local_ontology import OntologySnapshot
+
+OBO = """format-version: 1.2
+ontology: mondo
+
+[Term]
+id: MONDO:0004979
+name: asthma
+synonym: "Asthma, bronchial" EXACT []
+synonym: "reactive airway disease" RELATED []
+
+[Term]
+id: MONDO:0004766
+name: status asthmaticus
+
+[Term]
+id: HP:0002099
+name: Asthma
+
+[Term]
+id: MONDO:0005737
+name: Ebola hemorrhagic fever
+synonym: "Ébola virus disease" EXACT []
+"""
+
+@pytest.fixture(scope='module')
+def name_index(tmpdir_factory):
+    """
+    Builds a NameIndex over a small, hand written snapshot.
+    """
+    directory = tmpdir_factory.mktemp("names")
+    path = directory.join("mondo.obo")
+    path.write(OBO)
+    NameIndex.build(str(directory.join("index")), OntologySnapshot([str(path)]))
+    return NameIndex(str(directory.join("index")))
+
+# test 1
+def test_normalize():
+    assert normalize("  Ébola Virus-Disease ") == "ebola virus disease"
+
+# test 2
+def test_exact(name_index):
+    assert [ x['id'] for x in name_index.exact('ASTHMA') ] == [ 'HP:0002099', 'MONDO:0004979' ]
+    assert name_index.exact('asthma', concept='disease') == [ { 'id' : 'MONDO:0004979', 'label' : 'asthma', 'type' : 'disease' } ]
+    assert name_index.exact('ebola virus disease')[0]['label'] == 'Ebola hemorrhagic fever'
+    assert name_index.exact('asth') == []
+
+# test 3
+def test_prefix(name_index):
+    assert [ x['id'] for x in name_index.prefix('asth', concept='disease') ] == [ 'MONDO:0004979' ]
+    assert name_index.prefix('') == []
+
+# test 4
+def test_token(name_index):
+    assert [ x['id'] for x in name_index.token('bronchial asthma') ] == [ 'MONDO:0004979' ]
+    assert [ x['id'] for x in name_index.token('fever hemorr') ] == [ 'MONDO:0005737' ]
+    assert name_index.token('airway fever') == []
+
+# test 5
+def test_search(name_index):
+    assert [ x['id'] for x in name_index.search('asthma', concept='disease') ] == [ 'MONDO:0004979', 'MONDO:0004766' ]
+
+# test 6
+def test_edit_distance():
+    assert edit_distance('asthma', 'astma', 2) == 1
+    assert edit_distance('asthma', 'ashtma', 2) == 2
+    assert edit_distance('asthma', 'fever', 2) == 3
+
+# test 7
+def test_fuzzy(name_index):
+    assert [ x['id'] for x in name_index.fuzzy('astma', concept='disease', max_edits=1) ] == [ 'MONDO:0004979' ]
+    assert [ x['id'] for x in name_index.fuzzy('hemorhagic ebol', max_edits=1) ] == [ 'MONDO:0005737' ]
+    assert name_index.fuzzy('astma', max_edits=0) == []
+    assert name_index.search('astmha', concept='disease') == []
+    assert name_index.search('astmha', concept='disease', max_edits=2)[0]['id'] == 'MONDO:0004979'
+
+# test 8
+def test_rebuild(tmpdir):
+    path = tmpdir.join("mondo.obo")
+    path.write(OBO)
+    index = str(tmpdir.join("index"))
+    NameIndex.build(index, OntologySnapshot([str(path)]))
+    first = NameIndex(index)
+    path.write(OBO.replace("status asthmaticus", "severe asthma"))
+    for _ in range(2):
+        NameIndex.build(index, OntologySnapshot([str(path)]))
+    # An index opened before a rebuild keeps reading its own build, and the build before the current one is kept.
+    assert [ x['label'] for x in first.exact('status asthmaticus') ] == [ 'status asthmaticus' ]
+    assert [ x['label'] for x in NameIndex(index).exact('severe asthma') ] == [ 'severe asthma' ]
+    assert len([ name for name in os.listdir(str(tmpdir)) if name.startswith("index.") ]) == 2
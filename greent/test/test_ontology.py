@@ -838,3 +838,30 @@ def test_hp_all_properties(hp_ontology):
                     assert x in dict_item['property_values']
             if dict_item[key] == 'has_obo_namespace':
                 assert dict_item['property_values'][0] == 'human_phenotype'
+
+
+# test 55
+def test_label_many(ontology):
+    """Validates batched label lookups keyed by the requested curie."""
+    result = ontology.label_many(['MONDO:0005737', 'HP:0000175'])
+    assert result == {
+        'MONDO:0005737' : "Ebola hemorrhagic fever",
+        'HP:0000175' : "Cleft palate"
+    }
+
+
+# test 56
+def test_is_a_multiple_ancestors(ontology):
+    """Validates that is_a reports only the matching ancestors, checked in one query."""
+    is_a, ancestors = ontology.is_a('MONDO:0005737', 'MONDO:0005762, GO:0005575')
+    assert is_a
+    assert ancestors == ['MONDO:0005762']
+
+
+# test 57
+def test_is_a_many(ontology):
+    """Validates the bulk is_a form."""
+    result = ontology.is_a_many([('MONDO:0005737', ['MONDO:0005762']),
+                                 ('HP:0000175', 'MONDO:0005762')])
+    assert result[0]['is_a'] and result[0]['ancestors'] == ['MONDO:0005762']
+    assert not result[1]['is_a']
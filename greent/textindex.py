@@ -0,0 +1,169 @@
+import logging
+import re
+from array import array
+from bisect import bisect_left
+try:
+    import re._parser as sre_parse
+except ImportError:
+    import sre_parse
+from greent.nameindex import normalize
+from greent.util import LoggingUtil
+
+logger = LoggingUtil.init_logging(__name__, level=logging.DEBUG)
+
+QUERY_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+def grams(text):
+    """ The distinct trigrams of normalized text. """
+    return { text[i:i+3] for i in range(len(text) - 2) }
+
+def required_literals(pattern, flags=0):
+    """ Runs of literal characters every match of a regular expression must contain. Only the top level
+    sequence is considered, so a pattern made of alternatives yields none. """
+    literals = []
+    run = []
+    for op, value in sre_parse.parse(pattern, flags):
+        if op == sre_parse.LITERAL:
+            run.append(chr(value))
+            continue
+        literals.append(''.join(run))
+        run = []
+    literals.append(''.join(run))
+    return [ literal for literal in literals if literal ]
+
+class TextIndex:
+    """ An in-memory inverted index over the labels, definitions and exact and related synonyms of the
+    terms of an OntologySnapshot.
+
+    Each term is a document. Words map to the documents containing them, for word, prefix and phrase
+    queries, and trigrams of the normalized text map to documents too, so a regular expression only
+    runs over the documents containing every trigram of the literals it requires. """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.ids = []
+        self.texts = []
+        postings = {}
+        trigrams = {}
+        for identifier, label in snapshot.labels.items():
+            document = len(self.ids)
+            texts = [ label ]
+            if identifier in snapshot.definitions:
+                texts.append(snapshot.definitions[identifier])
+            texts += [ desc for desc, scope, xrefs in snapshot.synonyms.get(identifier, ())
+                       if scope in ('EXACT', 'RELATED') ]
+            self.ids.append(identifier)
+            self.texts.append(tuple(texts))
+            words = set()
+            gram_set = set()
+            for text in texts:
+                text = normalize(text)
+                words.update(text.split())
+                gram_set.update(grams(text))
+            for word in words:
+                postings.setdefault(word, array('I')).append(document)
+            for gram in gram_set:
+                trigrams.setdefault(gram, array('I')).append(document)
+        self.postings = postings
+        self.trigrams = trigrams
+        self.vocabulary = sorted(postings)
+        logger.info(f"indexed the text of {len(self.ids)} terms: {len(postings)} words, {len(trigrams)} trigrams")
+
+    def row(self, document):
+        identifier = self.ids[document]
+        row = { 'id' : identifier, 'label' : self.snapshot.labels[identifier],
+                'defined_by' : self.snapshot.defined_by[identifier] }
+        if identifier in self.snapshot.definitions:
+            row['definition'] = self.snapshot.definitions[identifier]
+        return row
+
+    def intersect(self, lists):
+        """ Documents in every one of lists, in document order. None stands for every document. """
+        lists = sorted((l for l in lists if l is not None), key=len)
+        if not lists:
+            return range(len(self.ids))
+        result = set(lists[0])
+        for documents in lists[1:]:
+            result.intersection_update(documents)
+            if not result:
+                break
+        return sorted(result)
+
+    def prefixed(self, prefix):
+        """ Documents containing a word starting with prefix. """
+        documents = set()
+        for word in self.vocabulary[bisect_left(self.vocabulary, prefix):]:
+            if not word.startswith(prefix):
+                break
+            documents.update(self.postings[word])
+        return documents
+
+    def containing(self, literal):
+        """ Documents whose normalized text may contain literal, or None if it is too short to tell. """
+        literal = normalize(literal)
+        if len(literal) < 3:
+            return None
+        return self.intersect([ self.trigrams.get(gram, ()) for gram in grams(literal) ])
+
+    def search(self, text, is_regex=False, ignore_case=True):
+        """ Terms with a label, definition or synonym equal to text, or matching it as a regular
+        expression if indicated, like GenericOntology.search. """
+        if is_regex:
+            flags = re.IGNORECASE if ignore_case else 0
+            pattern = re.compile(text, flags)
+            matches = lambda value: pattern.search(value) is not None
+            candidates = self.intersect([ self.containing(l) for l in required_literals(text, flags) ])
+        else:
+            target = text.lower() if ignore_case else text
+            matches = lambda value: (value.lower() if ignore_case else value) == target
+            words = normalize(text).split()
+            candidates = self.intersect([ self.postings.get(word, ()) for word in words ] if words else [])
+        return [ self.row(document) for document in candidates
+                 if any(matches(value) for value in self.texts[document]) ]
+
+    def clauses(self, query):
+        """ Parse a query into (kind, text) clauses, kind being word, prefix or phrase. A word that
+        normalizes to several words, like a hyphenated one, is a phrase, ending in a prefix if starred. """
+        clauses = []
+        for phrase, word in QUERY_PATTERN.findall(query):
+            text = normalize(phrase or word)
+            if not text:
+                continue
+            if word.endswith('*'):
+                clauses.append(('prefix', text))
+            else:
+                clauses.append(('phrase' if ' ' in text else 'word', text))
+        return clauses
+
+    def found(self, clause, text):
+        """ Whether normalized text, padded with spaces, satisfies a clause. """
+        kind, value = clause
+        return f" {value}" in text if kind == 'prefix' else f" {value} " in text
+
+    def match(self, query, limit=None):
+        """ Terms containing every clause of query in a label, definition or synonym: a word, a word* to
+        match any word starting with it, or a "quoted phrase" to match consecutive words. Terms whose
+        label satisfies every clause come first. """
+        clauses = self.clauses(query)
+        if not clauses:
+            return []
+        documents = []
+        for kind, value in clauses:
+            words = value.split()
+            if kind == 'prefix':
+                words, last = words[:-1], words[-1]
+                documents.append(self.prefixed(last))
+            documents += [ self.postings.get(word, ()) for word in words ]
+        # Clauses of several words must also appear in order within one text.
+        phrases = [ clause for clause in clauses if ' ' in clause[1] ]
+        labelled = []
+        others = []
+        for document in self.intersect(documents):
+            texts = [ f" {normalize(value)} " for value in self.texts[document] ]
+            if not all(any(self.found(phrase, text) for text in texts) for phrase in phrases):
+                continue
+            if all(self.found(clause, texts[0]) for clause in clauses):
+                labelled.append(document)
+            else:
+                others.append(document)
+        return [ self.row(document) for document in (labelled + others)[:limit] ]
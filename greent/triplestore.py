@@ -1,20 +1,46 @@
 import os
 import traceback
+import requests
+from requests.adapters import HTTPAdapter
 from greent.util import LoggingUtil
 from pprint import pprint
-from SPARQLWrapper import SPARQLWrapper2, JSON, POSTDIRECTLY, POST
 from string import Template
 
 logger = LoggingUtil.init_logging(__name__)
 #import logging
 #logger = LoggingUtil.init_logging(__name__, logging.DEBUG)
 
+SPARQL_HEADERS = {
+    'Accept'          : 'application/sparql-results+json',
+    'Accept-Encoding' : 'gzip, deflate'
+}
+
+# format/output mirror what SPARQLWrapper sent, which some endpoints rely on to pick JSON.
+SPARQL_PARAMS = { 'format' : 'json', 'output' : 'json' }
+
+def bindings_to_rows (response, outputs, flat=False):
+    """ Reduce SPARQL JSON result bindings to the values of the requested output variables. """
+    bindings = response['results']['bindings']
+    if flat:
+        return list(map(lambda b : [ b[val]['value'] for val in outputs if val in b], bindings ))
+    return list(map(lambda b : { val : b[val]['value'] for val in outputs if val in b}, bindings ))
+
 
 class TripleStore(object):
-    """ Connect to a SPARQL endpoint and provide services for loading and executing queries."""
+    """ Connect to a SPARQL endpoint and provide services for loading and executing queries.
+
+    Queries go over a requests session with a bounded pool of keep-alive connections. Nothing about
+    an individual query is stored on the object, so one instance is safe to share between threads. """
 
-    def __init__(self, hostname):
-        self.service =  SPARQLWrapper2 (hostname)
+    def __init__(self, hostname, timeout=60, pool_size=10):
+        self.url = hostname
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = requests.Session ()
+        adapter = HTTPAdapter (pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount ('http://', adapter)
+        self.session.mount ('https://', adapter)
+        self.session.headers.update (SPARQL_HEADERS)
 
     def get_template (self, query_name):
         """ Load a template given a template name """
@@ -28,35 +54,92 @@ class TripleStore(object):
         with open (fn, 'r') as stream:
             query = stream.read ()
         return query
-    
+
     def execute_query (self, query, post=False):
         """ Execute a SPARQL query.
         :param query: A SPARQL query.
-        :return: Returns a JSON formatted object.
+        :param post: Send the query as the body of a POST rather than in the URL.
+        :return: Returns the parsed SPARQL JSON results.
         """
+        params = dict(SPARQL_PARAMS)
         if post:
-            self.service.setRequestMethod(POSTDIRECTLY)
-            self.service.setMethod(POST)
-        self.service.setQuery (query)
-        self.service.setReturnFormat (JSON)
-        return self.service.query().convert ()
-    
+            response = self.session.post (self.url, params=params, data=query.encode ('utf-8'),
+                                          headers={ 'Content-Type' : 'application/sparql-query' },
+                                          timeout=self.timeout)
+        else:
+            params['query'] = query
+            response = self.session.get (self.url, params=params, timeout=self.timeout)
+        response.raise_for_status ()
+        return response.json ()
+
     def query (self, query_text, outputs, flat=False, post = False):
         """ Execute a fully formed query and return results. """
         response = self.execute_query (query_text, post)
-        result = None
-        if flat:
-            result = list(map(lambda b : [ b[val].value for val in outputs if val in b], response.bindings ))
-        else:
-            result = list(map(lambda b : { val : b[val].value for val in outputs if val in b}, response.bindings ))
+        result = bindings_to_rows (response, outputs, flat)
         logger.debug ("query result: %s", result)
         return result
 
     def query_template (self, template_text, outputs, inputs=[], post = False):
         """ Given template text, inputs, and outputs, execute a query. """
         return self.query (Template (template_text).safe_substitute (**inputs), outputs, post= post)
-    
+
     def query_template_file (self, template_file, outputs, inputs=[]):
         """ Given the name of a template file, inputs, and outputs, execute a query. """
         return self.query (self.get_template_text (template_file), inputs, outputs)
-    
+
+
+class AsyncTripleStore(object):
+    """ An asyncio counterpart to TripleStore. One aiohttp session with a bounded connection pool is
+    shared by every coroutine on the event loop, so a single process can keep many queries in flight. """
+
+    def __init__(self, hostname, timeout=60, pool_size=100):
+        # Imported here so only the async server needs aiohttp.
+        import aiohttp
+        self.url = hostname
+        self.timeout = aiohttp.ClientTimeout (total=timeout)
+        self.pool_size = pool_size
+        self.session = None
+
+    def get_session (self):
+        """ Create the session lazily, since it must be bound to the running event loop. """
+        if self.session is None or self.session.closed:
+            import aiohttp
+            self.session = aiohttp.ClientSession (
+                connector=aiohttp.TCPConnector (limit=self.pool_size),
+                timeout=self.timeout,
+                headers=SPARQL_HEADERS)
+        return self.session
+
+    async def close (self):
+        if self.session is not None:
+            await self.session.close ()
+            self.session = None
+
+    async def execute_query (self, query, post=False):
+        """ Execute a SPARQL query.
+        :param query: A SPARQL query.
+        :param post: Send the query as the body of a POST rather than in the URL.
+        :return: Returns the parsed SPARQL JSON results.
+        """
+        session = self.get_session ()
+        params = dict(SPARQL_PARAMS)
+        if post:
+            request = session.post (self.url, params=params, data=query.encode ('utf-8'),
+                                    headers={ 'Content-Type' : 'application/sparql-query' })
+        else:
+            params['query'] = query
+            request = session.get (self.url, params=params)
+        async with request as response:
+            response.raise_for_status ()
+            return await response.json (content_type=None)
+
+    async def query (self, query_text, outputs, flat=False, post = False):
+        """ Execute a fully formed query and return results. """
+        response = await self.execute_query (query_text, post)
+        result = bindings_to_rows (response, outputs, flat)
+        logger.debug ("query result: %s", result)
+        return result
+
+    async def query_template (self, template_text, outputs, inputs=[], post = False):
+        """ Given template text, inputs, and outputs, execute a query. """
+        return await self.query (Template (template_text).safe_substitute (**inputs), outputs, post= post)
@@ -1,7 +1,8 @@
+import argparse
 import logging
 #import inspect
 import json
-#import requests
+import requests
 import traceback
 import unittest
 import datetime
@@ -12,6 +13,7 @@ from collections import namedtuple
 #from bravado.requests_client import RequestsClient
 import copy
 import re
+from types import MappingProxyType
 
 #loggers = {}
 class LoggingUtil(object):
@@ -124,53 +126,184 @@ class Resource:
                 else:
                     target.append( src_elements[name] )
 
+CURIE_PREFIXES = {
+    'BFO': 'http://purl.obolibrary.org/obo/BFO_',
+    'CARO': 'http://purl.obolibrary.org/obo/CARO_',
+    'CHEBI' : 'http://purl.obolibrary.org/obo/CHEBI_',
+    'CL': 'http://purl.obolibrary.org/obo/CL_',
+    'COHD' : 'http://purl.obolibrary.org/obo/COHD_',
+    'DOID' : 'http://purl.obolibrary.org/obo/DOID_',
+    'EFO': 'http://www.ebi.ac.uk/efo/EFO_',
+    'GARD': 'http://purl.obolibrary.org/obo/GARD_',
+    'GO': 'http://purl.obolibrary.org/obo/GO_',
+    'HGNC': 'http://identifiers.org/hgnc/',
+    'HP': 'http://purl.obolibrary.org/obo/HP_',
+    'ICD9': 'http://purl.obolibrary.org/obo/ICD9_',
+    'ICD10': 'http://purl.obolibrary.org/obo/ICD10_',
+    'MEDDRA': 'http://identifiers.org/meddra:',
+    'MESH': 'http://purl.obolibrary.org/obo/MESH_',
+    'MONDO': 'http://purl.obolibrary.org/obo/MONDO_',
+    'NCIT' : 'http://purl.obolibrary.org/obo/NCIT_',
+    'OMIM': 'http://purl.obolibrary.org/obo/OMIM_',
+    'OMIMPS': 'http://purl.obolibrary.org/obo/OMIMPS_',
+    'ONCOTREE': 'http://purl.obolibrary.org/obo/ONCOTREE_',
+    'ORPHANET': 'http://www.orpha.net/ORDO/Orphanet_',
+    'PATO': 'http://purl.obolibrary.org/obo/PATO_',
+    'PR': 'http://purl.obolibrary.org/obo/PR_',
+    'SCTID': 'http://purl.obolibrary.org/obo/SCTID_',
+    'SNOMEDCT': 'http://identifiers.org/snomedct/',
+    'UBERON': 'http://purl.obolibrary.org/obo/UBERON_',
+    'UMLS': 'http://linkedlifedata.com/resource/umls/id/'
+}
+
 class Curie_Resolver:
-    @staticmethod 
+    """ Converts between CURIEs and IRIs using one shared, read-only prefix map, built once.
+
+    IRIs are contracted by longest-prefix lookup: the namespaces are hashed, and for each distinct
+    namespace length, longest first, the IRI's leading characters of that length are looked up. The
+    cost depends on how many lengths there are, not how many prefixes, so large maps loaded from a
+    JSON-LD context stay cheap. """
+
+    prefixes = None
+    upper = None
+    namespaces = None
+    nested = frozenset()
+    lengths = ()
+    contexts = ()
+
+    @classmethod
+    def configure(cls, prefixes):
+        """ Replace the prefix map. Where prefixes share a namespace, IRIs contract to the first. """
+        namespaces = {}
+        for prefix, namespace in prefixes.items():
+            namespaces.setdefault(namespace, prefix)
+        cls.prefixes = MappingProxyType(dict(prefixes))
+        cls.upper = MappingProxyType({ prefix.upper() : namespace for prefix, namespace in reversed(list(prefixes.items())) })
+        cls.namespaces = MappingProxyType(namespaces)
+        # Namespaces that begin a longer one. Every namespace beginning with N sorts directly after N.
+        ordered = sorted(namespaces)
+        cls.nested = frozenset(a for a, b in zip(ordered, ordered[1:]) if b.startswith(a))
+        cls.lengths = tuple(sorted({ len(namespace) for namespace in namespaces }, reverse=True))
+        cls.contexts = ()
+
+    @classmethod
+    def load_context(cls, source):
+        """ Add the prefixes of a JSON-LD context file to the built-in ones. """
+        cls.load_contexts([ source ])
+
+    @classmethod
+    def load_contexts(cls, sources):
+        """ Add the prefixes of JSON-LD context files, such as copies of biolink-model's or prefixcommons'
+        made with fetch_context, to the built-in ones. Where several define a prefix the built-in one wins,
+        then the earliest context's. Nothing is fetched: a context that isn't a readable file is skipped
+        with a warning. Loading the contexts already in use does nothing. """
+        sources = tuple(source for source in sources if source)
+        if sources == cls.contexts:
+            return
+        prefixes = dict(CURIE_PREFIXES)
+        for source in sources:
+            try:
+                with open(source, 'r') as stream:
+                    document = json.load(stream)
+                context = Curie_Resolver.context_prefixes(document)
+            except Exception as error:
+                logging.getLogger(__name__).warning(f"skipping CURIE prefixes of {source}: {error}")
+                continue
+            for prefix, namespace in context.items():
+                prefixes.setdefault(prefix, namespace)
+        cls.configure(prefixes)
+        cls.contexts = sources
+
+    @staticmethod
+    def fetch_context(url, path):
+        """ Save a copy of the JSON-LD context at url, preferably a tagged release, to path for load_contexts. """
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        document = response.json()
+        with open(path, 'w') as stream:
+            json.dump(document, stream, indent=2)
+        return len(Curie_Resolver.context_prefixes(document))
+
+    @staticmethod
+    def context_prefixes(document):
+        """ The prefix to namespace IRI entries of a JSON-LD context document, skipping keywords and terms. """
+        context = document.get('@context', document)
+        prefixes = {}
+        for prefix, value in context.items():
+            if isinstance(value, dict):
+                value = value.get('@id') if value.get('@prefix') else None
+            if not prefix.startswith('@') and isinstance(value, str) and '://' in value:
+                prefixes[prefix] = value
+        return prefixes
+
+    @staticmethod
     def get_curie_to_uri_map():
-        return {
-            'BFO': 'http://purl.obolibrary.org/obo/BFO_',
-            'CARO': 'http://purl.obolibrary.org/obo/CARO_',
-            'CHEBI' : 'http://purl.obolibrary.org/obo/CHEBI_',
-            'CL': 'http://purl.obolibrary.org/obo/CL_',
-            'COHD' : 'http://purl.obolibrary.org/obo/COHD_',
-            'DOID' : 'http://purl.obolibrary.org/obo/DOID_',
-            'EFO': 'http://www.ebi.ac.uk/efo/EFO_',
-            'GARD': 'http://purl.obolibrary.org/obo/GARD_',
-            'GO': 'http://purl.obolibrary.org/obo/GO_',
-            'HGNC': 'http://identifiers.org/hgnc/',
-            'HP': 'http://purl.obolibrary.org/obo/HP_',
-            'ICD9': 'http://purl.obolibrary.org/obo/ICD9_',
-            'ICD10': 'http://purl.obolibrary.org/obo/ICD10_',
-            'MEDDRA': 'http://identifiers.org/meddra:',
-            'MESH': 'http://purl.obolibrary.org/obo/MESH_',
-            'MONDO': 'http://purl.obolibrary.org/obo/MONDO_',
-            'NCIT' : 'http://purl.obolibrary.org/obo/NCIT_',
-            'OMIM': 'http://purl.obolibrary.org/obo/OMIM_',
-            'OMIMPS': 'http://purl.obolibrary.org/obo/OMIMPS_',
-            'ONCOTREE': 'http://purl.obolibrary.org/obo/ONCOTREE_',
-            'ORPHANET': 'http://www.orpha.net/ORDO/Orphanet_',
-            'PATO': 'http://purl.obolibrary.org/obo/PATO_',
-            'PR': 'http://purl.obolibrary.org/obo/PR_',
-            'SCTID': 'http://purl.obolibrary.org/obo/SCTID_',
-            'SNOMEDCT': 'http://identifiers.org/snomedct/',
-            'UBERON': 'http://purl.obolibrary.org/obo/UBERON_',
-            'UMLS': 'http://linkedlifedata.com/resource/umls/id/'
-        }
+        return Curie_Resolver.prefixes
 
     @staticmethod
-    def uri_to_curie(uri):
+    def namespace(prefix):
+        """ The namespace IRI of prefix, in any case, or None if it is unknown. """
+        return Curie_Resolver.prefixes.get(prefix) or Curie_Resolver.upper.get(prefix.upper())
+
+    @staticmethod
+    def has_prefix(prefix):
+        """ Whether prefix, in any case, is known. """
+        return prefix.upper() in Curie_Resolver.upper
+
+    @classmethod
+    def uri_to_curie(cls, uri):
         """
         Try to find if we can get url in the list else return original uri unchanged
         """
-        map = Curie_Resolver.get_curie_to_uri_map()
-        for curie in map:
-            uri_part = map[curie]
-            if uri.startswith(uri_part):
-                uri = uri.replace(uri_part, f'{curie}:')
-                break
+        namespaces = cls.namespaces
+        for length in cls.lengths:
+            prefix = namespaces.get(uri[:length])
+            if prefix is not None:
+                return f'{prefix}:{uri[length:]}'
         return uri
 
-    @staticmethod
-    def curie_to_uri(curie):        
+    @classmethod
+    def uri_to_curie_many(cls, uris):
+        """ Contract many IRIs. The namespace length that matched last is tried first, since IRIs in one
+        result mostly share a namespace; a hit there is final unless that namespace begins a longer one. """
+        namespaces = cls.namespaces
+        nested = cls.nested
+        lengths = cls.lengths
+        last = lengths[0] if lengths else 0
+        curies = []
+        for uri in uris:
+            prefix = namespaces.get(uri[:last])
+            if prefix is None or uri[:last] in nested:
+                for last in lengths:
+                    prefix = namespaces.get(uri[:last])
+                    if prefix is not None:
+                        break
+            curies.append(uri if prefix is None else f'{prefix}:{uri[last:]}')
+        return curies
+
+    @classmethod
+    def curie_to_uri(cls, curie):
         curie_prefix = curie.split(':')[0]
-        return curie.replace(f'{curie_prefix}:', Curie_Resolver.get_curie_to_uri_map().get(curie_prefix,'Unkown Prefix'))
+        namespace = cls.prefixes.get(curie_prefix) or cls.upper.get(curie_prefix.upper(), 'Unkown Prefix')
+        return curie.replace(f'{curie_prefix}:', namespace, 1)
+
+    @classmethod
+    def curie_to_uri_many(cls, curies):
+        """ Expand many CURIEs, their prefixes in any case. Those with an unknown prefix expand to None. """
+        prefixes = cls.prefixes
+        upper = cls.upper
+        uris = []
+        for curie in curies:
+            prefix, colon, local_id = curie.partition(':')
+            namespace = (prefixes.get(prefix) or upper.get(prefix.upper())) if colon else None
+            uris.append(None if namespace is None else namespace + local_id)
+        return uris
+
+Curie_Resolver.configure(CURIE_PREFIXES)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Save a JSON-LD context for curies.contexts in greent.conf.')
+    parser.add_argument('url', help='URL of the context, preferably at a tagged release.')
+    parser.add_argument('path', help='File to save it to.')
+    args = parser.parse_args ()
+    print (f"saved {Curie_Resolver.fetch_context(args.url, args.path)} prefixes to {args.path}")